@@ -93,6 +93,8 @@ enum {
 // Homing configuration
 #define FREQ_WINDOW_SIZE 16
 #define WMA_D_WINDOW_SIZE 4
+// sum of the wma weights, 1..FREQ_WINDOW_SIZE
+#define WMA_WEIGHT_SUM ((FREQ_WINDOW_SIZE * (FREQ_WINDOW_SIZE + 1)) / 2)
 
 #define MAX_SOS_SECTIONS 4
 
@@ -123,6 +125,14 @@ struct ldc1612_ng_homing_wma_tap {
     uint32_t wma; // last computed weighted moving average
     int32_t wma_d_avg; // last computed wma derivative average
 
+    // running sums for updating the above without going over the buffers:
+    // the sum of freq_buffer, the remainder of the weighted sum of freq_buffer
+    // divided by WMA_WEIGHT_SUM (wma is the quotient), and the sum of
+    // wma_d_buf (kept unsigned so that it wraps)
+    uint32_t freq_sum;
+    uint32_t wma_rem;
+    uint32_t wma_d_sum;
+
     // the wema_d_avg at the start
     int32_t tap_start_value;
 };
@@ -206,6 +216,7 @@ void command_config_ldc1612_ng(uint32_t *args);
 
 static void read_reg(struct ldc1612_ng* ld, uint8_t reg, uint8_t* res);
 static uint16_t read_reg_status(struct ldc1612_ng* ld);
+static uint32_t read_data(struct ldc1612_ng* ld, uint8_t* res);
 
 static uint_fast8_t ldc1612_ng_timer_event(struct timer* timer);
 
@@ -278,6 +289,24 @@ read_reg_status(struct ldc1612_ng *ld)
     return ld->last_status;
 }
 
+// Read the coil0 frequency into res (BYTES_PER_SAMPLE bytes), and return it.
+// DATA0_MSB and DATA0_LSB are adjacent and the chip auto-increments the
+// register address, so this is a single burst read instead of one transaction
+// per register. It also means the two halves always come from the same
+// conversion.
+uint32_t
+read_data(struct ldc1612_ng *ld, uint8_t *res)
+{
+    uint8_t reg = REG_DATA0_MSB;
+    int ret = i2c_dev_read(ld->i2c, sizeof(reg), &reg, BYTES_PER_SAMPLE, res);
+    i2c_shutdown_on_err(ret);
+
+    return   ((uint32_t)res[0] << 24)
+           | ((uint32_t)res[1] << 16)
+           | ((uint32_t)res[2] << 8)
+           | ((uint32_t)res[3]);
+}
+
 // Notify trsync of event
 static void
 notify_trigger(struct ldc1612_ng *ld, uint32_t time, uint8_t reason)
@@ -393,22 +422,19 @@ command_query_ldc1612_ng_latched_status(uint32_t *args)
     // value directly
     if (ld->rest_ticks == 0) {
         status = read_reg_status(ld);
-        uint8_t d[4];
-        read_reg(ld, REG_DATA0_MSB, &d[0]);
-        read_reg(ld, REG_DATA0_LSB, &d[2]);
-
-        lastval =   ((uint32_t)d[0] << 24)
-                  | ((uint32_t)d[1] << 16)
-                  | ((uint32_t)d[2] << 8)
-                  | ((uint32_t)d[3]);
+        uint8_t d[BYTES_PER_SAMPLE];
+        lastval = read_data(ld, d);
     }
 
     sendf("ldc1612_ng_latched_status oid=%c status=%u lastval=%u"
           , args[0], status, lastval);
 }
 DECL_COMMAND(command_query_ldc1612_ng_latched_status,
-             "query_ldc1612_ng_latched_status_v2 oid=%c");
-// ^ this command name is also used as an API version of sorts
+             "query_ldc1612_ng_latched_status_v3 oid=%c");
+// ^ this command name is also used as an API version of sorts. Bump it
+// (along with LATCHED_STATUS_CMD in ldc1612_ng.py) whenever anything the host
+// models changes, such as the tap filters; v3 is the transposed direct form II
+// sosfilter.
 
 void
 command_ldc1612_ng_start_stop(uint32_t *args)
@@ -590,17 +616,13 @@ ldc1612_ng_update(struct ldc1612_ng *ld, uint8_t oid)
 
     uint32_t time = timer_read_time();
 
-    // Read coil0 frequency
+    // Read coil0 frequency. The status register isn't next to the data
+    // registers, so it still needs its own read above; it's needed anyway
+    // for UNREADCONV and the amplitude error bits.
     uint8_t *d = &ld->sb.data[ld->sb.data_count];
-    read_reg(ld, REG_DATA0_MSB, &d[0]);
-    read_reg(ld, REG_DATA0_LSB, &d[2]);
+    uint32_t data = read_data(ld, d);
     ld->sb.data_count += BYTES_PER_SAMPLE;
 
-    uint32_t data =   ((uint32_t)d[0] << 24)
-                    | ((uint32_t)d[1] << 16)
-                    | ((uint32_t)d[2] << 8)
-                    | ((uint32_t)d[3]);
-
     ld->last_read_value = data;
 
     switch (ld->homing.mode) {
@@ -614,48 +636,19 @@ ldc1612_ng_update(struct ldc1612_ng *ld, uint8_t oid)
         sensor_bulk_report(&ld->sb, oid);
 }
 
-static inline uint32_t
-windowed_moving_average_u32(uint32_t* buf, uint8_t buf_size, uint8_t start_i)
-{
-    // TODO: We can avoid 64-bit integers here by just offseting
-    // the input numbers to ensure that we can always add buf_size values
-    // without overflow into an uint32_t. For frequencies, it should be safe
-    // to subtract the safe_start_freq and just deal with offsets above that,
-    // because ultimately we only care about the derivative.
-    // But this 64-bit math is here for now to keep the logic simple
-    // during development.
-    uint64_t wma_sum = 0;
-    for (uint8_t i = 0; i < buf_size; i++) {
-        uint8_t j = (start_i + i) % buf_size;
-        wma_sum += buf[j] * (i+1);
-    }
-
-    uint32_t freq_weight_sum = (buf_size * (buf_size + 1)) / 2;
-
-    return (uint32_t)(wma_sum / freq_weight_sum);
-}
-
-static inline int32_t
-simple_average_i32(int32_t* buf, uint8_t buf_size)
-{
-    // This assumes that the sum can fit in an i32.
-    int32_t sum = 0;
-    for (uint8_t i = 0; i < buf_size; i++) {
-        sum += buf[i];
-    }
-
-    return sum / buf_size;
-}
-
 static float
 sosfilter(float value, struct sosfilter_sos* filter, float* state)
 {
     const uint8_t num_sections = filter->num_sections;
     const float* sos = filter->sos;
 
+    // Transposed direct form II. With plain direct form II, the state is the
+    // input run through the poles alone, which at higher sample rates (poles
+    // close to 1) grows to thousands of times the input and loses most of
+    // the float precision; here it stays on the order of the signal.
     for (int k = 0; k < num_sections; k++) {
-        float w1 = state[2*k];
-        float w2 = state[2*k+1];
+        float s1 = state[2*k];
+        float s2 = state[2*k+1];
         float b0 = *sos++; //sos[6*k];
         float b1 = *sos++; //sos[6*k+1];
         float b2 = *sos++; //sos[6*k+2];
@@ -663,11 +656,11 @@ sosfilter(float value, struct sosfilter_sos* filter, float* state)
         float a1 = *sos++; //sos[6*k+4];
         float a2 = *sos++; //sos[6*k+5];
 
-        float w0 = value - a1 * w1 - a2 * w2;
-        value = b0 * w0 + b1 * w1 + b2 * w2;
+        float y = b0 * value + s1;
+        state[2*k] = b1 * value - a1 * y + s2;
+        state[2*k+1] = b2 * value - a2 * y;
 
-        state[2*k] = w0;
-        state[2*k+1] = w1;
+        value = y;
     }
 
     return value;
@@ -808,26 +801,49 @@ check_wma_tap(struct ldc1612_ng* ld, uint32_t data, uint32_t time)
     // Tap detection is done by looking at the derivative of this value only.
     //
 
-    // TODO: the below can absolutely be made more efficient, but I'm
-    // keeping it simple while things are dialed in.
-
     // Helpers to clean up the adds/mods/etc. to make the below more readable
     #define NEXT_FREQ_I(i) (((i) + 1) % FREQ_WINDOW_SIZE)
     #define NEXT_WMA_D_I(i) (((i) + 1) % WMA_D_WINDOW_SIZE)
 
+    // The WMA weights samples from 1 (oldest) to FREQ_WINDOW_SIZE (newest).
+    // Adding a sample adds FREQ_WINDOW_SIZE * data to the weighted sum, and
+    // takes away the plain sum of the window before the update (every sample
+    // loses one weight, and the oldest one drops out).
+    //
+    // The weighted sum doesn't fit in 32 bits, but only its quotient by
+    // WMA_WEIGHT_SUM is needed, so it's kept as that quotient (the wma) and
+    // the remainder. Splitting data and freq_sum the same way keeps every
+    // intermediate value small; the result is exactly what summing the
+    // whole window with 64-bit math gives. freq_sum itself fits because
+    // samples without error bits are < 2^28.
+    uint32_t oldest = wma_tap->freq_buffer[wma_tap->freq_i];
     wma_tap->freq_buffer[wma_tap->freq_i] = data;
     wma_tap->freq_i = NEXT_FREQ_I(wma_tap->freq_i);
 
-    uint32_t wma = windowed_moving_average_u32(wma_tap->freq_buffer, FREQ_WINDOW_SIZE, wma_tap->freq_i);
+    uint32_t sum_q = wma_tap->freq_sum / WMA_WEIGHT_SUM;
+    int32_t sum_r = wma_tap->freq_sum % WMA_WEIGHT_SUM;
+    uint32_t data_q = data / WMA_WEIGHT_SUM;
+    int32_t data_r = data % WMA_WEIGHT_SUM;
+
+    // rem is in (-WMA_WEIGHT_SUM, (FREQ_WINDOW_SIZE + 1) * WMA_WEIGHT_SUM);
+    // carry is floor(rem / WMA_WEIGHT_SUM)
+    int32_t rem = (int32_t)wma_tap->wma_rem + FREQ_WINDOW_SIZE * data_r - sum_r;
+    int32_t carry = (rem + WMA_WEIGHT_SUM) / WMA_WEIGHT_SUM - 1;
+
+    uint32_t wma = wma_tap->wma + FREQ_WINDOW_SIZE * data_q - sum_q + carry;
+    wma_tap->wma_rem = rem - carry * WMA_WEIGHT_SUM;
+    wma_tap->freq_sum += data - oldest;
+
     int32_t wma_d = wma - wma_tap->wma;
 
     // A simple average of wma_d to smooth it out a bit. Without this,
     // we'll see some small spikes which will reset the accumulator;
     // I think this is due to the drip move.
+    wma_tap->wma_d_sum += (uint32_t)wma_d - (uint32_t)wma_tap->wma_d_buf[wma_tap->wma_d_i];
     wma_tap->wma_d_buf[wma_tap->wma_d_i] = wma_d;
     wma_tap->wma_d_i = NEXT_WMA_D_I(wma_tap->wma_d_i);
 
-    int32_t wma_d_avg = simple_average_i32(wma_tap->wma_d_buf, WMA_D_WINDOW_SIZE);
+    int32_t wma_d_avg = (int32_t)wma_tap->wma_d_sum / WMA_D_WINDOW_SIZE;
     int32_t last_wma_d_avg = wma_tap->wma_d_avg;
 
     wma_tap->wma = wma;
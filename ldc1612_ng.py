@@ -8,7 +8,9 @@ import math
 import logging
 import struct
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+import numpy as np
 
 try:
     from klippy.extras import bus, bulk_sensor
@@ -24,6 +26,35 @@ except ImportError:
 MIN_MSG_TIME = 0.100
 
 BATCH_UPDATES = 0.100
+# At high data rates, batch more often than BATCH_UPDATES so that a batch is
+# at most about this many samples; clients see data sooner, and each batch
+# stays cheap to process in the reactor
+BATCH_MAX_SAMPLES = 200
+
+# Any data rate up to MAX_LOW_DATA_RATE can be used. Faster than that, only
+# HIGH_DATA_RATES are supported (these are the rates that have built in tap
+# filter coefficients), and only if the bus and mcu can keep up.
+MAX_LOW_DATA_RATE = 500
+HIGH_DATA_RATES = (1000, 1500, 2000, 3000, 4000)
+
+I2C_DEFAULT_SPEED = 400000
+# i2c bits on the wire for each sample: a 2 byte STATUS read and a 4 byte DATA0
+# burst read. Each is an address and register write, a repeated start, then
+# the address and the data; 9 bits per byte with the ack, plus about a bit
+# each for start, repeated start and stop.
+I2C_BITS_PER_SAMPLE = (9 * (3 + 2) + 3) + (9 * (3 + 4) + 3)
+# mcu clocks for each sample outside of the bus transfers: waking the task,
+# buffering the sample, and the tap filter (soft float on mcus without an fpu)
+MCU_CLOCKS_PER_SAMPLE = 3000
+# How much of each sample period reading and processing a sample may take.
+# The rest is headroom for bulk status queries, register writes and anything
+# else on the bus or the mcu.
+MAX_SAMPLE_LOAD = 0.7
+
+# The firmware's latched status command; its name is the version of the
+# firmware side, so a host and firmware that don't match (e.g. in how the
+# firmware's tap filters work) are rejected at connect time
+LATCHED_STATUS_CMD = "query_ldc1612_ng_latched_status_v3 oid=%c"
 
 LDC1612_ADDR = 0x2A
 
@@ -131,11 +162,16 @@ class LDC1612_ng:
         self._drive_current = drive_current
 
         self._deglitch: str = config.get("ldc_deglitch", "default").lower()
-        self._data_rate: int = config.getint("samples_per_second", 250, minval=50)
+        self._data_rate: int = config.getint("samples_per_second", 250, minval=50, maxval=max(HIGH_DATA_RATES))
+        if self._data_rate > MAX_LOW_DATA_RATE and self._data_rate not in HIGH_DATA_RATES:
+            raise config.error(
+                f"samples_per_second above {MAX_LOW_DATA_RATE} must be one of {', '.join(str(r) for r in HIGH_DATA_RATES)}"
+            )
         self._ldc_settle_time = min(self._ldc_settle_time, 1.0 / self._data_rate)
 
         # Setup mcu sensor_ldc1612 bulk query code
-        self._i2c = bus.MCU_I2C_from_config(config, default_addr=LDC1612_ADDR, default_speed=400000)
+        self._i2c_speed: int = config.getint("i2c_speed", I2C_DEFAULT_SPEED, minval=100000)
+        self._i2c = bus.MCU_I2C_from_config(config, default_addr=LDC1612_ADDR, default_speed=I2C_DEFAULT_SPEED)
         self._mcu = mcu = self._i2c.get_mcu()
         self._oid = oid = mcu.create_oid()
 
@@ -172,18 +208,27 @@ class LDC1612_ng:
         self._chip_initialized = False
 
         # Bulk sample message reading
-        chip_smooth = self._data_rate * BATCH_UPDATES * 2
+        self._batch_interval = min(BATCH_UPDATES, BATCH_MAX_SAMPLES / self._data_rate)
+        chip_smooth = self._data_rate * self._batch_interval * 2
         self._ffreader = bulk_sensor.FixedFreqReader(mcu, chip_smooth, ">I")
+        # Decode the raw bulk messages directly into arrays when the reader
+        # exposes what we need; otherwise go through pull_samples()
+        self._np_decode = all(
+            hasattr(self._ffreader, attr) for attr in ("bulk_queue", "clock_sync", "last_sequence", "samples_per_block", "_update_clock")
+        ) and hasattr(self._ffreader.clock_sync, "set_last_chip_clock")
         # Process messages in batches
         self._batch_bulk = bulk_sensor.BatchBulkHelper(
             self.printer,
             self._process_batch,
             self._start_measurements,
             self._finish_measurements,
-            BATCH_UPDATES,
+            self._batch_interval,
         )
+        # Batches carry numpy arrays, so API clients get a converted copy
         hdr = ("time", "frequency", "z")
-        self._batch_bulk.add_mux_endpoint("ldc1612_ng/dump_ldc1612", "sensor", self._name, {"header": hdr})
+        self._webhooks_start_resp = {"header": hdr}
+        webhooks = self.printer.lookup_object("webhooks")
+        webhooks.register_mux_endpoint("ldc1612_ng/dump_ldc1612", "sensor", self._name, self._add_api_client)
 
         gcode = self.printer.lookup_object("gcode")
         gcode.register_mux_command(
@@ -238,15 +283,42 @@ class LDC1612_ng:
             "then restart."
         )
 
+    # The fraction of each sample period that the mcu spends reading and
+    # processing a sample, at the configured data rate and i2c speed
+    def sample_load(self) -> float:
+        mcu_freq = self._mcu.seconds_to_clock(1.0)
+        sample_time = I2C_BITS_PER_SAMPLE / self._i2c_speed + MCU_CLOCKS_PER_SAMPLE / mcu_freq
+        return sample_time * self._data_rate
+
+    def _check_sample_load(self):
+        load = self.sample_load()
+        if load > MAX_SAMPLE_LOAD:
+            max_rate = int(self._data_rate * MAX_SAMPLE_LOAD / load)
+            raise self.printer.config_error(
+                f"LDC1612 {self._name}: samples_per_second {self._data_rate} needs {load * 100.0:.0f}% of the"
+                f" i2c bus and mcu at i2c_speed {self._i2c_speed} (at most {MAX_SAMPLE_LOAD * 100.0:.0f}%);"
+                f" about {max_rate} is the most that this setup can sustain"
+            )
+        logging.info(f"LDC1612ng {self._name}: {self._data_rate} sps, sample load {load * 100.0:.0f}%")
+
     def _build_config(self):
+        # needs the mcu clock frequency, so can't be done any earlier
+        self._check_sample_load()
+
         cmdqueue = self._i2c.get_command_queue()
 
         self._ldc1612_ng_start_stop_cmd = self._mcu.lookup_command("ldc1612_ng_start_stop oid=%c rest_ticks=%u", cq=cmdqueue)
 
         self._ffreader.setup_query_command("ldc1612_ng_query_bulk_status oid=%c", oid=self._oid, cq=cmdqueue)
 
+        if self._mcu.try_lookup_command(LATCHED_STATUS_CMD) is None:
+            raise self.printer.config_error(
+                f"LDC1612 {self._name}: the firmware on mcu '{self._mcu.get_name()}' doesn't match this version of"
+                " eddy-ng; rebuild and flash it"
+            )
+
         self._ldc1612_ng_latched_status_cmd = self._mcu.lookup_query_command(
-            "query_ldc1612_ng_latched_status_v2 oid=%c",
+            LATCHED_STATUS_CMD,
             "ldc1612_ng_latched_status oid=%c status=%u lastval=%u",
             oid=self._oid,
             cq=cmdqueue,
@@ -297,9 +369,29 @@ class LDC1612_ng:
     def set_reg(self, reg, val, minclock=0):
         self._i2c.i2c_write([reg, (val >> 8) & 0xFF, val & 0xFF], minclock=minclock)
 
+    # Batch clients are called with a dict of:
+    #   times, freqvals: float64 and uint32 arrays of the valid samples
+    #   error_times, error_values: times and raw values of the samples that had error bits set
+    #   errors: number of error samples; error_counts: {error kind (high nibble): count}
+    #   overflows
     def add_bulk_sensor_data_client(self, cb):
         self._batch_bulk.add_client(cb)
 
+    def _add_api_client(self, web_request):
+        whbatch = bulk_sensor.BatchWebhooksClient(web_request)
+
+        def handle_batch(msg):
+            return whbatch.handle_batch(
+                {
+                    "data": list(zip(msg["times"].tolist(), msg["freqvals"].tolist())),
+                    "errors": msg["errors"],
+                    "overflows": msg["overflows"],
+                }
+            )
+
+        self.add_bulk_sensor_data_client(handle_batch)
+        web_request.send(self._webhooks_start_resp)
+
     def latched_status(self):
         response = self._ldc1612_ng_latched_status_cmd.send([self._oid])
         return response["status"]
@@ -511,7 +603,10 @@ class LDC1612_ng:
     def get_drive_current(self) -> int:
         return self._drive_current
 
-    def set_drive_current(self, cval: int, maxfreq: float = None):
+    # minclock can be given to have the change happen no earlier than that
+    # mcu clock, e.g. to switch drive currents mid-move
+    # log=False is for callers that switch often (and log it themselves)
+    def set_drive_current(self, cval: int, maxfreq: float = None, minclock: int = 0, log: bool = True):
         if cval < 0 or cval > 31:
             raise self.printer.command_error("Drive current must be between 0 and 31")
         if self._drive_current == cval:
@@ -527,9 +622,10 @@ class LDC1612_ng:
             else:
                 self.set_deglitch(DEGLITCH_33MHZ)
 
-        logging.info(f"LDC1612ng {self._name} set drive current {cval}")
+        if log:
+            logging.info(f"LDC1612ng {self._name} set drive current {cval}")
         self._drive_current = cval
-        self.set_reg(REG_DRIVE_CURRENT0, cval << 11)
+        self.set_reg(REG_DRIVE_CURRENT0, cval << 11, minclock=minclock)
 
     # Start, stop, and process message batches
     def _start_measurements(self):
@@ -559,28 +655,79 @@ class LDC1612_ng:
         self._ffreader.note_end()
         # logging.info("LDC1612 finished '%s' measurements", self._name)
 
+    # Same as FixedFreqReader.pull_samples(), but returning (times, freqvals) arrays
+    # built from the raw message bytes instead of a list of tuples
+    def _pull_samples(self) -> Tuple[np.ndarray, np.ndarray]:
+        reader = self._ffreader
+        if not self._np_decode:
+            samples = reader.pull_samples()
+            if not samples:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.uint32)
+            times, freqvals = zip(*samples)
+            return np.array(times, dtype=np.float64), np.array(freqvals, dtype=np.uint32)
+
+        reader._update_clock()
+        raw_samples = reader.bulk_queue.pull_queue()
+        if not raw_samples:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.uint32)
+
+        time_base, chip_base, inv_freq = reader.clock_sync.get_time_translation()
+        samples_per_block = reader.samples_per_block
+
+        # the sequence is a 16-bit counter on the wire, relative to the last one
+        # _update_clock() saw
+        last_sequence = reader.last_sequence
+        block_starts = []
+        block_counts = []
+        for params in raw_samples:
+            seq_diff = (params["sequence"] - last_sequence) & 0xFFFF
+            seq_diff -= (seq_diff & 0x8000) << 1
+            seq = last_sequence + seq_diff
+            block_starts.append(seq * samples_per_block - chip_base)
+            block_counts.append(len(params["data"]) // 4)
+        # lets the clock regression anchor its translation on the newest sample
+        reader.clock_sync.set_last_chip_clock(seq * samples_per_block + block_counts[-1] - 1)
+
+        freqvals = np.frombuffer(b"".join(params["data"] for params in raw_samples), dtype=">u4").astype(np.uint32)
+
+        # chip sample index of every sample: the start of its block plus its offset in the block
+        block_counts = np.array(block_counts)
+        offsets = np.arange(len(freqvals)) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+        sample_index = np.repeat(np.array(block_starts, dtype=np.float64), block_counts) + offsets
+        times = time_base + sample_index * inv_freq
+
+        return times, freqvals
+
     def _process_batch(self, eventtime):
-        samples = self._ffreader.pull_samples()
-        count = 0
-        err_count = 0
-        last_err_kind = 0
-        for ptime, val in samples:
-            if val > 0x0FFFFFFF:  # high nibble indicates an error
-                err_kind = (val >> 28)
-                err_count += 1
-                if last_err_kind != err_kind:
-                    if self._verbose:
-                        logging.info(f"LDC1612 error: {hex(val)}")
-                    last_err_kind = err_kind
-            else:
-                # val is a raw value
-                samples[count] = (ptime, val)
-                count += 1
-        # remove the samples we didn't fill in because of errors
-        del samples[count:]
+        times, freqvals = self._pull_samples()
+
+        # high nibble indicates an error
+        err_mask = freqvals > 0x0FFFFFFF
+        err_count = int(np.count_nonzero(err_mask))
+        error_counts = {}
+        if err_count:
+            error_times = times[err_mask]
+            error_values = freqvals[err_mask]
+            err_kinds = error_values >> 28
+            error_counts = {int(kind): int(count) for kind, count in enumerate(np.bincount(err_kinds, minlength=16)) if count}
+            if self._verbose:
+                # log each change in error kind
+                changes = np.flatnonzero(np.diff(err_kinds.astype(np.int32), prepend=0))
+                for val in error_values[changes]:
+                    logging.info(f"LDC1612 error: {hex(val)}")
+            times = times[~err_mask]
+            freqvals = freqvals[~err_mask]
+        else:
+            error_times = np.empty(0, dtype=np.float64)
+            error_values = np.empty(0, dtype=np.uint32)
+
         return {
-            "data": samples,
+            "times": times,
+            "freqvals": freqvals,
             "errors": err_count,
+            "error_times": error_times,
+            "error_values": error_values,
+            "error_counts": error_counts,
             "overflows": self._ffreader.get_last_overflows(),
         }
 
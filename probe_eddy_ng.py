@@ -8,31 +8,42 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 from __future__ import annotations
 
+import time
+
+# how long loading this module takes, imports included; see
+# ProbeEddy._startup_report
+_module_load_start = time.perf_counter()
+
 import os
+import sys
 import logging
 import math
-import bisect
 import re
 import traceback
+import io
 import pickle
 import base64
-import time
+import binascii
+import importlib.util
 import numpy as np
-import numpy.polynomial as npp
-from itertools import combinations
-from functools import cmp_to_key
+from functools import cmp_to_key, lru_cache
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import (
     Any,
+    Callable,
     Dict,
     List,
     Optional,
     Tuple,
     ClassVar,
+    TYPE_CHECKING,
     final,
 )
 
+if TYPE_CHECKING:
+    import numpy.polynomial as npp
+
 try:
     from klippy import mcu, pins, chelper
     from klippy.printer import Printer
@@ -62,15 +73,6 @@ except ImportError:
 
 from . import ldc1612_ng
 
-try:
-    import plotly  # noqa
-except ImportError:
-    plotly = None
-
-try:
-    import scipy  # noqa
-except ImportError:
-    scipy = None
 
 # In this file, a couple of conventions are used (for sanity).
 # Variables are named according to:
@@ -240,6 +242,24 @@ class ProbeEddyParams:
     # but you may want to adjust this for your configuration. This is a number
     # in the range of 0.0 to 1.0.
     tap_time_position: float = 0.3
+    # How the sensor offset at home_trigger_height is measured after a tap.
+    # "static" moves the sensor over the tap point and takes a reading there.
+    # "descent" uses the samples from the tap descents as they pass through
+    # home_trigger_height, which skips that move. The sensor is then a probe
+    # offset away from the tap point, so this relies on the bed being flat there.
+    # If the tap drive current differs from the homing one, a quick pass through
+    # home_trigger_height at the homing drive current is used instead. Can be set
+    # per TAP with OFFSET_METHOD=static or OFFSET_METHOD=descent.
+    tap_offset_method: str = "static"
+    # Run all the taps of a TAP with one sampler, and between taps retract only to
+    # tap_trigger_safe_start_height + tap_retract_margin (or tap_start_z, if lower)
+    # instead of going back up to tap_start_z. The tap detection is armed once the
+    # sensor passes tap_trigger_safe_start_height on the way down, and its filter
+    # settles over the margin above that, so don't make it too small. Tap plots
+    # need a sampler per tap, so taps aren't pipelined when plotting. Can be set
+    # per TAP with PIPELINE=0/1.
+    tap_pipeline: bool = False
+    tap_retract_margin: float = 1.0
 
     # When probing multiple points (not rapid scan), how long to sample for at each probe point,
     # after a scan_sample_time_delay delay. The total dwell time at each probe point is
@@ -248,8 +268,39 @@ class ProbeEddyParams:
     # When probing multiple points (not rapid scan), how long to delay at each probe point
     # before the scan_sample_time kicks in.
     scan_sample_time_delay: float = 0.050
+    # When probing multiple points (not rapid scan), take each point's reading as the
+    # toolhead passes through it, instead of stopping at each point. The reading is
+    # taken from a scan_sample_time window centred on when the toolhead is at the
+    # point, narrowed so that the toolhead travels at most scan_on_the_fly_max_travel
+    # mm during it; probing slower gives more samples per point. Can be set per
+    # command with METHOD=on_the_fly or METHOD=dwell.
+    scan_on_the_fly: bool = False
+    scan_on_the_fly_max_travel: float = 2.0
+    # Instead of waiting a fixed time for the toolhead and sensor to settle before
+    # a static reading, readings are taken until the last settle_window seconds of
+    # them vary (stddev, and drift between the window's halves) by at most
+    # settle_tolerance mm, or until settle_timeout seconds have passed. The
+    # reading is the median of that window. The default timeout is the fixed
+    # dwell plus reading window that were used before, so a sensor too noisy to
+    # ever settle within the tolerance is no slower than it was.
+    settle_tolerance: float = 0.002
+    settle_window: float = 0.100
+    settle_timeout: float = 0.200
     # number of points to save for calibration
     calibration_points: int = 150
+    # The model fit to the calibration data: "poly" (degree 9 polynomials) or
+    # "pchip" (a monotone piecewise cubic through binned medians of the data,
+    # which is faster to fit and evaluate and doesn't ring at the edges)
+    calibration_model: str = "poly"
+    # Save the freq to height lookup table with the calibration when it has at
+    # most this many points, instead of rebuilding it at startup. Rebuilding takes
+    # a couple of ms while the table is several times the size of the fits, so
+    # by default it isn't saved.
+    calibration_lut_save_points: int = 0
+    # How many worker processes calibration fits, plots, mesh builds and
+    # PROBE_EDDY_NG_TUNE_TAP searches run in. Each is a fork of klippy, started
+    # when there's work for it and stopped once it's been idle for a while.
+    worker_processes: int = 1
     # configuration for butterworth filter
     tap_butter_lowcut: float = 5.0
     tap_butter_highcut: float = 25.0
@@ -281,9 +332,6 @@ class ProbeEddyParams:
         except:
             raise configerror(f"Can't parse '{s}' as list of floats")
 
-    def is_default_butter_config(self):
-        return self.tap_butter_lowcut == 5.0 and self.tap_butter_highcut == 25.0 and self.tap_butter_order == 2
-
     def load_from_config(self, config: ConfigWrapper):
         mode_choices = ["wma", "butter"]
 
@@ -305,7 +353,11 @@ class ProbeEddyParams:
         self.tap_target_z = config.getfloat("tap_target_z", self.tap_target_z)
         self.tap_speed = config.getfloat("tap_speed", self.tap_speed, above=0.0)
         self.tap_adjust_z = config.getfloat("tap_adjust_z", self.tap_adjust_z)
+        self.tap_offset_method = config.getchoice("tap_offset_method", ["static", "descent"], self.tap_offset_method)
         self.calibration_points = config.getint("calibration_points", self.calibration_points)
+        self.calibration_model = config.getchoice("calibration_model", ["poly", "pchip"], self.calibration_model)
+        self.calibration_lut_save_points = config.getint("calibration_lut_save_points", self.calibration_lut_save_points, minval=0)
+        self.worker_processes = config.getint("worker_processes", self.worker_processes, minval=1)
 
         self.tap_mode = config.getchoice("tap_mode", mode_choices, self.tap_mode)
         default_tap_threshold = 1000.0  # for wma
@@ -315,6 +367,11 @@ class ProbeEddyParams:
 
         self.scan_sample_time = config.getfloat("scan_sample_time", self.scan_sample_time, above=0.0)
         self.scan_sample_time_delay = config.getfloat("scan_sample_time_delay", self.scan_sample_time_delay, minval=0.0)
+        self.scan_on_the_fly = config.getboolean("scan_on_the_fly", self.scan_on_the_fly)
+        self.scan_on_the_fly_max_travel = config.getfloat("scan_on_the_fly_max_travel", self.scan_on_the_fly_max_travel, above=0.0)
+        self.settle_tolerance = config.getfloat("settle_tolerance", self.settle_tolerance, above=0.0)
+        self.settle_window = config.getfloat("settle_window", self.settle_window, above=0.0)
+        self.settle_timeout = config.getfloat("settle_timeout", self.settle_timeout, minval=self.settle_window)
 
         # for 'butter'
         self.tap_butter_lowcut = config.getfloat("tap_butter_lowcut", self.tap_butter_lowcut, above=0.0)
@@ -335,6 +392,8 @@ class ProbeEddyParams:
             above=0.0,
         )
         self.tap_time_position = config.getfloat("tap_time_position", self.tap_time_position, minval=0.0, maxval=1.0)
+        self.tap_pipeline = config.getboolean("tap_pipeline", self.tap_pipeline)
+        self.tap_retract_margin = config.getfloat("tap_retract_margin", self.tap_retract_margin, above=0.0)
 
         if self.tap_trigger_safe_start_height == -1.0:  # sentinel
             self.tap_trigger_safe_start_height = self.home_trigger_height / 2.0
@@ -364,15 +423,6 @@ class ProbeEddyParams:
         if self.home_trigger_height <= self.tap_trigger_safe_start_height:
             raise printer.config_error("ProbeEddy: home_trigger_height must be greater than tap_trigger_safe_start_height")
 
-        need_scipy = False
-        if self.tap_mode == "butter" and not self.is_default_butter_config():
-            need_scipy = True
-
-        if need_scipy and not scipy:
-            raise printer.config_error(
-                "ProbeEddy: butter mode with custom filter parameters requires scipy, which is not available; please install scipy, use the defaults, or use wma mode"
-            )
-
 
 @dataclass
 class ProbeEddyProbeResult:
@@ -431,6 +481,7 @@ class ProbeEddyProbeResult:
 class ProbeEddy:
     def __init__(self, config: ConfigWrapper):
         logging.info("Hello from ProbeEddyNG")
+        init_start = time.perf_counter()
 
         self._printer: Printer = config.get_printer()
         self._reactor = self._printer.get_reactor()
@@ -456,6 +507,14 @@ class ProbeEddy:
         self.params = ProbeEddyParams()
         self.params.load_from_config(config)
 
+        # design the butter filter now, both to check it against the data rate
+        # and so that taps find it cached
+        try:
+            self._tap_butter_sos(self.params.tap_butter_lowcut, self.params.tap_butter_highcut, self.params.tap_butter_order)
+        except self._printer.command_error as e:
+            if self.params.tap_mode == "butter":
+                raise self._printer.config_error(f"ProbeEddy: {e}")
+
         # figure out if either of these comes from the autosave section
         # so we can sort out what we want to write out later on
         asfc = self._printer.lookup_object("configfile").autosave.fileconfig
@@ -484,7 +543,7 @@ class ProbeEddy:
         if version == -1:
             if config.get("calibrated_drive_currents", None) is not None:
                 calibration_bad = True
-        elif version != ProbeEddyFrequencyMap.calibration_version:
+        elif version not in ProbeEddyFrequencyMap.readable_calibration_versions:
             calibration_bad = True
 
         calibrated_drive_currents = config.getintlist("calibrated_drive_currents", [])
@@ -539,13 +598,20 @@ class ProbeEddy:
         self._dummy_gcode_cmd: GCodeCommand = self._gcode.create_gcode_command("", "", {})
         self.define_commands(self._gcode)
 
+        # fits, plots and searches that are too slow to run on the reactor
+        self._executor = ProbeEddyExecutor(self, self.params.worker_processes)
+
         self._printer.register_event_handler("gcode:command_error", self._handle_command_error)
         self._printer.register_event_handler("klippy:connect", self._handle_connect)
+        self._printer.register_event_handler("klippy:disconnect", self._executor.shutdown)
 
         # patch bed_mesh because Klipper
         if not IS_KALICO:
             bed_mesh.ProbeManager.start_probe = bed_mesh_ProbeManager_start_probe_override
 
+        self._init_time = time.perf_counter() - init_start
+        self._connect_rss: Optional[float] = None
+
     def _log_error(self, msg):
         logging.error(f"{self._name}: {msg}")
         self._gcode.respond_raw(f"!! EDDYng: {msg}\n")
@@ -599,6 +665,11 @@ class ProbeEddy:
             self.cmd_PROBE_ACCURACY_help,
         )
         gcode.register_command("PROBE_EDDY_NG_TAP", self.cmd_TAP, self.cmd_TAP_help)
+        gcode.register_command(
+            "PROBE_EDDY_NG_TUNE_TAP",
+            self.cmd_TUNE_TAP,
+            self.cmd_TUNE_TAP_help,
+        )
         gcode.register_command(
             "PROBE_EDDY_NG_SET_TAP_OFFSET",
             self.cmd_SET_TAP_OFFSET,
@@ -614,6 +685,11 @@ class ProbeEddy:
             self.cmd_TEST_DRIVE_CURRENT,
             "Test a drive current.",
         )
+        gcode.register_command(
+            "PROBE_EDDY_NG_BENCHMARK",
+            self.cmd_BENCHMARK,
+            self.cmd_BENCHMARK_help,
+        )
         gcode.register_command("Z_OFFSET_APPLY_PROBE", None)
         gcode.register_command(
             "Z_OFFSET_APPLY_PROBE",
@@ -660,6 +736,22 @@ class ProbeEddy:
         for msg in self.params._warning_msgs:
             self._log_warning(msg)
 
+        self._connect_rss = process_rss_mb()
+        self._log_info(self._startup_report())
+
+    # Startup cost: loading this module (numpy included, if nothing loaded it
+    # first), setting up ProbeEddy, and klippy's RSS once connected and now.
+    # Also which of the lazily imported modules have been loaded so far.
+    def _startup_report(self) -> str:
+        def mb(v: Optional[float]) -> str:
+            return f"{v:.1f} MB" if v is not None else "unknown"
+
+        lazy = ", ".join(f"{m} {'loaded' if m in sys.modules else 'not loaded'}" for m in ("numpy.polynomial", "plotly"))
+        return (
+            f"Startup: module load {_module_load_time * 1000.0:.0f} ms, init {self._init_time * 1000.0:.0f} ms; "
+            f"RSS at connect {mb(self._connect_rss)}, now {mb(process_rss_mb())}; {lazy}"
+        )
+
     def _get_trapq_position(self, print_time: float) -> Tuple[Tuple[float, float, float], float]:
         ffi_main, ffi_lib = chelper.get_ffi()
         data = ffi_main.new("struct pull_move[1]")
@@ -677,6 +769,45 @@ class ProbeEddy:
         velocity = move.start_v + move.accel * move_time
         return pos, velocity
 
+    # Pull the trapq move history needed to evaluate positions in [start_time, end_time].
+    # Returns the moves sorted oldest first.
+    def _extract_trapq_moves(self, start_time: float, end_time: float) -> list:
+        ffi_main, ffi_lib = chelper.get_ffi()
+        size = 256
+        while True:
+            data = ffi_main.new(f"struct pull_move[{size}]")
+            count = ffi_lib.trapq_extract_old(self._trapq, data, size, start_time, end_time)
+            if count < size:
+                break
+            size *= 2
+        # trapq history is newest first
+        moves = [data[i] for i in range(count - 1, -1, -1)]
+
+        # if start_time falls in a gap in the history, the move that precedes it
+        # (which _get_trapq_position would use) isn't part of the range
+        if not moves or moves[0].print_time >= start_time:
+            prev = ffi_main.new("struct pull_move[1]")
+            if ffi_lib.trapq_extract_old(self._trapq, prev, 1, 0.0, start_time):
+                moves.insert(0, prev[0])
+
+        return moves
+
+    # Batched version of _get_trapq_position, for a sorted array of print times.
+    # Returns a (N, 3) array of positions and an (N,) array of velocities; entries
+    # with no trapq history are NaN.
+    def _get_trapq_positions(self, print_times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        print_times = np.asarray(print_times, dtype=np.float64)
+        positions = np.full((len(print_times), 3), np.nan)
+        velocities = np.full(len(print_times), np.nan)
+        if len(print_times) == 0:
+            return positions, velocities
+
+        moves = self._extract_trapq_moves(float(print_times[0]), float(print_times[-1]))
+        if moves:
+            positions, velocities = ProbeEddyTrapqMoves.from_moves(moves).positions(print_times)
+
+        return positions, velocities
+
     def _get_trapq_height(self, print_time: float) -> float:
         th_pos, _ = self._get_trapq_position(print_time)
         if th_pos is None:
@@ -817,16 +948,17 @@ class ProbeEddy:
                 data_file.write("time,frequency,z,kin_z,kin_v,raw_f,trigger_time,tap_start_time\n")
                 trigger_time = kwargs.get("trigger_time", "")
                 tap_start_time = kwargs.get("tap_start_time", "")
+                positions, velocities = self._get_trapq_positions(times)
                 for i in range(len(times)):
-                    past_pos, past_v = self._get_trapq_position(times[i])
-                    past_k_z = past_pos[2] if past_pos is not None else ""
-                    past_v = past_v if past_v is not None else ""
-                    data_file.write(f"{times[i]},{freqs[i]},{heights[i] if heights else ''},{past_k_z},{past_v},{raw_freqs[i]},{trigger_time},{tap_start_time}\n")
+                    past_k_z = positions[i, 2] if not np.isnan(velocities[i]) else ""
+                    past_v = velocities[i] if not np.isnan(velocities[i]) else ""
+                    data_file.write(f"{times[i]},{freqs[i]},{heights[i] if heights is not None else ''},{past_k_z},{past_v},{raw_freqs[i]},{trigger_time},{tap_start_time}\n")
             logging.info(f"Wrote {len(times)} samples to {self.save_samples_path}")
             self.save_samples_path = None
 
     def cmd_MESH(self, gcmd: GCodeCommand):
-        self._bed_mesh_helper.scan()
+        density = gcmd.get_int("DENSITY", 1, minval=1, maxval=16)
+        self._bed_mesh_helper.scan(density=density)
 
     cmd_STATUS_help = "Query the last raw coil value and status"
 
@@ -853,6 +985,7 @@ class ProbeEddy:
         gcmd.respond_info(
             f"Last coil value: {freq:.2f} ({height:.3f}mm) raw: {hex(freqval)} {err}status: {hex(status)} {self._sensor.status_to_str(status)}"
         )
+        gcmd.respond_info(self._startup_report())
 
     cmd_PROBE_ACCURACY_help = "Probe accuracy"
 
@@ -860,8 +993,8 @@ class ProbeEddy:
         if not self._z_homed():
             raise self._printer.command_error("Must home Z before PROBE_ACCURACY")
 
-        # How long to read at each sample time
-        duration: float = gcmd.get_float("DURATION", 0.100, above=0.0)
+        # How long to read at each sample time; by default, until the readings settle
+        duration: Optional[float] = gcmd.get_float("DURATION", None, above=0.0)
         # whether to check +/- 1mm positions for accuracy
         start_z: float = gcmd.get_float("Z", 5.0)
         offsets: str = gcmd.get("OFFSETS", None)
@@ -904,7 +1037,6 @@ class ProbeEddy:
 
             for pz in probe_zs:
                 th.manual_move([None, None, pz], probe_speed)
-                th.dwell(0.050)
                 th.wait_moves()
 
                 result = self.probe_static_height(duration=duration)
@@ -952,11 +1084,13 @@ class ProbeEddy:
     def cmd_CALIBRATION_STATUS(self, gcmd: GCodeCommand):
         for dc in self._dc_to_fmap:
             m = self._dc_to_fmap[dc]
+            m.ensure_parsed()
             hmin, hmax = m.height_range
             fmin, fmax = m.freq_range
             fspread = m.freq_spread()
             self._log_msg(
-                f"Drive current {dc}: {hmin:.3f} to {hmax:.3f} ({fmin:.1f} to {fmax:.1f}, {fspread:.2f}%; ftoh_high: {m._ftoh_high is not None})"
+                f"Drive current {dc}: {hmin:.3f} to {hmax:.3f} ({fmin:.1f} to {fmax:.1f}, {fspread:.2f}%; model: {m.model}, ftoh_high: {m._ftoh_high is not None}"
+                + (f", lookup table max error {m._ftoh_lut.max_error:.4f} mm)" if m._ftoh_lut is not None else ")")
             )
 
     def cmd_SET_TAP_OFFSET(self, gcmd: GCodeCommand):
@@ -999,10 +1133,19 @@ class ProbeEddy:
             "with the above and restart the printer."
         )
 
-    def probe_static_height(self, duration: float = 0.100) -> ProbeEddyProbeResult:
+    # Read the height with the toolhead stopped. Without a duration, this samples
+    # until the readings settle (see ProbeEddyParams.settle_tolerance), so there's
+    # no need to wait for the toolhead to settle first; with one, it's the last
+    # duration seconds of samples taken right away.
+    def probe_static_height(self, duration: Optional[float] = None) -> ProbeEddyProbeResult:
         with self.start_sampler() as sampler:
-            now = self._print_time_now()
-            sampler.wait_for_sample_at_time(now + (duration + self._sensor._ldc_settle_time))
+            start_time = self._print_time_now() + self._sensor._ldc_settle_time
+            if duration is None:
+                duration = self.params.settle_window
+                if not sampler.wait_for_settle(start_time, self.params.settle_tolerance, duration, self.params.settle_timeout):
+                    self._log_debug(f"probe_static_height: readings didn't settle in {self.params.settle_timeout:.3f}s")
+            else:
+                sampler.wait_for_sample_at_time(start_time + duration)
             sampler.finish()
 
         if sampler.height_count == 0:
@@ -1011,7 +1154,7 @@ class ProbeEddy:
         etime = sampler.times[-1]
         stime = etime - duration
 
-        first_idx = bisect.bisect_left(sampler.times, stime)
+        first_idx = int(np.searchsorted(sampler.times, stime, side="left"))
         if first_idx == len(sampler.times):
             raise self._printer.command_error(f"No samples in time range")
 
@@ -1031,7 +1174,6 @@ class ProbeEddy:
         if th_pos[2] < z:
             th.manual_move([None, None, z + 3.0], self.params.lift_speed)
         th.manual_move([None, None, z], self.params.probe_speed)
-        th.dwell(0.100)
         th.wait_moves()
 
         self.cmd_PROBE_STATIC(gcmd)
@@ -1041,7 +1183,7 @@ class ProbeEddy:
     def cmd_PROBE_STATIC(self, gcmd: GCodeCommand):
         old_drive_current = self.current_drive_current()
         drive_current: int = gcmd.get_int("DRIVE_CURRENT", old_drive_current, minval=0, maxval=31)
-        duration: float = gcmd.get_float("DURATION", 0.100, above=0.0)
+        duration: Optional[float] = gcmd.get_float("DURATION", None, above=0.0)
         save: bool = gcmd.get_int("SAVE", 0) == 1
         home_z: bool = gcmd.get_int("HOME_Z", 0) == 1
 
@@ -1126,6 +1268,9 @@ class ProbeEddy:
         if self._sensor_type == "ldc1612" or self._sensor_type == "btt_eddy" or self._sensor_type == "ldc1612_internal_clk":
             max_dc_increase = 5
         max_dc_increase = gcmd.get_int("MAX_DC_INCREASE", max_dc_increase, minval=0, maxval=30)
+        max_dc_increase = min(max_dc_increase, 31 - drive_current)
+        # Calibrate every candidate drive current in one descent
+        interleave = gcmd.get_int("INTERLEAVE", 0) == 1
 
         # lift up above cal_z_max, and then move over so the probe
         # is over the nozzle position
@@ -1153,19 +1298,35 @@ class ProbeEddy:
         start_drive_current = drive_current
         result_msg = None
 
-        self._log_msg("setup: calibrating homing")
-        state = FINDING_HOMING
-        while state < DONE:
-            mapping, fth_rms, htf_rms = self._create_mapping(
+        premapped = None
+        if interleave:
+            self._log_msg(f"setup: calibrating drive currents {drive_current}-{drive_current + max_dc_increase} in one pass")
+            premapped = self._create_mappings_interleaved(
                 self.params.calibration_z_max,
                 0.0,  # z_target
                 self.params.probe_speed,
                 self.params.lift_speed,
-                drive_current,
+                list(range(drive_current, drive_current + max_dc_increase + 1)),
                 report_errors=debug,
                 write_debug_files=debug,
             )
 
+        self._log_msg("setup: calibrating homing")
+        state = FINDING_HOMING
+        while state < DONE:
+            if premapped is not None:
+                mapping, fth_rms, htf_rms = premapped[drive_current]
+            else:
+                mapping, fth_rms, htf_rms = self._create_mapping(
+                    self.params.calibration_z_max,
+                    0.0,  # z_target
+                    self.params.probe_speed,
+                    self.params.lift_speed,
+                    drive_current,
+                    report_errors=debug,
+                    write_debug_files=debug,
+                )
+
             homing_req_min = 0.5
             homing_req_max = 5.0
             tap_req_min = 0.025
@@ -1362,12 +1523,137 @@ class ProbeEddy:
 
         return mapping, fth_fit, htf_fit
 
+    # Like _create_mapping, but for several drive currents at once: the drive
+    # current is cycled through drive_currents during a single descent (slowed
+    # down by the number of drive currents, so each one sees as many samples
+    # per mm as a normal calibration), and a map is built for each one from
+    # its own samples. Returns {drive_current: (mapping, fth_fit, htf_fit)}.
+    def _create_mappings_interleaved(
+        self,
+        z_start: float,
+        z_target: float,
+        probe_speed: float,
+        lift_speed: float,
+        drive_currents: List[int],
+        report_errors: bool,
+        write_debug_files: bool,
+    ) -> Dict[int, Tuple[ProbeEddyFrequencyMap, float, float]]:
+        th = self._printer.lookup_object("toolhead")
+        th_pos = th.get_position()
+
+        if th_pos[2] < z_start:
+            th.manual_move([None, None, z_start + 3.0], lift_speed)
+        th.manual_move([None, None, z_start], lift_speed)
+
+        old_drive_current = self.current_drive_current()
+        try:
+            self._sensor.set_drive_current(drive_currents[0])
+            captured = self._capture_samples_interleaved(z_target, probe_speed / len(drive_currents), drive_currents)
+            th.manual_move([None, None, z_start + 3.0], lift_speed)
+        finally:
+            self._sensor.set_drive_current(old_drive_current)
+
+        results = {}
+        for dc in drive_currents:
+            times, freqs, heights, vels = captured.get(dc, (None, None, None, None))
+            if not times:
+                self._log_warning(f"Drive current {dc}: Warning: no samples collected.")
+                results[dc] = (None, None, None)
+                continue
+
+            mapping = ProbeEddyFrequencyMap(self)
+            fth_fit, htf_fit = mapping.calibrate_from_values(dc, times, freqs, heights, vels, report_errors, write_debug_files)
+            results[dc] = (mapping, fth_fit, htf_fit)
+
+        return results
+
+    # Before a calibration capture, give the sensor (and the toolhead, after the
+    # move to the start) a bit to settle. There are no heights yet, so this goes
+    # by the frequency, and waits at most as long as a fixed wait used to.
+    SETTLE_FREQ_TOLERANCE = 10.0
+    CAPTURE_SETTLE_TIMEOUT = 0.500
+
+    def _wait_for_freq_settle(self, sampler: ProbeEddySampler):
+        start_time = self._print_time_now() + self._sensor._ldc_settle_time
+        if not sampler.wait_for_settle(start_time, self.SETTLE_FREQ_TOLERANCE, self.params.settle_window, self.CAPTURE_SETTLE_TIMEOUT):
+            self._log_debug(f"capture: frequency didn't settle in {self.CAPTURE_SETTLE_TIMEOUT:.3f}s")
+
+    # How long each drive current is held for during an interleaved capture, and
+    # how much of the start of each slot is dropped while the sensor settles
+    # after the switch (this also covers the i2c write latency).
+    INTERLEAVE_SLOT_TIME = 0.100
+    INTERLEAVE_GUARD_TIME = 0.030
+
+    def _capture_samples_interleaved(self, z_target: float, probe_speed: float, drive_currents: List[int]):
+        th = self._printer.lookup_object("toolhead")
+        th.wait_moves()
+
+        slot_time = self.INTERLEAVE_SLOT_TIME
+        guard_time = max(self.INTERLEAVE_GUARD_TIME, 3.0 / self._sensor._data_rate + self._sensor._ldc_settle_time)
+        ndcs = len(drive_currents)
+
+        with self.start_sampler(calculate_heights=False) as sampler:
+            self._wait_for_freq_settle(sampler)
+            first_sample_time = th.get_last_move_time()
+            th.manual_move([None, None, z_target], probe_speed)
+            last_sample_time = th.get_last_move_time()
+
+            # Switch drive currents on schedule while the move runs. Each switch is
+            # sent a little ahead of time, with a minclock so that it doesn't take
+            # effect before the start of its slot. If the reactor wakes up late, a
+            # switch can land after its slot has started, so the samples at the
+            # start of the slot would be tagged with the wrong drive current; those
+            # slots are dropped.
+            late_slots = []
+            slot = 1
+            while first_sample_time + slot * slot_time < last_sample_time:
+                switch_time = first_sample_time + slot * slot_time
+                now = self._mcu.estimated_print_time(self._reactor.monotonic())
+                if switch_time - now > 0.050:
+                    self._reactor.pause(self._reactor.monotonic() + (switch_time - now - 0.050))
+                self._sensor.set_drive_current(
+                    drive_currents[slot % ndcs], minclock=self._mcu.print_time_to_clock(switch_time), log=False
+                )
+                sent_time = self._mcu.estimated_print_time(self._reactor.monotonic())
+                if sent_time > switch_time - guard_time:
+                    late_slots.append(slot)
+                slot += 1
+            self._log_info(f"Interleaved drive currents {drive_currents}: {slot - 1} switches, {slot_time:.3f}s apart")
+            if late_slots:
+                self._log_warning(f"Interleaved capture: {len(late_slots)} drive current switches were sent late, dropping their slots")
+
+            th.dwell(0.500)
+            th.wait_moves()
+            sampler.finish()
+
+        if sampler.raw_count == 0:
+            return {}
+
+        s_times = sampler.times
+        s_freqs = sampler.freqs
+        s_pos, s_v = self._get_trapq_positions(s_times)
+        s_z = s_pos[:, 2]
+
+        # tag each sample with the drive current of its slot, dropping the guard window
+        slot_idx = np.floor((s_times - first_sample_time) / slot_time)
+        slot_offset = s_times - first_sample_time - slot_idx * slot_time
+        in_move = (s_times > first_sample_time) & (s_times < last_sample_time) & (s_z >= z_target)
+        settled = in_move & ((slot_idx == 0) | (slot_offset >= guard_time)) & ~np.isin(slot_idx, late_slots)
+        sample_dcs = np.array(drive_currents)[slot_idx.astype(np.intp) % ndcs]
+
+        captured = {}
+        for dc in drive_currents:
+            keep = settled & (sample_dcs == dc)
+            captured[dc] = (s_times[keep].tolist(), s_freqs[keep].tolist(), s_z[keep].tolist(), s_v[keep].tolist())
+            self._log_debug(f"interleaved capture: drive current {dc}: {np.count_nonzero(keep)} samples")
+        return captured
+
     def _capture_samples_down_to(self, z_target: float, probe_speed: float) -> tuple[List[float], List[float], List[float], List[float]]:
         th = self._printer.lookup_object("toolhead")
-        th.dwell(0.500)  # give the sensor a bit to settle
         th.wait_moves()
 
         with self.start_sampler(calculate_heights=False) as sampler:
+            self._wait_for_freq_settle(sampler)
             first_sample_time = th.get_last_move_time()
             th.manual_move([None, None, z_target], probe_speed)
             last_sample_time = th.get_last_move_time()
@@ -1384,23 +1670,15 @@ class ProbeEddy:
         if sampler.raw_count == 0:
             return None, None, None, None
 
-        freqs = []
-        heights = []
-        times = []
-        vels = []
+        s_times = sampler.times
+        s_freqs = sampler.freqs
+        s_pos, s_v = self._get_trapq_positions(s_times)
+        s_z = s_pos[:, 2]
 
-        for i in range(sampler.raw_count):
-            s_t = sampler.times[i]
-            s_freq = sampler.freqs[i]
-            s_pos, s_v = self._get_trapq_position(s_t)
-            s_z = s_pos[2]
-            if first_sample_time < s_t < last_sample_time and s_z >= z_target:
-                times.append(s_t)
-                freqs.append(s_freq)
-                heights.append(s_z)
-                vels.append(s_v)
+        # NaN (no trapq history) compares false and drops out
+        keep = (s_times > first_sample_time) & (s_times < last_sample_time) & (s_z >= z_target)
 
-        return times, freqs, heights, vels
+        return s_times[keep].tolist(), s_freqs[keep].tolist(), s_z[keep].tolist(), s_v[keep].tolist()
 
     def cmd_TEST_DRIVE_CURRENT(self, gcmd: GCodeCommand):
         drive_current: int = gcmd.get_int("DRIVE_CURRENT", self._reg_drive_current, minval=1, maxval=31)
@@ -1421,6 +1699,18 @@ class ProbeEddy:
         if mapping is None or fth is None or htf is None:
             self._log_error(f"Test failed: drive current {drive_current} is not usable.")
 
+    cmd_BENCHMARK_help = "Time the host-side sample conversions for a calibrated drive current"
+
+    def cmd_BENCHMARK(self, gcmd: GCodeCommand):
+        drive_current: int = gcmd.get_int("DRIVE_CURRENT", self.current_drive_current(), minval=0, maxval=31)
+        count: int = gcmd.get_int("COUNT", 10000, minval=100)
+
+        fmap = self.map_for_drive_current(drive_current)
+        lines = [f"Drive current {drive_current}, {count} samples:"]
+        for name, secs in fmap.benchmark_conversions(count):
+            lines.append(f"  {name}: {secs * 1000.0:.3f} ms per 10k samples")
+        gcmd.respond_info("\n".join(lines))
+
     #
     # PrinterProbe interface
     #
@@ -1487,7 +1777,6 @@ class ProbeEddy:
     # is the old one, different than the scanning session run_probe.
     def run_probe(self, gcmd=None, *args: Any, **kwargs: Any):
         z = self.params.home_trigger_height
-        duration = 0.100
 
         if not self._z_homed():
             raise self._printer.command_error("Must home Z before PROBE")
@@ -1500,10 +1789,9 @@ class ProbeEddy:
         if th_pos[2] < z:
             th.manual_move([None, None, z + 3.0], self.params.lift_speed)
         th.manual_move([None, None, z], self.params.lift_speed)
-        th.dwell(0.100)
         th.wait_moves()
 
-        r = self.probe_static_height(duration)
+        r = self.probe_static_height()
         if not r.valid:
             raise self._printer.command_error("Probe captured no samples!")
 
@@ -1646,6 +1934,9 @@ class ProbeEddy:
         mode: str
         threshold: float
         sos: Optional[List[List[float]]] = None
+        # the first height the sensor has to pass through before the tap detection
+        # is armed at tap_trigger_safe_start_height; home_trigger_height if None
+        safe_height: Optional[float] = None
 
     def do_one_tap(
         self,
@@ -1654,8 +1945,14 @@ class ProbeEddy:
         tap_speed: float,
         lift_speed: float,
         tapcfg: ProbeEddy.TapConfig,
+        retract_z: Optional[float] = None,
     ) -> TapResult:
+        # this also waits for the toolhead to get there, which a pipelined tap
+        # relies on: the sensor has to be above tapcfg's heights before the
+        # tap detection is set up
         self.probe_to_start_position(start_z)
+        if retract_z is None:
+            retract_z = start_z
 
         th = self._printer.lookup_object("toolhead")
 
@@ -1678,14 +1975,14 @@ class ProbeEddy:
                 # raise toolhead as soon as tap ends
                 finish_z = th.get_position()[2]
                 if finish_z < 1.0:
-                    th.manual_move([None, None, start_z], lift_speed)
+                    th.manual_move([None, None, retract_z], lift_speed)
 
                 if hmove.check_no_movement() is not None:
                     raise self._printer.command_error("Probe triggered prior to movement")
 
                 probe_z = probe_position[2]
 
-                self._log_debug(f"tap: probe_z: {probe_z:.3f} finish_z: {finish_z:.3f} moved up to {start_z:.3f}")
+                self._log_debug(f"tap: probe_z: {probe_z:.3f} finish_z: {finish_z:.3f} moved up to {retract_z:.3f}")
 
                 if probe_z - target_z < 0.050:
                     # we detected a tap but it was too close to our target z
@@ -1708,7 +2005,7 @@ class ProbeEddy:
                 # in case of failure don't leave the toolhead in a bad spot (i.e. in bed)
                 finish_z = th.get_position()[2]
                 if finish_z < 1.0:
-                    th.manual_move([None, None, start_z], lift_speed)
+                    th.manual_move([None, None, retract_z], lift_speed)
 
                 # If just sensor errors, let the caller handle it
                 self._log_error(f"Tap failed with Z at {finish_z:.3f}: {err}")
@@ -1753,31 +2050,216 @@ class ProbeEddy:
             tap_end_time=tap_end_time,
         )
 
-    def _compute_butter_tap(self, sampler):
-        if not scipy:
-            return None, None
+    # The bandpass sos filter for butter tap detection, as sections of
+    # [b0, b1, b2, a0, a1, a2]
+    def _tap_butter_sos(self, lowcut: float, highcut: float, order: int) -> List[List[float]]:
+        try:
+            sos = np_butter_bandpass_sos(order, lowcut, highcut, float(self._sensor._data_rate))
+        except ValueError as e:
+            raise self._printer.command_error(str(e))
+        if len(sos) > ProbeEddyTapModel.MAX_SOS_SECTIONS:
+            raise self._printer.command_error(f"Butter filter order must be at most {ProbeEddyTapModel.MAX_SOS_SECTIONS}")
+        return [list(sect) for sect in sos]
+
+    # A model of the firmware tap detection for the samples of a finished tap,
+    # with the thresholds it was set up with; None if the sampler wasn't a tap
+    def _tap_model(self, sampler: ProbeEddySampler) -> Optional[ProbeEddyTapModel]:
+        if "tap_safe_freq" not in sampler.memos or sampler.raw_count == 0:
+            return None
+        return ProbeEddyTapModel(
+            sampler.times,
+            sampler.raw_freqs,
+            self._sensor.freqval_conversion_value(),
+            self._sensor.to_ldc_freqval(sampler.memos["tap_safe_freq"]),
+            self._sensor.to_ldc_freqval(sampler.memos["tap_trigger_freq"]),
+            max_errors=self.params.max_errors,
+        )
+
+    # The samples and motion of a finished tap, for PROBE_EDDY_NG_TUNE_TAP
+    def _record_tap(self, sampler: ProbeEddySampler) -> Optional[ProbeEddyTapRecording]:
+        trigger_time = sampler.memos.get("trigger_time")
+        if "tap_safe_freq" not in sampler.memos or not trigger_time or sampler.raw_count < 2:
+            return None
+
+        times = np.array(sampler.times)
+        moves = self._extract_trapq_moves(float(times[0]), float(times[-1]))
+        if not moves:
+            return None
+
+        # the mcu's trigger time is when it read the sample; the sample times are
+        # estimated from the clock sync, so allow for them to be a bit later
+        half_interval = float(np.median(np.diff(times))) / 2.0
+        return ProbeEddyTapRecording(
+            times=times,
+            freqvals=np.array(sampler.raw_freqs),
+            freqval_cvt=self._sensor.freqval_conversion_value(),
+            safe_freqval=self._sensor.to_ldc_freqval(sampler.memos["tap_safe_freq"]),
+            trigger_freqval=self._sensor.to_ldc_freqval(sampler.memos["tap_trigger_freq"]),
+            max_errors=self.params.max_errors,
+            end_idx=int(np.searchsorted(times, trigger_time + half_interval, side="right")) - 1,
+            moves=ProbeEddyTrapqMoves.from_moves(moves),
+        )
+
+    # What PROBE_EDDY_NG_TUNE_TAP searches: threshold ranges per mode, butter
+    # filters (only those with highcut under the nyquist frequency), and
+    # tap_time_positions
+    TUNE_TAP_THRESHOLDS = {"butter": (20.0, 2000.0), "wma": (100.0, 10000.0)}
+    TUNE_TAP_THRESHOLD_STEPS = 48
+    TUNE_TAP_LOWCUTS = (2.0, 3.0, 5.0, 7.5, 10.0)
+    TUNE_TAP_HIGHCUTS = (15.0, 20.0, 25.0, 30.0, 40.0)
+    TUNE_TAP_ORDERS = (1, 2, 3)
+    TUNE_TAP_POSITIONS = (0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+    # each search task is much bigger than a fit, and far too big to run on the
+    # reactor if its worker is lost
+    TUNE_TAP_TIMEOUT = 600.0
+
+    def _tune_tap_filters(self) -> List[Tuple[float, float, int, List[List[float]]]]:
+        nyquist = self._sensor._data_rate / 2.0
+        filters = []
+        for order in self.TUNE_TAP_ORDERS:
+            for lowcut in self.TUNE_TAP_LOWCUTS:
+                for highcut in self.TUNE_TAP_HIGHCUTS:
+                    if lowcut >= highcut or highcut >= nyquist:
+                        continue
+                    filters.append((lowcut, highcut, order, self._tap_butter_sos(lowcut, highcut, order)))
+        return filters
+
+    cmd_TUNE_TAP_help = "Record taps and search for the tap mode, threshold, filter and tap_time_position that give the most consistent taps"
+
+    def cmd_TUNE_TAP(self, gcmd: GCodeCommand):
+        if not self._z_homed():
+            raise self._printer.command_error("Z axis must be homed before tapping")
+
+        tap_drive_current: int = gcmd.get_int("DRIVE_CURRENT", self._tap_drive_current, minval=1, maxval=31)
+        tap_speed: float = gcmd.get_float("SPEED", self.params.tap_speed, above=0.0)
+        lift_speed: float = gcmd.get_float("RETRACT_SPEED", self.params.lift_speed, above=0.0)
+        tap_start_z: float = gcmd.get_float("START_Z", self.params.tap_start_z, above=2.0)
+        target_z: float = gcmd.get_float("TARGET_Z", self.params.tap_target_z)
+        tap_count: int = gcmd.get_int("TAPS", 10, minval=3)
+        workers: int = gcmd.get_int("WORKERS", self._executor.workers, minval=1)
+        spread_tolerance: float = gcmd.get_float("SPREAD_TOLERANCE", 0.002, minval=0.0)
+        save: bool = gcmd.get_int("SAVE", 0) == 1
+
+        mode_arg = gcmd.get("MODE", "all").lower()
+        if mode_arg == "all":
+            modes = ["butter", "wma"]
+        elif mode_arg in ("butter", "wma"):
+            modes = [mode_arg]
+        else:
+            raise self._printer.command_error(f"Invalid mode: {mode_arg}")
+
+        # The taps are recorded with the configured mode at a generous threshold:
+        # a candidate setting can only be judged up to where the recorded tap
+        # triggered and stopped the toolhead, so the taps should go well into
+        # the bed.
+        record_threshold: float = gcmd.get_float("RECORD_THRESHOLD", self.params.tap_threshold * 2.0, above=0.0)
+        record_cfg = ProbeEddy.TapConfig(mode=self.params.tap_mode, threshold=record_threshold)
+        if record_cfg.mode == "butter":
+            record_cfg.sos = self._tap_butter_sos(
+                self.params.tap_butter_lowcut, self.params.tap_butter_highcut, self.params.tap_butter_order
+            )
 
-        trigger_freq = self.height_to_freq(self.params.home_trigger_height)
+        recordings: List[ProbeEddyTapRecording] = []
+        orig_drive_current: int = self._sensor.get_drive_current()
+        try:
+            self._sensor.set_drive_current(tap_drive_current)
+            for tap_i in range(tap_count):
+                tap = self.do_one_tap(
+                    start_z=tap_start_z,
+                    target_z=target_z,
+                    tap_speed=tap_speed,
+                    lift_speed=lift_speed,
+                    tapcfg=record_cfg,
+                )
+                recording = self._record_tap(self._last_sampler) if not tap.error else None
+                if recording is None:
+                    self._log_msg(f"Tap {tap_i+1}: failed ({tap.error or 'no samples'})")
+                    continue
+                recordings.append(recording)
+                self._log_msg(f"Tap {tap_i+1}: z={tap.probe_z:.3f}")
+        finally:
+            self._sensor.set_drive_current(orig_drive_current)
+
+        if len(recordings) < 3:
+            raise self._printer.command_error(f"Only {len(recordings)} taps recorded, at least 3 are needed")
+
+        # One task per chunk of filters so the workers share the butter search
+        positions = np.array(self.TUNE_TAP_POSITIONS)
+        tasks = []
+        task_filters = []
+        for mode in modes:
+            lo, hi = self.TUNE_TAP_THRESHOLDS[mode]
+            thresholds = np.unique(np.round(np.geomspace(lo, hi, self.TUNE_TAP_THRESHOLD_STEPS), 1))
+            if mode == "wma":
+                tasks.append((recordings, None, thresholds, positions))
+                task_filters.append(("wma", [None], thresholds))
+                continue
+            filters = self._tune_tap_filters()
+            if not filters:
+                self._log_msg("No butter filters fit below the nyquist frequency at this sample rate, skipping butter")
+                continue
+            chunk = -(-len(filters) // workers)
+            for i in range(0, len(filters), chunk):
+                tasks.append((recordings, [f[3] for f in filters[i : i + chunk]], thresholds, positions))
+                task_filters.append(("butter", filters[i : i + chunk], thresholds))
+
+        if not tasks:
+            raise self._printer.command_error("Nothing to search")
+
+        self._log_msg(f"Searching tap settings over {len(recordings)} taps in {min(self._executor.workers, len(tasks))} processes...")
+        start_time = time.time()
+        results: List[ProbeEddyTapSearchResult] = self._executor.map(tune_tap_search, tasks, timeout=self.TUNE_TAP_TIMEOUT, inline=False)
+        search_time = time.time() - start_time
+
+        # (task, filter, threshold, position) of every setting that detected every tap
+        stddevs, latencies, keys = [], [], []
+        for task_i, res in enumerate(results):
+            ok = res.ok[:, :, np.newaxis] & ~np.isnan(res.stddev)
+            f, t, p = np.nonzero(ok)
+            stddevs.append(res.stddev[f, t, p])
+            latencies.append(res.latency[f, t])
+            keys.append(np.stack([np.full(len(f), task_i), f, t, p], axis=1))
+        stddevs = np.concatenate(stddevs)
+        latencies = np.concatenate(latencies)
+        keys = np.concatenate(keys)
+
+        if len(stddevs) == 0:
+            raise self._printer.command_error(
+                "No setting detected every tap; try a higher RECORD_THRESHOLD, or a lower TARGET_Z"
+            )
 
-        s_f = np.asarray(sampler.freqs)
-        first_one = np.argmax(s_f >= trigger_freq)
-        s_t = np.asarray(sampler.times[first_one:])
-        s_f = np.asarray(sampler.freqs[first_one:])
+        # Of the settings whose spread is within spread_tolerance of the best,
+        # the one that detects the tap soonest
+        eligible = stddevs <= stddevs.min() + spread_tolerance
+        order = np.lexsort((stddevs, np.where(eligible, latencies, np.inf)))
 
-        lowcut = self.params.tap_butter_lowcut
-        highcut = self.params.tap_butter_highcut
-        order = self.params.tap_butter_order
+        def describe(i):
+            task_i, f, t, p = keys[i]
+            mode, filters, thresholds = task_filters[task_i]
+            desc = f"mode={mode} threshold={thresholds[t]:.1f} tap_time_position={positions[p]:.1f}"
+            if mode == "butter":
+                lowcut, highcut, order_, _ = filters[f]
+                desc += f" lowcut={lowcut:.1f} highcut={highcut:.1f} order={order_}"
+            return desc + f": stddev {stddevs[i]:.4f}, latency {latencies[i] * 1000.0:.1f}ms"
 
-        sos = scipy.signal.butter(
-            order,
-            [lowcut, highcut],
-            btype="bandpass",
-            fs=self._sensor._data_rate,
-            output="sos",
+        self._log_msg(
+            f"Searched {len(keys)} working settings in {search_time:.1f}s; best:\n"
+            + "\n".join(describe(i) for i in order[: min(5, int(np.count_nonzero(eligible)))])
         )
-        filtered = scipy.signal.sosfilt(sos, s_f - s_f[0])
 
-        return s_t, filtered
+        task_i, f, t, p = keys[order[0]]
+        mode, filters, thresholds = task_filters[task_i]
+        if save:
+            configfile = self._printer.lookup_object("configfile")
+            configfile.set(self._full_name, "tap_mode", mode)
+            configfile.set(self._full_name, "tap_threshold", f"{thresholds[t]:.1f}")
+            configfile.set(self._full_name, "tap_time_position", f"{positions[p]:.1f}")
+            if mode == "butter":
+                lowcut, highcut, order_, _ = filters[f]
+                configfile.set(self._full_name, "tap_butter_lowcut", f"{lowcut:.1f}")
+                configfile.set(self._full_name, "tap_butter_highcut", f"{highcut:.1f}")
+                configfile.set(self._full_name, "tap_butter_order", str(order_))
+            self._log_msg("Tap settings saved. Issue a SAVE_CONFIG to write them to your config file and restart Klipper.")
 
     def cmd_TAP_next(self, gcmd: Optional[GCodeCommand] = None):
         self._log_debug("\nEDDYng Tap begin")
@@ -1806,11 +2288,18 @@ class ProbeEddy:
         use_median: bool = gcmd.get_int("USE_MEDIAN", 1 if self.params.tap_use_median else 0) == 1
         home_z: bool = gcmd.get_int("HOME_Z", 1) == 1
         write_plot_arg: int = gcmd.get_int("PLOT", None)
+        pipeline: bool = gcmd.get_int("PIPELINE", 1 if self.params.tap_pipeline else 0) == 1
 
         mode = gcmd.get("MODE", self.params.tap_mode).lower()
         if mode not in ("wma", "butter"):
             raise self._printer.command_error(f"Invalid mode: {mode}")
 
+        offset_method = gcmd.get("OFFSET_METHOD", self.params.tap_offset_method).lower()
+        if offset_method not in ("static", "descent"):
+            raise self._printer.command_error(f"Invalid OFFSET_METHOD: {offset_method}")
+        # the tap descents can only stand in for a static reading at the same drive current
+        offset_from_descent = offset_method == "descent" and tap_drive_current == orig_drive_current
+
         # if the mode is different than the params, then require
         # specifying threshold
         if tap_threshold is None:
@@ -1829,54 +2318,57 @@ class ProbeEddy:
             write_tap_plot = write_plot_arg > 0
             write_every_tap_plot = write_plot_arg > 1
 
+        if pipeline and write_tap_plot:
+            self._log_info("Tap plots need a sampler per tap; not pipelining taps")
+            pipeline = False
+
+        # Pipelined taps after the first start from (and retract to) just above where
+        # the tap detection is armed, and have to pass through there first
+        retract_z = tap_start_z
+        pipeline_tapcfg = None
+        if pipeline:
+            retract_z = min(tap_start_z, self.params.tap_trigger_safe_start_height + self.params.tap_retract_margin)
+
         tapcfg = ProbeEddy.TapConfig(mode=mode, threshold=tap_threshold)
-        # fmt: off
         if mode == "butter":
-            if self.params.is_default_butter_config() and self._sensor._data_rate == 250:
-                sos = [
-                    [ 0.046131802093312926, 0.09226360418662585, 0.046131802093312926, 1.0, -1.3297767184682712, 0.5693902189294331, ],
-                    [ 1.0, -2.0, 1.0, 1.0, -1.845000600983779, 0.8637525213328747, ],
-                ]
-            elif self.params.is_default_butter_config() and self._sensor._data_rate == 500:
-                sos = [
-                    [ 0.013359200027856505, 0.02671840005571301, 0.013359200027856505, 1.0, -1.686278256753083, 0.753714473246724, ],
-                    [ 1.0, -2.0, 1.0, 1.0, -1.9250515947328444, 0.9299234737648037, ],
-                ]
-            elif scipy:
-                sos = scipy.signal.butter(
-                    self.params.tap_butter_order,
-                    [ self.params.tap_butter_lowcut, self.params.tap_butter_highcut, ],
-                    btype="bandpass",
-                    fs=self._sensor._data_rate,
-                    output="sos",
-                ).tolist()
-            else:
-                raise self._printer.command_error("Scipy is not available, cannot use custom filter, or data rate is not 250 or 500")
-            tapcfg.sos = sos
-        # fmt: on
+            tapcfg.sos = self._tap_butter_sos(
+                self.params.tap_butter_lowcut, self.params.tap_butter_highcut, self.params.tap_butter_order
+            )
+        if pipeline:
+            pipeline_tapcfg = replace(tapcfg, safe_height=min(retract_z, self.params.home_trigger_height))
 
         results = []
+        crossings = []
         tap_z = None
         tap_stddev = None
         tap_overshoot = None
         sample_err_count = 0
         tap = None
+        sequence_sampler = None
 
         try:
             self._sensor.set_drive_current(tap_drive_current)
 
             sample_last_err = None
 
-            for sample_i in range(max_samples):
+            if pipeline:
+                # the tap homing moves use this sampler instead of starting their own
                 if self.params.debug:
+                    self.save_samples_path = "/tmp/tap-samples.csv"
+                sequence_sampler = self.start_sampler()
+                self._endstop_wrapper.shared_sampler = sequence_sampler
+
+            for sample_i in range(max_samples):
+                if self.params.debug and not pipeline:
                     self.save_samples_path = f"/tmp/tap-samples-{sample_i+1}.csv"
 
                 tap = self.do_one_tap(
-                    start_z=tap_start_z,
+                    start_z=tap_start_z if sample_i == 0 else retract_z,
                     target_z=target_z,
                     tap_speed=tap_speed,
                     lift_speed=lift_speed,
-                    tapcfg=tapcfg,
+                    tapcfg=pipeline_tapcfg if pipeline and sample_i > 0 else tapcfg,
+                    retract_z=retract_z,
                 )
 
                 if write_every_tap_plot:
@@ -1892,9 +2384,14 @@ class ProbeEddy:
                         self._log_msg(f"Tap {sample_i+1}: failed ({tap.error})")
                     sample_err_count += 1
                     sample_last_err = tap
+                    if len(results) + (max_samples - sample_i - 1) < samples:
+                        # not enough taps left to get a result
+                        break
                     continue
 
                 results.append(tap)
+                if offset_from_descent and not pipeline:
+                    crossings.append(self._tap_offset_samples(self._last_sampler))
 
                 self._log_msg(f"Tap {sample_i+1}: z={tap.probe_z:.3f}")
                 self._log_debug(
@@ -1913,6 +2410,11 @@ class ProbeEddy:
                     if tap_z is not None:
                         break
         finally:
+            if sequence_sampler is not None:
+                self._endstop_wrapper.shared_sampler = None
+                sequence_sampler.finish()
+                if offset_from_descent:
+                    crossings.append(self._tap_offset_samples(sequence_sampler))
             self.reset_drive_current()
             if write_tap_plot and not write_every_tap_plot and tap:
                 try:
@@ -1975,17 +2477,31 @@ class ProbeEddy:
         # Probes happen at absolute z=z_offset, so this doesn't take into account the
         # tap_z computed above. This does mean that the actual physical height probing happens at
         # is not likely to be exactly the same as the Z position, but all we care about is
-        # variance from that position so this should be fine.
+        #
+        # With OFFSET_METHOD=descent, the tap descents (or a quick pass, if they were
+        # at a different drive current) already went through that height, so the
+        # offset comes from their samples around it instead.
         self._sensor.set_drive_current(orig_drive_current)
-        th_now = th.get_position()
-        th.manual_move([None, None, self.params.home_trigger_height + 1.0], lift_speed)
-        th.manual_move([th_now[0] - self.params.x_offset, th_now[1] - self.params.y_offset, None], self.params.move_speed)
-        th.manual_move([None, None, self.params.home_trigger_height], self.params.probe_speed)
-        th.dwell(0.500)
-        th.wait_moves()
+        tap_offset = None
+        if offset_method == "descent":
+            if offset_from_descent:
+                # the descents' Z is from before homing to the tap
+                tap_offset = self._tap_offset_from_samples(crossings, computed_tap_z if home_z else 0.0)
+            else:
+                tap_offset = self._tap_offset_pass(lift_speed)
+            if tap_offset is None:
+                self._log_warning("Not enough samples near home_trigger_height for the sensor offset; taking a static reading")
+
+        if tap_offset is None:
+            th_now = th.get_position()
+            th.manual_move([None, None, self.params.home_trigger_height + 1.0], lift_speed)
+            th.manual_move([th_now[0] - self.params.x_offset, th_now[1] - self.params.y_offset, None], self.params.move_speed)
+            th.manual_move([None, None, self.params.home_trigger_height], self.params.probe_speed)
+            th.wait_moves()
 
-        result = self.probe_static_height()
-        self._tap_offset = float(self.params.home_trigger_height - result.value)
+            result = self.probe_static_height()
+            tap_offset = self.params.home_trigger_height - result.value
+        self._tap_offset = float(tap_offset)
 
         self._log_msg(
             f"Probe computed tap at {computed_tap_z:.3f} (tap at z={tap_z:.3f}, "
@@ -2000,42 +2516,104 @@ class ProbeEddy:
 
         self._log_debug("EDDYng Tap end\n")
 
+    # Samples within TAP_OFFSET_BAND of home_trigger_height give the sensor offset
+    # there; TAP_OFFSET_MARGIN more is kept from the tap descents, whose Z is only
+    # known up to the tap's homing adjustment until all the taps are done.
+    TAP_OFFSET_BAND = 0.250
+    TAP_OFFSET_MARGIN = 0.500
+    TAP_OFFSET_MIN_SAMPLES = 5
+
+    # The (toolhead z, sensor height) of a finished sampler's samples near
+    # home_trigger_height, with the toolhead z from the trapq.
+    def _tap_offset_samples(self, sampler: ProbeEddySampler) -> Tuple[np.ndarray, np.ndarray]:
+        heights = sampler.heights
+        if heights is None or len(heights) == 0:
+            return np.empty(0), np.empty(0)
+        positions, _ = self._get_trapq_positions(sampler.times[: len(heights)])
+        zs = positions[:, 2]
+        near = np.isfinite(heights) & (np.abs(zs - self.params.home_trigger_height) <= self.TAP_OFFSET_BAND + self.TAP_OFFSET_MARGIN)
+        return zs[near], heights[near]
+
+    # The sensor offset at home_trigger_height from samples taken while moving
+    # through it: the median difference between the toolhead z (less z_shift)
+    # and the sensor's height. None if there are too few samples.
+    def _tap_offset_from_samples(self, samples: List[Tuple[np.ndarray, np.ndarray]], z_shift: float) -> Optional[float]:
+        if not samples:
+            return None
+        zs = np.concatenate([zs for zs, _ in samples]) - z_shift
+        heights = np.concatenate([heights for _, heights in samples])
+        near = np.abs(zs - self.params.home_trigger_height) <= self.TAP_OFFSET_BAND
+        if np.count_nonzero(near) < self.TAP_OFFSET_MIN_SAMPLES:
+            return None
+        offset = float(np.median(zs[near] - heights[near]))
+        self._log_debug(f"tap offset from {np.count_nonzero(near)} samples: {offset:.4f}")
+        return offset
+
+    # A quick pass down through home_trigger_height and back up to it, at the
+    # current drive current, for the sensor offset there. Going both ways evens
+    # out the sensor's lag behind the toolhead.
+    def _tap_offset_pass(self, lift_speed: float) -> Optional[float]:
+        th = self._toolhead
+        z = self.params.home_trigger_height
+        th.wait_moves()
+        with self.start_sampler() as sampler:
+            th.manual_move([None, None, z + 1.0], lift_speed)
+            th.manual_move([None, None, z - self.TAP_OFFSET_BAND], self.params.probe_speed)
+            th.manual_move([None, None, z], self.params.probe_speed)
+            th.wait_moves()
+            sampler.wait_for_sample_at_time(th.get_last_move_time(), raise_error=False)
+            sampler.finish()
+        return self._tap_offset_from_samples([self._tap_offset_samples(sampler)], 0.0)
+
     # Compute the average tap_z from a set of tap results, taking a cluster of samples
     # from the result that has the lowest standard deviation
     def _compute_tap_z(self, taps: List[ProbeEddy.TapResult], samples: int, req_stddev: float, use_median: bool) -> Tuple[float, float, float]:
         if len(taps) < samples:
             return None, None, None
 
-        tap_z = math.inf
-        std_min = math.inf
-        overshoot = math.inf
-        for cluster in combinations(taps, samples):
-            tap_zs = np.array([t.probe_z for t in cluster])
-            overshoots = np.array([t.overshoot for t in cluster])
-            std = np.std(tap_zs)
-            if std < std_min:
-                std_min = std
-                if use_median:
-                    # we need the corresponding overshoot as well, so
-                    # can't just use np.median().
-                    sorted_indices = np.argsort(tap_zs)
-                    idx = len(tap_zs) // 2
-                    tap_z = tap_zs[sorted_indices[idx]]
-                    overshoot = overshoots[sorted_indices[idx]]
-                else:
-                    tap_z = np.mean(tap_zs)
-                    overshoot = np.mean(overshoots)
+        # The tightest cluster of `samples` values is always a contiguous run
+        # of the sorted values, so slide a window over them, using running sums
+        # for the variance of each window.
+        order = np.argsort([t.probe_z for t in taps], kind="stable")
+        tap_zs = np.array([taps[i].probe_z for i in order])
+        overshoots = np.array([taps[i].overshoot for i in order])
+
+        # center first to keep the sums well conditioned
+        centered = tap_zs - np.mean(tap_zs)
+        s1 = np.concatenate(([0.0], np.cumsum(centered)))
+        s2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+        win_mean = (s1[samples:] - s1[:-samples]) / samples
+        win_var = (s2[samples:] - s2[:-samples]) / samples - win_mean * win_mean
+        if samples > 1:
+            start = int(np.argmin(win_var))
+        else:
+            # every single tap is an equally tight "cluster"; the first tap wins
+            tap_zs = np.array([t.probe_z for t in taps])
+            overshoots = np.array([t.overshoot for t in taps])
+            start = 0
+        end = start + samples
+
+        std_min = np.std(tap_zs[start:end])
+        if use_median:
+            # we need the corresponding overshoot as well, so
+            # can't just use np.median().
+            idx = start + samples // 2
+            tap_z = tap_zs[idx]
+            overshoot = overshoots[idx]
+        else:
+            tap_z = np.mean(tap_zs[start:end])
+            overshoot = np.mean(overshoots[start:end])
 
         if std_min <= req_stddev:
             return float(tap_z), float(std_min), float(overshoot)
         else:
             return None, float(std_min), None
 
-    # Write a tap plot. This also has logic to compute the averages
-    # and the filter mostly-exactly how it's done on the probe MCU itself
-    # (vs using numpy or similar) to make these graphs more reprensetative
+    # Write a tap plot, in the background. The samples are collected here, and
+    # the plot (including the firmware's view of the tap) is built and written
+    # by probe_eddy_ng_plots.write_tap_plot in the executor.
     def _write_tap_plot(self, tap: ProbeEddy.TapResult, tapnum: int = -1):
-        if not plotly:
+        if not have_plotly():
             return
 
         if tapnum == -1:
@@ -2051,123 +2629,40 @@ class ProbeEddy:
         if tapplot_path_png and os.path.exists(tapplot_path_png):
             os.remove(tapplot_path_png)
 
-        if not self._last_sampler or not self._last_sampler.times:
+        if not self._last_sampler or self._last_sampler.raw_count == 0:
             return
 
-        s_t = np.asarray(self._last_sampler.times)
-        s_f = np.asarray(self._last_sampler.freqs)
-        s_z = np.asarray(self._last_sampler.heights)
-        s_kinz = np.vectorize(lambda t: self._get_trapq_height(t) or -10)(s_t)
-
-        # Any values below 0.0 are suspect because they were not calibrated,
-        # and so are just extrapolated from the fit. Show them differently.
-        s_lowz = np.ma.masked_where(s_z >= 0, s_z)
-        s_z = np.ma.masked_where(s_z < 0, s_z)
-
+        s_t = self._last_sampler.times
         time_start = s_t.min()
-
-        # normalize times to start at 0
-        s_t = s_t - time_start
         tap_start_time = self._last_sampler.memos.get("tap_start_time", time_start) - time_start
         tap_end_time = self._last_sampler.memos.get("trigger_time", time_start) - time_start
-        trigger_time = tap_start_time + (tap_end_time - tap_start_time) * self.params.tap_time_position
-        tap_threshold = self._last_sampler.memos.get("tap_threshold", 0)
-
-        time_len = s_t.max()
 
-        # compute the butterworth filter, if we have scipy
-        if tap is not None and scipy:
-            butter_s_t, butter_s_v = self._compute_butter_tap(self._last_sampler)
-            butter_s_t = butter_s_t - time_start
-        else:
-            butter_s_t = butter_s_v = None
-
-        # Do this roughly how the C code does it, to keep the values identical
-        # TODO Just report the value from the mcu?
-        butter_accum = None
-        if butter_s_v is not None:
-            # Note: we don't handle freq offset or
-            # start this at same point as the C code does
-            butter_accum = np.zeros(len(butter_s_v))
-            last_value = butter_s_v[0]
-            falling = False
-            accum_val = 0.0
-            for bi, bv in enumerate(butter_s_v):
-                if bv <= last_value:
-                    falling = True
-                    accum_val += last_value - bv
-                elif falling and bv > last_value:
-                    falling = False
-                    accum_val = 0.0
-                butter_accum[bi] = accum_val
-                last_value = bv
-
-        import plotly.graph_objects as go
-
-        (c_red, c_lt_red) = ('#9e4058', '#C2697F')
-        (c_orange, c_lt_orange) = ('#d0641e', '#E68E54')
-        (c_yellow, c_lt_yellow) = ('#f9ab0e', '"#FBC559')
-        (c_green, c_lt_green) = ('#589e40', '#7FC269')
-        (c_blue, c_lt_blue) = ('#2c3778', '#4151B0')
-        (c_purple, c_lt_purple) = ('#513965', '#785596')
-
-        fig = go.Figure()
-
-        # fmt: off
-        if tap_start_time > 0:
-            fig.add_shape(type="line", x0=tap_start_time, x1=tap_start_time, y0=0, y1=1,
-                          xref="x", yref="paper", line=dict(color=c_purple, width=2),)
-        if trigger_time > 0:
-            fig.add_shape(type="line", x0=trigger_time, x1=trigger_time, y0=0, y1=1,
-                          xref="x", yref="paper", line=dict(color=c_lt_orange, width=2),)
-        if tap_end_time > 0:
-            fig.add_shape(type="line", x0=tap_end_time, x1=tap_end_time, y0=0, y1=1,
-                          xref="x", yref="paper", line=dict(color=c_purple, width=2),)
-        if tap_threshold > 0:
-            fig.add_shape(type="line", x0=0, x1=1, y0=tap_threshold, y1=tap_threshold,
-                          xref="paper", yref="y3", line=dict(color="gray", width=1, dash="dash"),)
-
-        fig.add_shape(type="line", x0=0, x1=1, y0=tap.probe_z, y1=tap.probe_z,
-                      xref="paper", yref="y", line=dict(color=c_lt_orange, width=1),)
-
-        # Computed Z, Toolhead Z, Sensor F
-        fig.add_trace(go.Scatter(x=s_t, y=s_z, mode="lines", name="Z", line=dict(color=c_blue)))
-        fig.add_trace(go.Scatter(x=s_t, y=s_lowz, mode="lines", name="Z (low)", line=dict(color=c_lt_blue, dash="dash")))
-        fig.add_trace(go.Scatter(x=s_t, y=s_kinz, mode="lines", name="KinZ", line=dict(color=c_lt_red)))
-        fig.add_trace(go.Scatter(x=s_t, y=s_f, mode="lines", name="Freq", yaxis="y2", line=dict(color=c_orange)))
-
-        # the butter tap if we have the data
-        if butter_s_t is not None:
-            fig.add_trace(go.Scatter(x=butter_s_t, y=butter_s_v, mode="lines", name="signal", yaxis="y4", line=dict(color=c_green)))
-            fig.add_trace(go.Scatter(x=butter_s_t, y=butter_accum, mode="lines", name="threshold", yaxis="y3", line=dict(color="#626b73")))
-
-        fig.update_xaxes(range=[max(0.0, time_len - 0.60), time_len], autorange=False)
-
-        fig.update_layout(
-            hovermode="x unified",
-            title=dict(text=f"Tap {tapnum+1}: {tap.probe_z:.3f}"),
-            yaxis=dict(title="Z", side="right"),  # Z axis
-            yaxis2=dict(overlaying="y", title="Freq", tickformat="d", side="left"),  # Freq + WMA
-            yaxis3=dict(overlaying="y", side="left", tickformat="d", position=0.2),  # derivatives, tap accum
-            yaxis4=dict(overlaying="y", side="right", showticklabels=False),  # filter
-            height=800,
+        tap_config = self._last_sampler.memos.get("tap_config")
+        plot = ProbeEddyTapPlot(
+            title=f"Tap {tapnum+1}: {tap.probe_z:.3f}",
+            path_png=tapplot_path_png,
+            path_html=tapplot_path_html,
+            time_start=time_start,
+            times=s_t,
+            freqs=self._last_sampler.freqs,
+            heights=self._last_sampler.heights,
+            kin_z=np.nan_to_num(self._get_trapq_positions(s_t)[0][:, 2], nan=-10.0),
+            probe_z=tap.probe_z,
+            tap_start_time=tap_start_time,
+            trigger_time=tap_start_time + (tap_end_time - tap_start_time) * self.params.tap_time_position,
+            tap_end_time=tap_end_time,
+            tap_threshold=self._last_sampler.memos.get("tap_threshold", 0),
+            tap_model=self._tap_model(self._last_sampler) if tap_config is not None else None,
+            tap_sos=tap_config.sos if tap_config is not None and tap_config.mode == "butter" else None,
         )
-        # fmt: on
 
-        timg = 0.0
-        thtml = 0.0
-        if tapplot_path_png:
-            t0 = time.time()
-            try:
-                fig.write_image(tapplot_path_png)
-            except:
-                tapplot_path_png = None
-            timg = time.time() - t0
-        if tapplot_path_html:
-            t0 = time.time()
-            fig.write_html(tapplot_path_html, include_plotlyjs="cdn")
-            thtml = time.time() - t0
-        self._log_info(f"Wrote tap plot to {tapplot_path_png or ''} {tapplot_path_html or ''}  [took {timg:.1f}, {thtml:.1f}]")
+        self._executor.submit(
+            write_plot,
+            ("write_tap_plot", plot),
+            on_done=self._log_info,
+            on_error=lambda e: self._log_error(f"Failed to write tap plot: {e}"),
+            key=tapplot_path_html,
+        )
 
     def cmd_START_STREAM(self, gcmd):
         self.save_samples_path = "/tmp/stream.csv"
@@ -2187,6 +2682,10 @@ class ProbeEddy:
 # z_offset/home_trigger_height).
 @final
 class ProbeEddyScanningProbe:
+    ON_THE_FLY_SPREAD = 0.010
+    # points under this confidence are called out after probing on the fly
+    ON_THE_FLY_LOW_CONFIDENCE = 0.5
+
     def __init__(self, eddy: ProbeEddy, gcmd: GCodeCommand):
         self.eddy = eddy
         self._printer = eddy._printer
@@ -2205,7 +2704,21 @@ class ProbeEddyScanningProbe:
         # how much to dwell at each sample position in addition to sample_time
         self._sample_time_delay = self.eddy.params.scan_sample_time_delay
         self._sample_time: float = gcmd.get_float("SAMPLE_TIME", self.eddy.params.scan_sample_time, above=0.0)
-        self._is_rapid = gcmd.get("METHOD", "automatic").lower() == "rapid_scan"
+        method = gcmd.get("METHOD", "automatic").lower()
+        self._is_rapid = method == "rapid_scan"
+        # non-rapid probing either stops at each point, or takes the reading as
+        # the toolhead passes through it
+        if method in ("on_the_fly", "dwell"):
+            self._on_the_fly = method == "on_the_fly"
+        else:
+            self._on_the_fly = self.eddy.params.scan_on_the_fly and not self._is_rapid
+        self._max_travel = self.eddy.params.scan_on_the_fly_max_travel
+
+        # on the fly, the confidence (0..1) of each point of the last
+        # pull_probed_results: the fraction of a full scan_sample_time's worth of
+        # samples its window got, lowered if the heights in it spread by more
+        # than ON_THE_FLY_SPREAD
+        self.confidences: List[float] = []
 
         self._sampler: ProbeEddySampler = None
 
@@ -2249,13 +2762,19 @@ class ProbeEddyScanningProbe:
             self._toolhead.register_lookahead_callback(lambda time: self._rapid_lookahead_cb(time, th_pos))
             return
 
+        if self._on_the_fly:
+            # the same, but the position (and the sample window) comes from the
+            # trapq once the toolhead has been there
+            self._toolhead.register_lookahead_callback(lambda time: self._rapid_lookahead_cb(time, None))
+            return
+
         th.dwell(self._sample_time_delay)
         start_time = th.get_last_move_time()
         self._toolhead.dwell(self._sample_time + self._sample_time_delay)
         self._notes.append((start_time, start_time + self._sample_time / 2.0, th_pos))
 
     def pull_probed_results(self):
-        if self._is_rapid:
+        if self._is_rapid or self._on_the_fly:
             # Flush lookahead (so all lookahead callbacks are invoked)
             self._toolhead.get_last_move_time()
 
@@ -2268,14 +2787,41 @@ class ProbeEddyScanningProbe:
         results = []
 
         logging.info(f"ProbeEddyScanningProbe: pulling {len(self._notes)} results")
-        for start_time, sample_time, th_pos in self._notes:
+
+        # resolve all of the points at once
+        start_times = np.array([note[0] for note in self._notes])
+        end_times = start_times + self._sample_time
+
+        # (notes are in time order)
+        missing_pos = [i for i, note in enumerate(self._notes) if note[2] is None]
+        kin_pos = {}
+        if missing_pos:
+            positions, _ = self.eddy._get_trapq_positions(np.array([self._notes[i][1] for i in missing_pos]))
+            kin_pos = dict(zip(missing_pos, positions))
+
+        if self._on_the_fly:
+            # centre each window on when the toolhead was at the point
+            pass_times = np.array([note[1] for note in self._notes])
+            half_window = self._on_the_fly_half_windows(pass_times)
+            start_times = pass_times - half_window
+            end_times = pass_times + half_window
+
+        stats = self._sampler.query_intervals(start_times, end_times)
+        empty = np.flatnonzero(stats.count == 0)
+        if len(empty) > 0:
+            raise self._printer.command_error(f"no samples between time {start_times[empty[0]]:.1f} and {end_times[empty[0]]:.1f}!")
+
+        if self._on_the_fly:
+            self._report_confidence(stats, [kin_pos[i] for i in range(len(self._notes))], half_window)
+
+        for i, (start_time, sample_time, th_pos) in enumerate(self._notes):
             if th_pos is None:
-                th_pos, _ = self.eddy._get_trapq_position(sample_time)
-                if th_pos is None:
+                th_pos = kin_pos[i]
+                if np.isnan(th_pos[0]):
                     raise self._printer.command_error(f"No trapq history found for {sample_time:.3f} and no position!")
+                th_pos = th_pos.tolist()
 
-            end_time = start_time + self._sample_time
-            height = self._sampler.find_height_at_time(start_time, end_time)
+            height = float(stats.median[i])
 
             if not math.isclose(th_pos[2], self._scan_z, rel_tol=1e-3):
                 logging.info(
@@ -2315,6 +2861,61 @@ class ProbeEddyScanningProbe:
 
         return results
 
+    # Half of the sample window around each pass time: half of scan_sample_time,
+    # narrowed (by bisection) until the toolhead is at most max_travel / 2 from
+    # the point at both ends of the window. This goes by the trapq positions
+    # rather than the speed at the point, which at a change of direction is
+    # about the square corner velocity and says nothing about how quickly the
+    # toolhead moves away afterwards.
+    ON_THE_FLY_WINDOW_STEPS = 12
+
+    def _on_the_fly_half_windows(self, pass_times: np.ndarray) -> np.ndarray:
+        full = np.full(len(pass_times), self._sample_time / 2.0)
+        moves = self.eddy._extract_trapq_moves(float(pass_times.min() - full[0]), float(pass_times.max() + full[0]))
+        if not moves:
+            return full
+        moves = ProbeEddyTrapqMoves.from_moves(moves)
+        at_point, _ = moves.positions(pass_times)
+        limit = self._max_travel / 2.0
+
+        def fits(half: np.ndarray) -> np.ndarray:
+            before, _ = moves.positions(pass_times - half)
+            after, _ = moves.positions(pass_times + half)
+            travel = np.maximum(np.linalg.norm(before - at_point, axis=1), np.linalg.norm(after - at_point, axis=1))
+            return np.nan_to_num(travel, nan=0.0) <= limit
+
+        # the largest half window known to fit, and the smallest known not to
+        lo = np.where(fits(full), full, 0.0)
+        hi = full
+        for _ in range(self.ON_THE_FLY_WINDOW_STEPS):
+            mid = (lo + hi) / 2.0
+            ok = fits(mid)
+            lo = np.where(ok, mid, lo)
+            hi = np.where(ok, hi, mid)
+        return lo
+
+    def _report_confidence(self, stats: ProbeEddyIntervalStats, positions: List[np.ndarray], half_window: np.ndarray):
+        full_count = self._sample_time * self.eddy._sensor._data_rate
+        spread = np.maximum(stats.max - stats.min, self.ON_THE_FLY_SPREAD)
+        confidence = np.minimum(1.0, stats.count / full_count) * (self.ON_THE_FLY_SPREAD / spread)
+        self.confidences = confidence.tolist()
+
+        for i, pos in enumerate(positions):
+            self.eddy._log_info(
+                f"on the fly point {i} at ({pos[0]:.1f}, {pos[1]:.1f}): {2000.0 * half_window[i]:.0f} ms window, {stats.count[i]} samples, "
+                f"spread {stats.max[i] - stats.min[i]:.4f}, confidence {confidence[i]:.2f}"
+            )
+
+        worst = int(np.argmin(confidence))
+        msg = f"Probed {len(confidence)} points on the fly, confidence {confidence.min():.2f} to {confidence.max():.2f}"
+        if confidence[worst] < self.ON_THE_FLY_LOW_CONFIDENCE:
+            pos = positions[worst]
+            msg += (
+                f"; lowest at ({pos[0]:.1f}, {pos[1]:.1f}), with a {2000.0 * half_window[worst]:.0f} ms window "
+                f"for {self._max_travel:.1f} mm of travel. Consider probing slower."
+            )
+        self.eddy._log_msg(msg)
+
 
 # This is a ProbeEndstopWrapper-compatible class,
 # which also forwards the "mcu_probe" methods.
@@ -2337,6 +2938,9 @@ class ProbeEddyEndstopWrapper:
         # if not None, after a probe session is finished we'll
         # write all samples here
         self.save_samples_path: Optional[str] = None
+        # if not None, homing moves use this sampler (which the owner
+        # finishes) instead of starting and finishing their own
+        self.shared_sampler: Optional[ProbeEddySampler] = None
 
         self._multi_probe_in_progress = False
 
@@ -2382,7 +2986,7 @@ class ProbeEddyEndstopWrapper:
     def _handle_homing_move_begin(self, hmove):
         if self not in hmove.get_mcu_endstops():
             return
-        self._sampler = self.eddy.start_sampler()
+        self._sampler = self.shared_sampler or self.eddy.start_sampler()
         self._homing_in_progress = True
         # if we're doing a tap, we're already in the right position;
         # otherwise move there
@@ -2392,7 +2996,8 @@ class ProbeEddyEndstopWrapper:
     def _handle_homing_move_end(self, hmove):
         if self not in hmove.get_mcu_endstops():
             return
-        self._sampler.finish()
+        if self._sampler is not self.shared_sampler:
+            self._sampler.finish()
         self._homing_in_progress = False
 
     def _handle_home_rails_end(self, homing_state, rails):
@@ -2454,7 +3059,8 @@ class ProbeEddyEndstopWrapper:
             # start
             safe_time = 0
             # initial freq to pass through
-            safe_freq = self.eddy.height_to_freq(self._home_trigger_height)
+            safe_height = self.tap_config.safe_height
+            safe_freq = self.eddy.height_to_freq(safe_height if safe_height is not None else self._home_trigger_height)
             # second freq to pass through; toolhead acceleration
             # must be smooth after this point
             trigger_freq = self.eddy.height_to_freq(self.eddy.params.tap_trigger_safe_start_height)
@@ -2462,6 +3068,11 @@ class ProbeEddyEndstopWrapper:
         trigger_completion = self._dispatch.start(print_time)
 
         if self.tap_config is not None:
+            # what the firmware tap detection was set up with, for replaying it
+            self._sampler.memo("tap_config", self.tap_config)
+            self._sampler.memo("tap_safe_freq", safe_freq)
+            self._sampler.memo("tap_trigger_freq", trigger_freq)
+
             if self.tap_config.mode == "butter":
                 sos = self.tap_config.sos
                 assert sos
@@ -2569,6 +3180,359 @@ class ProbeEddyEndstopWrapper:
         self._sampler = None
 
 
+# Runs work in forked worker processes, so that the reactor (and with it the
+# mcu connections) keeps running while it's done. Jobs are given snapshots of
+# everything they need, since the workers can't see any printer state, and
+# their results are delivered back on the reactor through the job's callbacks.
+#
+# At most max_queued jobs wait to be started. Submitting a job with the same
+# key as one that hasn't started yet cancels the older one, and jobs with the
+# same key never run at the same time (so e.g. plots of the same file are
+# written in order). The workers are forked when there's a job for them and
+# stopped after they've been idle for IDLE_TIMEOUT.
+@final
+class ProbeEddyExecutor:
+    POLL_INTERVAL = 0.050
+    WAIT_REPORT_INTERVAL = 5.0
+    IDLE_TIMEOUT = 60.0
+    # How long map() and call() give each job once it's started. A worker that
+    # dies (killed for memory, or crashing) takes its job with it without the
+    # pool ever saying so, so this is how that's noticed.
+    JOB_TIMEOUT = 60.0
+
+    @final
+    class Job:
+        def __init__(self, fn, args: tuple, key: Optional[str], on_done: Optional[Callable], on_error: Optional[Callable]):
+            self.fn = fn
+            self.args = args
+            self.key = key
+            self.on_done = on_done
+            self.on_error = on_error
+            # the pool's AsyncResult, once started
+            self.result = None
+            self.cancelled = False
+            self.finished = False
+            # if set, seconds it may run for before it's given up on, and
+            # whether it's then run here instead of failing
+            self.timeout: Optional[float] = None
+            self.inline_on_timeout = False
+            self.deadline: Optional[float] = None
+
+    # Stands in for the pool's AsyncResult of a job that was given up on
+    @final
+    class InlineResult:
+        def __init__(self, value=None, error: Optional[Exception] = None):
+            self._value = value
+            self._error = error
+
+        @classmethod
+        def run(cls, fn, args: tuple) -> ProbeEddyExecutor.InlineResult:
+            try:
+                return cls(fn(*args))
+            except Exception as e:
+                return cls(error=e)
+
+        def ready(self) -> bool:
+            return True
+
+        def get(self):
+            if self._error is not None:
+                raise self._error
+            return self._value
+
+    def __init__(self, eddy: ProbeEddy, workers: int = 1, max_queued: int = 8):
+        self._eddy = eddy
+        self._reactor = eddy._reactor
+        self.workers = workers
+        self.max_queued = max_queued
+
+        self._pool = None
+        self._timer = None
+        self._last_active = 0.0
+        self._queued: List[ProbeEddyExecutor.Job] = []
+        self._running: List[ProbeEddyExecutor.Job] = []
+
+    # Queue fn(*args) to run in a worker. on_done(result) or on_error(exception)
+    # is called on the reactor once it's finished, unless it's been cancelled.
+    # If the queue is full, this waits (with the reactor running) for room.
+    def submit(
+        self,
+        fn,
+        args: tuple,
+        on_done: Optional[Callable] = None,
+        on_error: Optional[Callable] = None,
+        key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        inline_on_timeout: bool = False,
+    ) -> ProbeEddyExecutor.Job:
+        if key is not None:
+            for job in [j for j in self._queued if j.key == key]:
+                self.cancel(job)
+
+        eventtime = self._reactor.monotonic()
+        while len(self._queued) >= self.max_queued:
+            eventtime = self._reactor.pause(eventtime + self.POLL_INTERVAL)
+
+        job = ProbeEddyExecutor.Job(fn, args, key, on_done, on_error)
+        job.timeout = timeout
+        job.inline_on_timeout = inline_on_timeout
+        self._queued.append(job)
+        self._dispatch()
+        return job
+
+    # Drop a job's callbacks. Returns True if it hadn't started yet (so it
+    # never will); a job that's already running finishes, but its result is
+    # discarded.
+    def cancel(self, job: ProbeEddyExecutor.Job) -> bool:
+        job.cancelled = True
+        if job in self._queued:
+            self._queued.remove(job)
+            job.finished = True
+            return True
+        return False
+
+    # Run fn(*args) for each args in tasks, and return the results in order. The
+    # reactor keeps running while waiting for them so the printer stays
+    # responsive. Raises the first error any of them raised. A job still running
+    # after timeout seconds is run here instead, or with inline=False, fails.
+    def map(self, fn, tasks: list, timeout: Optional[float] = JOB_TIMEOUT, inline: bool = True) -> list:
+        results = [None] * len(tasks)
+        errors = []
+
+        def on_done(i, result):
+            results[i] = result
+
+        jobs = [
+            self.submit(fn, args, on_done=lambda r, i=i: on_done(i, r), on_error=errors.append, timeout=timeout, inline_on_timeout=inline)
+            for i, args in enumerate(tasks)
+        ]
+
+        eventtime = last_report_time = self._reactor.monotonic()
+        while not all(job.finished for job in jobs):
+            if eventtime > last_report_time + self.WAIT_REPORT_INTERVAL:
+                last_report_time = eventtime
+                self._eddy._gcode.respond_info("Waiting for calculations...", log=False)
+            eventtime = self._reactor.pause(eventtime + self.POLL_INTERVAL)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    # fn(*args) in a worker, waiting for the result
+    def call(self, fn, args: tuple):
+        return self.map(fn, [args])[0]
+
+    # Stop the workers, dropping anything queued or running
+    def shutdown(self):
+        for job in self._queued + self._running:
+            job.cancelled = True
+            job.finished = True
+        self._queued.clear()
+        self._running.clear()
+        if self._timer is not None:
+            self._reactor.unregister_timer(self._timer)
+            self._timer = None
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _new_pool(self):
+        import multiprocessing
+
+        return multiprocessing.get_context("fork").Pool(processes=self.workers)
+
+    def _dispatch(self):
+        running_keys = {job.key for job in self._running if job.key is not None}
+        for job in list(self._queued):
+            if len(self._running) >= self.workers:
+                break
+            if job.key is not None and job.key in running_keys:
+                continue
+            if self._pool is None:
+                self._pool = self._new_pool()
+            self._queued.remove(job)
+            job.result = self._pool.apply_async(job.fn, job.args)
+            if job.timeout is not None:
+                job.deadline = self._reactor.monotonic() + job.timeout
+            self._running.append(job)
+            if job.key is not None:
+                running_keys.add(job.key)
+
+        if self._running or self._queued:
+            if self._timer is None:
+                self._timer = self._reactor.register_timer(self._poll)
+            self._reactor.update_timer(self._timer, self._reactor.monotonic() + self.POLL_INTERVAL)
+
+    def _poll(self, eventtime):
+        timed_out = [j for j in self._running if j.deadline is not None and eventtime > j.deadline and not j.result.ready()]
+        if timed_out:
+            self._drop_pool(timed_out)
+
+        for job in [j for j in self._running if j.result.ready()]:
+            self._running.remove(job)
+            self._complete(job)
+        self._dispatch()
+
+        if self._running or self._queued:
+            self._last_active = eventtime
+            return eventtime + self.POLL_INTERVAL
+        if eventtime < self._last_active + self.IDLE_TIMEOUT:
+            return self._last_active + self.IDLE_TIMEOUT
+
+        # idle; the timer is unregistered here too, so this is never used
+        self.shutdown()
+        return self._reactor.NEVER
+
+    # Give up on the pool: its workers may be gone, taking jobs with them. The
+    # timed out jobs are run here (blocking the reactor, as they did before
+    # there were workers) or fail; the other running jobs go back on the queue
+    # for a new pool.
+    def _drop_pool(self, timed_out: List[ProbeEddyExecutor.Job]):
+        self._eddy._log_warning(f"Background calculation took over {timed_out[0].timeout:.1f}s; restarting the workers")
+        self._pool.terminate()
+        self._pool = None
+
+        requeue = [job for job in self._running if job not in timed_out]
+        for job in requeue:
+            job.result = None
+            job.deadline = None
+        self._queued[:0] = requeue
+        self._running = timed_out
+        for job in timed_out:
+            if job.inline_on_timeout:
+                job.result = ProbeEddyExecutor.InlineResult.run(job.fn, job.args)
+            else:
+                job.result = ProbeEddyExecutor.InlineResult(error=self._eddy._printer.command_error("Background calculation timed out"))
+
+    def _complete(self, job: ProbeEddyExecutor.Job):
+        job.finished = True
+        if job.cancelled:
+            return
+        try:
+            result = job.result.get()
+        except Exception as e:
+            if job.on_error is None:
+                self._eddy._log_error(f"Background calculation failed: {e}")
+                return
+            callback, args = job.on_error, (e,)
+        else:
+            if job.on_done is None:
+                return
+            callback, args = job.on_done, (result,)
+
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception(f"{self._eddy._name}: executor callback failed")
+
+
+# Per-interval statistics from ProbeEddySampler.query_intervals. Each field
+# has one entry per interval; intervals without samples have count 0 and NaN
+# for everything else.
+@dataclass
+class ProbeEddyIntervalStats:
+    count: np.ndarray
+    median: np.ndarray
+    mean: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+
+    def __len__(self):
+        return len(self.count)
+
+
+# Columnar storage for sampler data. Each column is a preallocated numpy
+# array that grows geometrically, so appending a batch is an amortized
+# O(batch) copy. The accessors return views over the filled part of each
+# column; the views stay valid (as a snapshot) even after the store grows.
+#
+# Times and raw freqvals are appended as batches arrive from the sensor;
+# freqs and heights are filled in later, up to `converted`, by the sampler.
+@final
+class ProbeEddySampleStore:
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, with_heights: bool = True):
+        self._count = 0
+        self._converted = 0
+        self._capacity = self.INITIAL_CAPACITY
+        self._times = np.empty(self._capacity, dtype=np.float64)
+        self._raw_freqs = np.empty(self._capacity, dtype=np.uint32)
+        self._freqs = np.empty(self._capacity, dtype=np.float64)
+        self._heights = np.empty(self._capacity, dtype=np.float64) if with_heights else None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def converted(self) -> int:
+        return self._converted
+
+    @property
+    def has_heights(self) -> bool:
+        return self._heights is not None
+
+    def _grow(self, needed: int):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+
+        def grown(col):
+            if col is None:
+                return None
+            new_col = np.empty(capacity, dtype=col.dtype)
+            new_col[: self._count] = col[: self._count]
+            return new_col
+
+        self._times = grown(self._times)
+        self._raw_freqs = grown(self._raw_freqs)
+        self._freqs = grown(self._freqs)
+        self._heights = grown(self._heights)
+        self._capacity = capacity
+
+    def append(self, times: np.ndarray, raw_freqs: np.ndarray):
+        n = len(times)
+        if n == 0:
+            return
+        end = self._count + n
+        if end > self._capacity:
+            self._grow(end)
+        self._times[self._count : end] = times
+        self._raw_freqs[self._count : end] = raw_freqs
+        self._count = end
+
+    # Fill in freqs (and heights) for the samples in [converted, count)
+    def set_converted(self, freqs: np.ndarray, heights: Optional[np.ndarray]):
+        start = self._converted
+        end = start + len(freqs)
+        self._freqs[start:end] = freqs
+        if self._heights is not None and heights is not None:
+            self._heights[start:end] = heights
+        self._converted = end
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[: self._count]
+
+    @property
+    def raw_freqs(self) -> np.ndarray:
+        return self._raw_freqs[: self._count]
+
+    @property
+    def freqs(self) -> np.ndarray:
+        return self._freqs[: self._converted]
+
+    @property
+    def heights(self) -> Optional[np.ndarray]:
+        if self._heights is None:
+            return None
+        return self._heights[: self._converted]
+
+
 # Helper to gather samples and convert them to probe positions
 @final
 class ProbeEddySampler:
@@ -2587,20 +3551,41 @@ class ProbeEddySampler:
         self._errors = 0
         self._fmap = eddy.map_for_drive_current() if calculate_heights else None
 
-        self.times = []
-        self.raw_freqs = []
-        self.freqs = []
-        self.heights = [] if self._fmap is not None else None
+        self._store = ProbeEddySampleStore(with_heights=self._fmap is not None)
+
+        # (predicate, completion) pairs for greenlets waiting on samples; woken
+        # from _add_hw_measurement as soon as their predicate holds
+        self._waiters: List[Tuple[Callable[[], bool], Any]] = []
 
         self.memos = dict()
 
+    # The sample columns, as numpy views. freqs and heights are converted
+    # on access, so they always line up with times.
+    @property
+    def times(self) -> np.ndarray:
+        return self._store.times
+
+    @property
+    def raw_freqs(self) -> np.ndarray:
+        return self._store.raw_freqs
+
+    @property
+    def freqs(self) -> np.ndarray:
+        self._update_samples()
+        return self._store.freqs
+
+    @property
+    def heights(self) -> Optional[np.ndarray]:
+        self._update_samples()
+        return self._store.heights
+
     @property
     def raw_count(self):
-        return len(self.times)
+        return self._store.count
 
     @property
     def height_count(self):
-        return len(self.heights) if self.heights else 0
+        return self._store.count if self._store.has_heights else 0
 
     # this is just a handy way to communicate values between different parts of the system,
     # specifically to record things like trigger times for plotting
@@ -2624,19 +3609,37 @@ class ProbeEddySampler:
             return False
 
         self._errors += msg["errors"]
-        data = msg["data"]
 
-        # data is (t, fv)
-        if data:
-            times, raw_freqs = zip(*data)
-        else:
-            times, raw_freqs = [], []
+        if len(msg["times"]) > 0:
+            self._store.append(msg["times"], msg["freqvals"])
 
-        self.times.extend(times)
-        self.raw_freqs.extend(raw_freqs)
+        if self._waiters:
+            self._wake_waiters()
 
         return True
 
+    def _wake_waiters(self):
+        for waiter in list(self._waiters):
+            predicate, completion = waiter
+            if self._stopped or predicate():
+                self._waiters.remove(waiter)
+                completion.complete(True)
+
+    # Block the calling greenlet until predicate() is true, or until the reactor
+    # time waketime. Returns the final value of predicate().
+    def _wait_until(self, predicate: Callable[[], bool], waketime: float) -> bool:
+        while not predicate():
+            if self._stopped or self._reactor.monotonic() >= waketime:
+                return predicate()
+            waiter = (predicate, self._reactor.completion())
+            self._waiters.append(waiter)
+            try:
+                waiter[1].wait(waketime)
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return True
+
     def start(self):
         if self._stopped:
             raise self._printer.command_error("ProbeEddySampler.start() called after finish()")
@@ -2652,22 +3655,24 @@ class ProbeEddySampler:
         if self.eddy._sampler is not self:
             raise self._printer.command_error("ProbeEddySampler.finish(): eddy._sampler is not us!")
         self._update_samples()
-        self.eddy._sampler_finished(self)
+        # memos carry the trigger times of a homing/tap move, which end up in the saved samples
+        self.eddy._sampler_finished(self, **self.memos)
         self._stopped = True
+        self._wake_waiters()
 
     def _update_samples(self):
-        if len(self.freqs) == len(self.raw_freqs):
+        store = self._store
+        if store.converted == store.count:
             return
 
         conv_ratio = self._sensor.freqval_conversion_value()
 
-        start_idx = len(self.freqs)
-        freqs_np = np.asarray(self.raw_freqs[start_idx:]) * conv_ratio
-        self.freqs.extend(freqs_np.tolist())
-
+        raw_freqs = store.raw_freqs[store.converted :]
+        freqs_np = raw_freqs * conv_ratio
+        heights_np = None
         if self._fmap is not None:
-            heights_np = self._fmap.freqs_to_heights_np(freqs_np)
-            self.heights.extend(heights_np.tolist())
+            heights_np = self._fmap.freqvals_to_heights_np(raw_freqs)
+        store.set_converted(freqs_np, heights_np)
 
     @property
     def error_count(self):
@@ -2677,10 +3682,10 @@ class ProbeEddySampler:
     def get_last_height(self) -> float:
         if self.heights is None:
             raise self._printer.command_error("ProbeEddySampler: no height mapping")
-        self._update_samples()
-        if len(self.heights) == 0:
+        heights = self.heights
+        if len(heights) == 0:
             raise self._printer.command_error("ProbeEddySampler: no samples")
-        return self.heights[-1]
+        return float(heights[-1])
 
     # wait for a sample for the current time and get a new height
     def get_height_now(self) -> Optional[float]:
@@ -2700,10 +3705,14 @@ class ProbeEddySampler:
             # if we're not getting any more samples, we can check directly
             if len(self.times) == 0:
                 return report_no_samples()
-            return self.times[-1] >= sample_print_time
+            return bool(self.times[-1] >= sample_print_time)
+
+        def have_sample() -> bool:
+            times = self._store.times
+            return len(times) > 0 and times[-1] >= sample_print_time
 
         # quick check
-        if self.times and self.times[-1] >= sample_print_time:
+        if have_sample():
             return True
 
         wait_start_time = self.eddy._print_time_now()
@@ -2722,18 +3731,46 @@ class ProbeEddySampler:
         self.eddy._log_debug(
             f"EDDYng waiting for sample at {sample_print_time:.3f} (now: {wait_start_time:.3f}, max_wait_time: {max_wait_time:.3f})"
         )
-        now = self.eddy._print_time_now()
-        while len(self.times) == 0 or self.times[-1] < sample_print_time:
-            now = self.eddy._print_time_now()
-            if now - wait_start_time > max_wait_time:
-                return report_no_samples()
-            self._reactor.pause(self._reactor.monotonic() + 0.010)
+        if not self._wait_until(have_sample, self._reactor.monotonic() + max_wait_time):
+            return report_no_samples()
 
+        now = self.eddy._print_time_now()
         if now - wait_start_time > 1.0:
             self.eddy._log_info(f"note: waited {now - wait_start_time:.3f}s for sample")
 
         return True
 
+    SETTLE_MIN_SAMPLES = 5
+
+    # Wait until the readings from start_time on have settled: the last window
+    # seconds of them have a stddev, and a drift (difference between the means
+    # of the window's halves), of at most tolerance. Uses heights if this sampler
+    # has them, freqs otherwise. Gives up once there are samples up to
+    # start_time + timeout. Returns whether they settled.
+    def wait_for_settle(self, start_time: float, tolerance: float, window: float, timeout: float) -> bool:
+        def settled() -> bool:
+            times = self._store.times
+            if len(times) == 0 or times[-1] - window < start_time:
+                return False
+            first = int(np.searchsorted(times, times[-1] - window, side="left"))
+            if len(times) - first < self.SETTLE_MIN_SAMPLES:
+                return False
+            values = (self.heights if self._fmap is not None else self.freqs)[first:]
+            if not np.all(np.isfinite(values)):
+                return False
+            half = len(values) // 2
+            drift = abs(float(np.mean(values[half:]) - np.mean(values[:half])))
+            return float(np.std(values)) <= tolerance and drift <= tolerance
+
+        def timed_out() -> bool:
+            times = self._store.times
+            return len(times) > 0 and times[-1] >= start_time + timeout
+
+        # in case samples stop coming in, stop waiting a bit after the timeout
+        waketime = self._reactor.monotonic() + max(0.0, start_time - self.eddy._print_time_now()) + timeout + 0.250
+        self._wait_until(lambda: settled() or timed_out(), waketime)
+        return settled()
+
     # Wait for some samples to be collected, even if errors
     # TODO: there's a minimum wait time -- we need to fill up the buffer before data is sent, and that
     # depends on the data rate
@@ -2746,95 +3783,756 @@ class ProbeEddySampler:
         raise_error=True,
     ):
         # Make sure enough samples have been collected
-        wait_start_time = self.eddy._print_time_now()
+        def sample_count() -> int:
+            return self._store.count + (self._errors if count_errors else 0)
 
         start_error_count = self._errors
-        start_count = 0
-        if new_only:
-            start_count = len(self.raw_freqs) + (self._errors if count_errors else 0)
-
-        while (len(self.raw_freqs) + (self._errors if count_errors else 0)) - start_count < min_samples:
-            now = self.eddy._print_time_now()
-            if now - wait_start_time > max_wait_time:
-                if raise_error:
-                    raise self._printer.command_error(
-                        f"probe_eddy_ng sensor outage: no samples for {max_wait_time:.2f}s (got {self._errors - start_error_count} errors)"
-                    )
-                return False
-            self._reactor.pause(self._reactor.monotonic() + 0.010)
+        start_count = sample_count() if new_only else 0
 
-        return True
+        if not self._wait_until(lambda: sample_count() - start_count >= min_samples, self._reactor.monotonic() + max_wait_time):
+            if raise_error:
+                raise self._printer.command_error(
+                    f"probe_eddy_ng sensor outage: no samples for {max_wait_time:.2f}s (got {self._errors - start_error_count} errors)"
+                )
+            return False
 
-    def find_heights_at_times(self, intervals):
-        self._update_samples()
-        times = self.times
-        heights = np.asarray(self.heights)
-        num_samples = len(times)
+        return True
 
-        interval_heights = []
-        i = 0
-        for iv_start, iv_end in intervals:
-            while i < num_samples and times[i] < iv_start:
-                i += 1
-            istart = i
+    # Height statistics for many [start, end) time intervals at once
+    def query_intervals(self, starts, ends) -> ProbeEddyIntervalStats:
+        heights = self.heights
+        if heights is None:
+            raise self._printer.command_error("Update samples didn't compute heights")
+        return np_interval_stats(self.times, heights, starts, ends)
 
-            while i < num_samples and times[i] < iv_end:
-                i += 1
-            iend = i
+    def find_heights_at_times(self, intervals):
+        if len(intervals) == 0:
+            return []
 
-            if istart == iend:
-                # no samples in this range
-                raise self._printer.command_error(f"No samples in time range {iv_start}-{iv_end}")
+        bounds = np.asarray(intervals, dtype=np.float64)
+        stats = self.query_intervals(bounds[:, 0], bounds[:, 1])
 
-            median = np.median(heights[istart:iend])
-            interval_heights.append(float(median))
+        empty = np.flatnonzero(stats.count == 0)
+        if len(empty) > 0:
+            iv_start, iv_end = intervals[empty[0]]
+            raise self._printer.command_error(f"No samples in time range {iv_start}-{iv_end}")
 
-        return interval_heights
+        return stats.median.tolist()
 
     def find_height_at_time(self, start_time, end_time):
         if end_time < start_time:
             raise self._printer.command_error("find_height_at_time: end_time is before start_time")
 
-        self._update_samples()
+        times = self.times
+        all_heights = self.heights
 
-        if len(self.times) == 0:
+        if len(times) == 0:
             raise self._printer.command_error("No samples at all, so none in time range")
 
-        if not self.heights:
+        if all_heights is None:
             raise self._printer.command_error("Update samples didn't compute heights")
 
         self.eddy._log_debug(
-                f"find_height_at_time: looking between {start_time:.3f}s-{end_time:.3f}s, inside {len(self.times)} samples, time range {self.times[0]:.3f}s to {self.times[-1]:.3f}s"
+                f"find_height_at_time: looking between {start_time:.3f}s-{end_time:.3f}s, inside {len(times)} samples, time range {times[0]:.3f}s to {times[-1]:.3f}s"
         )
 
-        # find the first sample that is >= start_time
-        start_idx = bisect.bisect_left(self.times, start_time)
-        if start_idx >= len(self.times):
+        if times[-1] < start_time:
             raise self._printer.command_error("Nothing after start_time?")
 
-        # find the last sample that is < end_time
-        end_idx = start_idx
-        while end_idx < len(self.times) and self.times[end_idx] < end_time:
-            end_idx += 1
-
-        # average the heights of the samples in the range
-        heights = self.heights[start_idx:end_idx]
-        if len(heights) == 0:
+        stats = np_interval_stats(times, all_heights, [start_time], [end_time])
+        count = int(stats.count[0])
+        if count == 0:
             raise self._printer.command_error(f"no samples between time {start_time:.1f} and {end_time:.1f}!")
-        hmin, hmax = np.min(heights), np.max(heights)
-        mean = np.mean(heights)
-        median = np.median(heights)
+        median = float(stats.median[0])
         self.eddy._log_debug(
-            f"find_height_at_time: {len(heights)} samples, median: {median:.3f}, mean: {mean:.3f} (range {hmin:.3f}-{hmax:.3f})"
+            f"find_height_at_time: {count} samples, median: {median:.3f}, mean: {stats.mean[0]:.3f} (range {stats.min[0]:.3f}-{stats.max[0]:.3f})"
         )
 
-        return float(median)
+        return median
+
+
+# Result of ProbeEddyTapModel for a grid of F filters (1 for wma), T thresholds
+# and P tap_time_positions. Indices are into the model's samples; -1 where
+# there was no trigger, or (for start_idx) where the firmware never saw the
+# signal rise and would report a tap start clock of 0.
+@dataclass
+class ProbeEddyTapModelResult:
+    # (F, T)
+    trigger_idx: np.ndarray
+    start_idx: np.ndarray
+    # (F, T, P) tap times as computed by home_wait; NaN without a complete tap
+    tap_times: np.ndarray
+    # If the firmware would have aborted (too many sensor errors, or passing
+    # the safe start thresholds too early), the reason and the sample index;
+    # nothing triggers at or after it.
+    error: Optional[str] = None
+    abort_idx: int = -1
+
+    @property
+    def triggered(self) -> np.ndarray:
+        return self.trigger_idx >= 0
+
+
+# Host model of the firmware tap detection in sensor_ldc1612_ng.c: check_error,
+# check_safe_start, and check_sos_tap/check_wma_tap, for evaluating a recorded
+# tap against other tap parameters. It does the firmware's arithmetic -- float32
+# for the sos filter, wrapping 32-bit integers for wma -- so trigger decisions
+# match the mcu's sample for sample. (This assumes the compiler didn't fuse the
+# filter's multiply-adds.)
+#
+# The sos filters for all candidate filters run together, one sample at a time.
+# The tap state machine is the same for every threshold: the tap start value is
+# the signal at the last rise, so the first trigger for each threshold comes
+# from a running maximum of (start value - signal), searched for all thresholds
+# at once.
+@final
+class ProbeEddyTapModel:
+    FREQ_WINDOW_SIZE = 16
+    WMA_D_WINDOW_SIZE = 4
+    WMA_INIT_SAMPLE_COUNT = FREQ_WINDOW_SIZE * 2
+    MAX_SOS_SECTIONS = 4
+
+    # times and freqvals are the raw samples from the start of homing;
+    # safe_freqval and trigger_freqval are the first and second thresholds
+    # given to ldc1612_ng_setup_home (start_freq and trigger_freq).
+    def __init__(
+        self,
+        times: np.ndarray,
+        freqvals: np.ndarray,
+        freqval_cvt: float,
+        safe_freqval: int,
+        trigger_freqval: int,
+        safe_time: float = 0.0,
+        max_errors: int = 0,
+    ):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.freqvals = np.asarray(freqvals, dtype=np.uint32)
+        # data * ld->sensor_cvt
+        self.freqs = self.freqvals.astype(np.float32) * np.float32(freqval_cvt)
+
+        n = len(self.freqvals)
+        idx = np.arange(n)
+        good = (self.freqvals >> 28) == 0
+
+        # check_error: abort once more than max_errors errors come in a row
+        last_good = np.maximum.accumulate(np.where(good, idx, -1)) if n > 0 else idx
+        over = np.flatnonzero(~good & (idx - last_good > max_errors))
+        self.error: Optional[str] = None
+        self.abort_idx = int(over[0]) if len(over) > 0 else n
+        if len(over) > 0:
+            self.error = "sensor error"
+
+        # check_safe_start: the first threshold, then the second one
+        valid = good & (idx < self.abort_idx)
+        self.safe_idx = self._first_at_least(valid, safe_freqval, 0)
+        self.start_idx = self._first_at_least(valid, trigger_freqval, self.safe_idx + 1)
+        for i in (self.safe_idx, self.start_idx):
+            if i < self.abort_idx and safe_time != 0.0 and self.times[i] < safe_time:
+                self.error = "too early"
+                self.abort_idx = i
+        self._valid = valid & (idx < self.abort_idx)
+
+    def _first_at_least(self, valid: np.ndarray, freqval: int, start: int) -> int:
+        hits = np.flatnonzero(valid[start:] & (self.freqvals[start:] >= freqval))
+        return start + int(hits[0]) if len(hits) > 0 else len(self.freqvals)
+
+    # the samples that tap detection looks at
+    def _detect_indices(self) -> np.ndarray:
+        return np.flatnonzero(self._valid[self.start_idx :]) + self.start_idx
+
+    # tap_threshold as sent to the mcu (int(threshold * 65536) as an int32)
+    @staticmethod
+    def _threshold_vals(thresholds) -> np.ndarray:
+        return np.trunc(np.asarray(thresholds, dtype=np.float64) * 65536.0).astype(np.int64).astype(np.int32)
+
+    # Filter output for each sos (a list of [b0, b1, b2, a0, a1, a2] sections)
+    # at the detection samples: an (F, D) float32 array
+    def sos_signal(self, sos_list: List[List[List[float]]]) -> Tuple[np.ndarray, np.ndarray]:
+        det = self._detect_indices()
+        num_filters = len(sos_list)
+        sections = max(len(sos) for sos in sos_list)
+        if sections > self.MAX_SOS_SECTIONS:
+            raise ValueError(f"sos filters can have at most {self.MAX_SOS_SECTIONS} sections")
+
+        # pad with pass-through sections, which leave float32 values untouched
+        coefs = np.zeros((num_filters, sections, 6), dtype=np.float32)
+        coefs[:, :, 0] = 1.0
+        for f, sos in enumerate(sos_list):
+            coefs[f, : len(sos)] = np.asarray(sos, dtype=np.float32)
+        b0, b1, b2, a1, a2 = (np.ascontiguousarray(coefs[:, :, i].T) for i in (0, 1, 2, 4, 5))
+
+        # the filter sees every good sample after the first threshold, offset by
+        # the frequency of the sample that passed it
+        out = np.zeros((num_filters, len(det)), dtype=np.float32)
+        if len(det) == 0:
+            return det, out
+        offset = self.freqs[self.safe_idx]
+        inputs = np.flatnonzero(self._valid[self.safe_idx + 1 : det[-1] + 1]) + self.safe_idx + 1
+        values = self.freqs[inputs] - offset
+        out_col = np.searchsorted(det, inputs)
+        is_det = np.isin(inputs, det)
+
+        # transposed direct form II, as in the firmware's sosfilter
+        s1 = np.zeros((sections, num_filters), dtype=np.float32)
+        s2 = np.zeros((sections, num_filters), dtype=np.float32)
+        for i in range(len(inputs)):
+            value = np.full(num_filters, values[i], dtype=np.float32)
+            for k in range(sections):
+                y = b0[k] * value + s1[k]
+                s1[k] = b1[k] * value - a1[k] * y + s2[k]
+                s2[k] = b2[k] * value - a2[k] * y
+                value = y
+            if is_det[i]:
+                out[:, out_col[i]] = value
+        return det, out
+
+    # wma_d_avg at the detection samples, as int64
+    def wma_signal(self) -> Tuple[np.ndarray, np.ndarray]:
+        det = self._detect_indices()
+        d = len(det)
+        data = np.concatenate([np.zeros(self.FREQ_WINDOW_SIZE - 1, dtype=np.uint64), self.freqvals[det].astype(np.uint64)])
+
+        # The firmware updates the wma incrementally, as a quotient and remainder
+        # of the weighted sum; that's exact, so summing the whole window here
+        # gives the same value. The oldest sample has weight 1.
+        wma_sum = np.zeros(d, dtype=np.uint64)
+        for i in range(self.FREQ_WINDOW_SIZE):
+            wma_sum += (data[i : i + d] * np.uint64(i + 1)) & np.uint64(0xFFFFFFFF)
+        weight_sum = self.FREQ_WINDOW_SIZE * (self.FREQ_WINDOW_SIZE + 1) // 2
+        wma = ((wma_sum // np.uint64(weight_sum)) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+        wma_d = (wma - np.concatenate([np.zeros(1, dtype=np.uint32), wma[:-1]])).view(np.int32).astype(np.int64)
+
+        # the average of the last 4 wma_d, with a wrapping int32 sum
+        wma_d = np.concatenate([np.zeros(self.WMA_D_WINDOW_SIZE - 1, dtype=np.int64), wma_d])
+        wma_d_sum = np.zeros(d, dtype=np.int64)
+        for i in range(self.WMA_D_WINDOW_SIZE):
+            wma_d_sum += wma_d[i : i + d]
+        wma_d_sum = self._wrap_i32(wma_d_sum)
+        return det, np.sign(wma_d_sum) * (np.abs(wma_d_sum) // self.WMA_D_WINDOW_SIZE)
+
+    @staticmethod
+    def _wrap_i32(v: np.ndarray) -> np.ndarray:
+        return ((v + (1 << 31)) & 0xFFFFFFFF) - (1 << 31)
+
+    # The tap state machine for (F, D) signals: returns the index of the last
+    # rise at or before each sample (-1 if none), and whether each sample
+    # checks the threshold. sos only checks on a strict fall; wma on anything
+    # that isn't a rise.
+    @staticmethod
+    def _tap_states(signal: np.ndarray, active: np.ndarray, check_equal: bool) -> Tuple[np.ndarray, np.ndarray]:
+        prev = np.zeros_like(signal)
+        prev[:, 1:] = signal[:, :-1]
+        rise = active & (signal > prev)
+        check = active & ~rise if check_equal else active & (signal < prev)
+        cols = np.arange(signal.shape[1])
+        last_rise = np.maximum.accumulate(np.where(rise, cols, -1), axis=1)
+        return last_rise, check
+
+    def _evaluate(self, det, diff, check, last_rise, thresholds, positions) -> ProbeEddyTapModelResult:
+        positions = np.atleast_1d(np.asarray(positions, dtype=np.float64))
+        num_filters, num_thresholds = diff.shape[0], len(thresholds)
+        trigger_idx = np.full((num_filters, num_thresholds), -1, dtype=np.intp)
+        start_idx = np.full((num_filters, num_thresholds), -1, dtype=np.intp)
+
+        if diff.shape[1] > 0:
+            # running max of the diff at the samples that check it: the first
+            # sample where it reaches a threshold is where that threshold triggers
+            lowest = np.finfo(diff.dtype).min if diff.dtype.kind == "f" else np.iinfo(diff.dtype).min
+            reached = np.maximum.accumulate(np.where(check, diff, lowest), axis=1)
+            for f in range(num_filters):
+                pos = np.searchsorted(reached[f], thresholds, side="left")
+                hit = pos < diff.shape[1]
+                trigger_idx[f, hit] = det[pos[hit]]
+                rise = last_rise[f, pos[hit]]
+                start_idx[f, hit] = np.where(rise >= 0, det[np.maximum(rise, 0)], -1)
+
+        complete = (trigger_idx >= 0) & (start_idx >= 0)
+        t_end = np.where(complete, self.times[np.maximum(trigger_idx, 0)], np.nan)
+        t_start = np.where(complete, self.times[np.maximum(start_idx, 0)], np.nan)
+        tap_times = t_start[:, :, None] + (t_end - t_start)[:, :, None] * positions[None, None, :]
+
+        return ProbeEddyTapModelResult(
+            trigger_idx=trigger_idx,
+            start_idx=start_idx,
+            tap_times=tap_times,
+            error=self.error,
+            abort_idx=self.abort_idx if self.error is not None else -1,
+        )
+
+    # check_sos_tap for every combination of filter, threshold and position
+    def evaluate_sos(self, sos_list, thresholds, positions=(0.0,)) -> ProbeEddyTapModelResult:
+        det, signal = self.sos_signal(sos_list)
+        last_rise, check = self._tap_states(signal, np.ones(len(det), dtype=bool), check_equal=False)
+        diff = self._sos_diff(signal, last_rise)
+        # tap_threshold / 65536.0f
+        thresholds = self._threshold_vals(thresholds).astype(np.float32) / np.float32(65536.0)
+        return self._evaluate(det, diff, check, last_rise, thresholds, positions)
+
+    # check_wma_tap for every combination of threshold and position
+    def evaluate_wma(self, thresholds, positions=(0.0,)) -> ProbeEddyTapModelResult:
+        det, signal = self.wma_signal()
+        signal = signal[np.newaxis, :]
+        active = np.arange(len(det)) >= self.WMA_INIT_SAMPLE_COUNT
+        last_rise, check = self._tap_states(signal, active, check_equal=True)
+        diff = self._wma_diff(signal, last_rise)
+        # tap_threshold >> 16
+        thresholds = self._threshold_vals(thresholds).astype(np.int64) >> 16
+        return self._evaluate(det, diff, check, last_rise, thresholds, positions)
+
+    # tap_start_value - val, in float32; 0 at a rise
+    @staticmethod
+    def _sos_diff(signal: np.ndarray, last_rise: np.ndarray) -> np.ndarray:
+        start_value = np.where(last_rise >= 0, np.take_along_axis(signal, np.maximum(last_rise, 0), axis=1), np.float32(0.0))
+        return start_value - signal
+
+    # tap_start_value - wma_d_avg, as a wrapping int32
+    def _wma_diff(self, signal: np.ndarray, last_rise: np.ndarray) -> np.ndarray:
+        start_value = np.where(last_rise >= 0, np.take_along_axis(signal, np.maximum(last_rise, 0), axis=1), 0)
+        return self._wrap_i32(start_value - signal)
+
+    # The filtered signal and the value compared against the threshold, per
+    # detection sample, for plotting one sos filter
+    def sos_trace(self, sos) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        det, signal = self.sos_signal([sos])
+        last_rise, _ = self._tap_states(signal, np.ones(len(det), dtype=bool), check_equal=False)
+        return self.times[det], signal[0], self._sos_diff(signal, last_rise)[0]
+
+    # The same for wma: wma_d_avg and the threshold value
+    def wma_trace(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        det, signal = self.wma_signal()
+        signal = signal[np.newaxis, :]
+        active = np.arange(len(det)) >= self.WMA_INIT_SAMPLE_COUNT
+        last_rise, _ = self._tap_states(signal, active, check_equal=True)
+        return self.times[det], signal[0], self._wma_diff(signal, last_rise)[0]
+
+
+# The fields of trapq pull_moves as arrays, oldest move first. Unlike the
+# pull_moves themselves these can be kept around and sent to other processes.
+@dataclass
+class ProbeEddyTrapqMoves:
+    print_time: np.ndarray
+    move_t: np.ndarray
+    start_v: np.ndarray
+    accel: np.ndarray
+    # (N, 3)
+    start: np.ndarray
+    axes_r: np.ndarray
+
+    @classmethod
+    def from_moves(cls, moves: list) -> ProbeEddyTrapqMoves:
+        return cls(
+            print_time=np.array([m.print_time for m in moves]),
+            move_t=np.array([m.move_t for m in moves]),
+            start_v=np.array([m.start_v for m in moves]),
+            accel=np.array([m.accel for m in moves]),
+            start=np.array([(m.start_x, m.start_y, m.start_z) for m in moves]),
+            axes_r=np.array([(m.x_r, m.y_r, m.z_r) for m in moves]),
+        )
+
+    # (N, 3) positions and (N,) velocities at print_times; NaN for times
+    # before the first move
+    def positions(self, print_times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        print_times = np.asarray(print_times, dtype=np.float64)
+        positions = np.full((len(print_times), 3), np.nan)
+        velocities = np.full(len(print_times), np.nan)
+
+        # same move selection as trapq_extract_old(..., 0.0, t): the latest move
+        # that starts strictly before t
+        idx = np.searchsorted(self.print_time, print_times, side="left") - 1
+        found = idx >= 0
+        idx = idx[found]
+
+        move_time = np.clip(print_times[found] - self.print_time[idx], 0.0, self.move_t[idx])
+        dist = (self.start_v[idx] + 0.5 * self.accel[idx] * move_time) * move_time
+        positions[found] = self.start[idx] + self.axes_r[idx] * dist[:, np.newaxis]
+        velocities[found] = self.start_v[idx] + self.accel[idx] * move_time
+        return positions, velocities
+
+
+# One tap recorded by PROBE_EDDY_NG_TUNE_TAP: its raw samples, what the firmware
+# tap detection was set up with, and the toolhead motion during the tap.
+@dataclass
+class ProbeEddyTapRecording:
+    times: np.ndarray
+    freqvals: np.ndarray
+    freqval_cvt: float
+    safe_freqval: int
+    trigger_freqval: int
+    max_errors: int
+    # The sample where the recorded tap triggered. After it the toolhead
+    # stopped, so later triggers can't be judged from this recording.
+    end_idx: int
+    moves: ProbeEddyTrapqMoves
+
+    def model(self) -> ProbeEddyTapModel:
+        return ProbeEddyTapModel(
+            self.times,
+            self.freqvals,
+            self.freqval_cvt,
+            self.safe_freqval,
+            self.trigger_freqval,
+            max_errors=self.max_errors,
+        )
+
+
+# Tap search results for F filters (1 for wma), T thresholds and P
+# tap_time_positions, over all recordings
+@dataclass
+class ProbeEddyTapSearchResult:
+    # (F, T): detected every recorded tap, within the recorded motion
+    ok: np.ndarray
+    # (F, T, P): spread and mean of the probe_z each tap would have given
+    stddev: np.ndarray
+    mean_z: np.ndarray
+    # (F, T): mean time from the tap start to the trigger
+    latency: np.ndarray
+
+
+# PROBE_EDDY_NG_TUNE_TAP's search over a set of sos filters (wma if sos_list is
+# None) for every threshold and position. This runs in a worker process.
+def tune_tap_search(recordings: List[ProbeEddyTapRecording], sos_list, thresholds, positions) -> ProbeEddyTapSearchResult:
+    zs = []
+    ok = None
+    latency = None
+    for rec in recordings:
+        model = rec.model()
+        if sos_list is None:
+            res = model.evaluate_wma(thresholds, positions)
+        else:
+            res = model.evaluate_sos(sos_list, thresholds, positions)
+
+        tap_ok = res.triggered & (res.start_idx >= 0) & (res.trigger_idx <= rec.end_idx)
+        ok = tap_ok if ok is None else ok & tap_ok
+
+        t_trigger = model.times[np.maximum(res.trigger_idx, 0)]
+        t_start = model.times[np.maximum(res.start_idx, 0)]
+        tap_latency = np.where(tap_ok, t_trigger - t_start, np.nan)
+        latency = tap_latency if latency is None else latency + tap_latency
+
+        tap_times = res.tap_times.ravel()
+        tap_zs = np.full(len(tap_times), np.nan)
+        have = ~np.isnan(tap_times)
+        tap_zs[have] = rec.moves.positions(tap_times[have])[0][:, 2]
+        zs.append(tap_zs.reshape(res.tap_times.shape))
+
+    zs = np.array(zs)
+    return ProbeEddyTapSearchResult(
+        ok=ok,
+        stddev=np.std(zs, axis=0),
+        mean_z=np.mean(zs, axis=0),
+        latency=latency / len(recordings),
+    )
+
+
+# Everything needed to plot a tap, as collected from the sampler. Times are
+# absolute; the plot starts them at time_start.
+@dataclass
+class ProbeEddyTapPlot:
+    title: str
+    path_png: Optional[str]
+    path_html: Optional[str]
+    time_start: float
+    times: np.ndarray
+    freqs: np.ndarray
+    heights: np.ndarray
+    # the toolhead's Z at each sample
+    kin_z: np.ndarray
+    probe_z: float
+    # relative to time_start
+    tap_start_time: float
+    trigger_time: float
+    tap_end_time: float
+    tap_threshold: float
+    # the firmware's view of the tap, if there is one; butter if tap_sos is set
+    tap_model: Optional[ProbeEddyTapModel]
+    tap_sos: Optional[List[List[float]]]
+
+
+# plotly is never imported by klippy itself: the plots are written by
+# probe_eddy_ng_plots (which imports it) in the executor's workers, so only
+# check that it's there.
+@lru_cache(maxsize=None)
+def have_plotly() -> bool:
+    return importlib.util.find_spec("plotly") is not None
+
+
+# Call probe_eddy_ng_plots.<name>(*args). This runs in a worker process.
+def write_plot(name: str, *args) -> str:
+    from . import probe_eddy_ng_plots
+
+    return getattr(probe_eddy_ng_plots, name)(*args)
+
+
+# A dense table of a function sampled at uniformly spaced x, evaluated
+# with linear interpolation. A lookup is one multiply, one index and
+# one multiply-add per value, regardless of the underlying fit.
+@dataclass
+class ProbeEddyLookupTable:
+    x0: float
+    step: float
+    values: np.ndarray
+    # values[i+1] - values[i]
+    slopes: np.ndarray
+    # Largest difference from the exact function seen at the segment
+    # midpoints, in units of values
+    max_error: float = 0.0
+
+    @classmethod
+    def build(cls, fn, x_min: float, x_max: float, max_error: float, min_points: int = 256, max_points: int = 65536):
+        n = min_points
+        while True:
+            xs = np.linspace(x_min, x_max, n)
+            values = fn(xs)
+            mids = (xs[:-1] + xs[1:]) * 0.5
+            err = float(np.max(np.abs(fn(mids) - (values[:-1] + values[1:]) * 0.5)))
+            if err <= max_error or n >= max_points:
+                break
+            n *= 2
+
+        slopes = np.diff(values)
+        return cls(
+            x0=float(x_min),
+            step=float(xs[1] - xs[0]),
+            values=values,
+            slopes=slopes,
+            max_error=err,
+        )
+
+    # Returns the interpolated values and a mask of which x were inside the
+    # table. Values outside the table are extrapolated linearly from the end
+    # segments.
+    def lookup(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        nsegs = len(self.slopes)
+        pos = (np.asarray(x, dtype=np.float64) - self.x0) * (1.0 / self.step)
+        idx = pos.astype(np.intp)
+        in_range = (pos >= 0.0) & (pos <= nsegs)
+        np.clip(idx, 0, nsegs - 1, out=idx)
+        # pos becomes the result in place: values + frac * slopes
+        pos -= idx
+        pos *= self.slopes[idx]
+        pos += self.values[idx]
+        return pos, in_range
+
+
+# A monotone piecewise cubic Hermite curve y = f(x) (Fritsch-Carlson/PCHIP
+# slopes) through strictly increasing knots. Outside of the knots it is
+# extended linearly with the end slopes. Since it's strictly increasing it
+# can be inverted exactly, segment by segment.
+@final
+class ProbeEddyMonotoneCurve:
+    def __init__(self, xs, ys, ds=None):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        if ds is None:
+            self.ds = self._pchip_slopes(self.xs, self.ys)
+        else:
+            # saved curves may predate the end slope floor
+            self.ds = np.array(ds, dtype=np.float64)
+            self.ds[0] = self._floor_end_slope(self.ds[0], (self.ys[1] - self.ys[0]) / (self.xs[1] - self.xs[0]))
+            self.ds[-1] = self._floor_end_slope(self.ds[-1], (self.ys[-1] - self.ys[-2]) / (self.xs[-1] - self.xs[-2]))
+        # same meaning as Polynomial.domain
+        self.domain = np.array([self.xs[0], self.xs[-1]])
+        self._build_segments()
+
+    # Build a curve from noisy samples: bin the samples in y (bins grow
+    # wider with y, so that the low heights that matter most for tap keep
+    # the most detail), take the median x and y of each bin, then make the
+    # knots strictly increasing with pool-adjacent-violators.
+    @classmethod
+    def fit(cls, x: np.ndarray, y: np.ndarray, min_bin_width: float = 0.05, bin_growth: float = 0.05, min_bin_count: int = 3):
+        order = np.argsort(y)
+        x = x[order]
+        y = y[order]
+
+        edges = [y[0]]
+        while edges[-1] < y[-1]:
+            edges.append(edges[-1] + min_bin_width + bin_growth * max(edges[-1], 0.0))
+        edges[-1] = math.nextafter(y[-1], math.inf)
+
+        x_stats = np_interval_stats(y, x, edges[:-1], edges[1:])
+        y_stats = np_interval_stats(y, y, edges[:-1], edges[1:])
+        full = x_stats.count >= min_bin_count
+        kx = x_stats.median[full]
+        ky = y_stats.median[full]
+        kw = x_stats.count[full].astype(np.float64)
+        if len(kx) < 2:
+            raise ValueError("not enough samples to fit a curve")
+
+        # the knots are in y order; pool any that go backwards in x
+        kx, ky = cls._pool_adjacent_violators(kx, ky, kw)
+        if len(kx) < 2:
+            raise ValueError("samples are not monotonic enough to fit a curve")
+        return cls(kx, ky)
+
+    # Merge neighbouring knots (weighted means) until x is strictly increasing.
+    # y is already increasing, and stays so.
+    @staticmethod
+    def _pool_adjacent_violators(x: np.ndarray, y: np.ndarray, w: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        bx, by, bw = [], [], []
+        for xi, yi, wi in zip(x, y, w):
+            bx.append(xi)
+            by.append(yi)
+            bw.append(wi)
+            while len(bx) > 1 and bx[-2] >= bx[-1]:
+                w2 = bw[-2] + bw[-1]
+                bx[-2] = (bx[-2] * bw[-2] + bx[-1] * bw[-1]) / w2
+                by[-2] = (by[-2] * bw[-2] + by[-1] * bw[-1]) / w2
+                bw[-2] = w2
+                del bx[-1], by[-1], bw[-1]
+        return np.array(bx), np.array(by)
+
+    # Fritsch-Carlson/Butland slopes, the same as scipy's PchipInterpolator
+    @staticmethod
+    def _pchip_slopes(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        h = np.diff(xs)
+        delta = np.diff(ys) / h
+        ds = np.zeros(len(xs))
+        if len(xs) == 2:
+            ds[:] = delta[0]
+            return ds
+
+        w1 = 2.0 * h[1:] + h[:-1]
+        w2 = h[1:] + 2.0 * h[:-1]
+        same_sign = delta[:-1] * delta[1:] > 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            interior = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        ds[1:-1] = np.where(same_sign, interior, 0.0)
+
+        # one-sided three point estimates at the ends, kept shape preserving
+        def end_slope(h0, h1, d0, d1):
+            d = ((2.0 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+            if np.sign(d0) != np.sign(d1) and abs(d) > abs(3.0 * d0):
+                d = 3.0 * d0
+            return ProbeEddyMonotoneCurve._floor_end_slope(d, d0)
+
+        ds[0] = end_slope(h[0], h[1], delta[0], delta[1])
+        ds[-1] = end_slope(h[-1], h[-2], delta[-1], delta[-2])
+        return ds
+
+    # The linear extensions past the knots use the end slopes, so those must
+    # keep the curve strictly monotone (and invertible): at least this fraction
+    # of the adjacent secant, with its sign.
+    MIN_END_SLOPE_FRACTION = 0.1
+
+    @staticmethod
+    def _floor_end_slope(d: float, secant: float) -> float:
+        floor = ProbeEddyMonotoneCurve.MIN_END_SLOPE_FRACTION * secant
+        if np.sign(d) != np.sign(secant) or abs(d) < abs(floor):
+            return float(floor)
+        return float(d)
+
+    # Per-segment cubic coefficients in dx = x - anchor, so that evaluating is a
+    # searchsorted, a few gathers and Horner's scheme. Segment 0 and segment n
+    # are the linear extensions below and above the knots.
+    def _build_segments(self):
+        xs, ys, ds = self.xs, self.ys, self.ds
+        h = np.diff(xs)
+        delta = np.diff(ys) / h
+        self._anchor = np.concatenate(([xs[0]], xs[:-1], [xs[-1]]))
+        self._c0 = np.concatenate(([ys[0]], ys[:-1], [ys[-1]]))
+        self._c1 = np.concatenate(([ds[0]], ds[:-1], [ds[-1]]))
+        self._c2 = np.concatenate(([0.0], (3.0 * delta - 2.0 * ds[:-1] - ds[1:]) / h, [0.0]))
+        self._c3 = np.concatenate(([0.0], (ds[:-1] + ds[1:] - 2.0 * delta) / (h * h), [0.0]))
+        # segment widths and end values, for solve()
+        self._width = np.concatenate(([0.0], h, [0.0]))
+        self._y1 = np.concatenate(([ys[0]], ys[1:], [ys[-1]]))
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        k = np.searchsorted(self.xs, x, side="right")
+        dx = x - self._anchor[k]
+        y = self._c3[k] * dx
+        y += self._c2[k]
+        y *= dx
+        y += self._c1[k]
+        y *= dx
+        y += self._c0[k]
+        return y
+
+    # The x for which f(x) == y. The cubic is monotone on each segment, so a
+    # Newton iteration that falls back to bisection whenever it would leave the
+    # current bracket always converges to the one root.
+    def solve(self, y, iterations: int = 8):
+        y = np.asarray(y, dtype=np.float64)
+        k = np.searchsorted(self.ys, y, side="right")
+        anchor = self._anchor[k]
+        c0, c1, c2, c3 = self._c0[k], self._c1[k], self._c2[k], self._c3[k]
+
+        # the linear ends are solved exactly by the starting guess; on the cubic
+        # segments start from linear interpolation, bracketed by [0, width]
+        inner = (k > 0) & (k < len(self.xs))
+        width = self._width[k]
+        lo = np.zeros_like(y)
+        hi = width.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dx = np.where(inner, (y - c0) / (self._y1[k] - c0) * width, (y - c0) / c1)
+            for _ in range(iterations):
+                f = ((c3 * dx + c2) * dx + c1) * dx + c0 - y
+                df = (3.0 * c3 * dx + 2.0 * c2) * dx + c1
+                above = f > 0.0
+                hi = np.where(inner & above, dx, hi)
+                lo = np.where(inner & ~above, dx, lo)
+                dx_newton = dx - f / df
+                bisect = inner & ~((dx_newton > lo) & (dx_newton < hi))
+                dx = np.where(bisect, (lo + hi) * 0.5, dx_newton)
+        return anchor + dx
+
+    def inverse(self) -> "ProbeEddyMonotoneCurveInverse":
+        return ProbeEddyMonotoneCurveInverse(self)
+
+    def to_dict(self) -> Dict[str, List[float]]:
+        return {"xs": self.xs.tolist(), "ys": self.ys.tolist(), "ds": self.ds.tolist()}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, List[float]]):
+        return cls(d["xs"], d["ys"], d["ds"])
+
+
+# x = f^-1(y) for a ProbeEddyMonotoneCurve, callable like the curve itself
+@final
+class ProbeEddyMonotoneCurveInverse:
+    def __init__(self, curve: ProbeEddyMonotoneCurve):
+        self.curve = curve
+        self.domain = np.array([curve.ys[0], curve.ys[-1]])
+
+    def __call__(self, y):
+        return self.curve.solve(y)
+
+
+# Reads the pickled calibrations of calibration_version 5, allowing only the
+# numpy types that they were made of
+@final
+class ProbeEddyCalibrationUnpickler(pickle.Unpickler):
+    ALLOWED_GLOBALS = {
+        ("numpy.polynomial.polynomial", "Polynomial"),
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy.core.multiarray", "scalar"),
+        ("numpy._core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "scalar"),
+        # arrays pickled with protocol 5 (the default from python 3.14)
+        ("numpy.core.numeric", "_frombuffer"),
+        ("numpy._core.numeric", "_frombuffer"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED_GLOBALS:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a calibration")
+        return super().find_class(module, name)
 
 
 @final
 class ProbeEddyFrequencyMap:
-    calibration_version = 5
+    # Calibrations are saved as "v6 key:value key:value ...", with the floats
+    # as base64 of little endian doubles. Version 5 calibrations (pickled) can
+    # still be read, and are saved in the current format.
+    calibration_version = 6
+    readable_calibration_versions = (5, 6)
     low_z_threshold = 5.0
+    # Maximum interpolation error for the freq to height lookup table, in mm
+    lut_height_max_error = 0.0005
 
     def __init__(self, eddy: ProbeEddy):
         self._eddy = eddy
@@ -2843,9 +4541,19 @@ class ProbeEddyFrequencyMap:
         self.drive_current = 0
         self.height_range = (math.inf, -math.inf)
         self.freq_range = (math.inf, -math.inf)
+        # "poly" or "pchip", see ProbeEddyParams.calibration_model. For pchip
+        # the curve is the ftoh fit, htof is its inverse and there's no ftoh_high.
+        self.model = "poly"
         self._ftoh: Optional[npp.Polynomial] = None
         self._ftoh_high: Optional[npp.Polynomial] = None
         self._htof: Optional[npp.Polynomial] = None
+        # Built from the fits whenever they change; keyed on the raw sensor freqval
+        # (ftoh) and on height (htof, giving freq)
+        self._ftoh_lut: Optional[ProbeEddyLookupTable] = None
+        self._htof_lut: Optional[ProbeEddyLookupTable] = None
+        # (calibration string, fields) of a calibration loaded from config
+        # whose fits haven't been decoded yet, see ensure_parsed()
+        self._unparsed: Optional[Tuple[str, Dict[str, str]]] = None
 
     def _str_to_exact_floatlist(self, str):
         return [float.fromhex(v) for v in str.split(",")]
@@ -2859,25 +4567,132 @@ class ProbeEddyFrequencyMap:
     def freq_spread(self) -> float:
         return ((self.freq_range[1] / self.freq_range[0]) - 1.0) * 100.0
 
+    @staticmethod
+    def _pack_floats(vals) -> str:
+        return base64.b64encode(np.asarray(vals, dtype="<f8").tobytes()).decode()
+
+    @staticmethod
+    def _unpack_floats(s: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(s, validate=True), dtype="<f8").astype(np.float64)
+
+    # polynomials as domain, window, then the coefficients
+    def _pack_poly(self, p: npp.Polynomial) -> str:
+        return self._pack_floats(np.concatenate([p.domain, p.window, p.coef]))
+
+    def _unpack_poly(self, s: str) -> npp.Polynomial:
+        import numpy.polynomial as npp
+
+        vals = self._unpack_floats(s)
+        return npp.Polynomial(vals[4:], domain=vals[0:2], window=vals[2:4])
+
     def load_from_config(self, config: ConfigWrapper, drive_current: int):
         calibstr = config.get(f"calibration_{drive_current}", None)
         if calibstr is None:
             self.drive_current = 0
             self._ftoh = None
             self._htof = None
+            self._ftoh_lut = None
+            self._htof_lut = None
+            self._unparsed = None
             self.height_range = (math.inf, -math.inf)
             self.freq_range = (math.inf, -math.inf)
             return
 
-        data = pickle.loads(base64.b64decode(calibstr))
+        calibstr = calibstr.strip()
+        if calibstr.startswith("v"):
+            return self._load_fields(calibstr, drive_current)
+        return self._load_pickled(calibstr, drive_current)
+
+    # Only the header is read here; the fits are decoded (and the lookup tables
+    # built) the first time this drive current is used
+    def _load_fields(self, calibstr: str, drive_current: int):
+        version, *tokens = calibstr.split()
+        fields = dict(token.split(":", 1) for token in tokens if ":" in token)
+        v = int(version[1:]) if version[1:].isdigit() else None
+        if v not in self.readable_calibration_versions:
+            self._eddy._log_info(f"Calibration for dc {drive_current} has unknown version ({version}), needs recalibration")
+            return False
+
+        model = fields.get("model", "poly")
+        needed = ["dc", "h", "f"] + (["curve"] if model == "pchip" else ["ftoh", "htof"])
+        missing = [k for k in needed if k not in fields]
+        if missing:
+            raise configerror(f"ProbeEddyFrequencyMap: calibration for drive current {drive_current} is missing {', '.join(missing)}")
+        dc = int(fields["dc"])
+        if dc != drive_current:
+            raise configerror(f"ProbeEddyFrequencyMap: drive current mismatch: loaded {dc} != requested {drive_current}")
+
+        self.model = model
+        self.height_range = tuple(float(v) for v in self._unpack_floats(fields["h"]))
+        self.freq_range = tuple(float(v) for v in self._unpack_floats(fields["f"]))
+        self.drive_current = drive_current
+        self._unparsed = (calibstr, fields)
+
+        self._eddy._log_info(f"Loaded calibration for drive current {drive_current}")
+        return True
+
+    # Decode the fits of a calibration loaded from config, if that hasn't
+    # happened yet
+    def ensure_parsed(self):
+        if self._unparsed is None:
+            return
+        _, fields = self._unparsed
+        self._unparsed = None
+
+        ftoh_lut = None
+        try:
+            if self.model == "pchip":
+                xs, ys, ds = np.split(self._unpack_floats(fields["curve"]), 3)
+                curve = ProbeEddyMonotoneCurve(xs, ys, ds)
+                self._ftoh = curve
+                self._ftoh_high = None
+                self._htof = curve.inverse()
+            else:
+                self._ftoh = self._unpack_poly(fields["ftoh"])
+                self._ftoh_high = self._unpack_poly(fields["ftoh_high"]) if "ftoh_high" in fields else None
+                self._htof = self._unpack_poly(fields["htof"])
+            if "ftoh_lut" in fields:
+                # only valid for the same freqval conversion it was built with
+                vals = self._unpack_floats(fields["ftoh_lut"])
+                if vals[0] == self._sensor.freqval_conversion_value():
+                    ftoh_lut = ProbeEddyLookupTable(
+                        x0=float(vals[1]),
+                        step=float(vals[2]),
+                        values=vals[4:],
+                        slopes=np.diff(vals[4:]),
+                        max_error=float(vals[3]),
+                    )
+        except (ValueError, binascii.Error) as e:
+            self._ftoh = None
+            self._ftoh_high = None
+            self._htof = None
+            raise self._eddy._printer.command_error(
+                f"Calibration for drive current {self.drive_current} is damaged ({e}), please recalibrate"
+            )
+
+        self._build_lookup_tables(ftoh_lut)
+
+    def _load_pickled(self, calibstr: str, drive_current: int):
+        try:
+            data = ProbeEddyCalibrationUnpickler(io.BytesIO(base64.b64decode(calibstr))).load()
+        except (pickle.UnpicklingError, binascii.Error) as e:
+            self._eddy._log_info(f"Calibration for dc {drive_current} can't be read ({e}), needs recalibration")
+            return False
         v = data.get("v", None)
-        if v is None or v < self.calibration_version:
+        if v is None or v < min(self.readable_calibration_versions):
             self._eddy._log_info(f"Calibration for dc {drive_current} is old ({v}), needs recalibration")
             return False
 
-        ftoh = data.get("ftoh", None)
-        ftoh_high = data.get("ftoh_high", None)
-        htof = data.get("htof", None)
+        model = data.get("model", "poly")
+        if model == "pchip":
+            curve = ProbeEddyMonotoneCurve.from_dict(data["curve"])
+            ftoh = curve
+            ftoh_high = None
+            htof = curve.inverse()
+        else:
+            ftoh = data.get("ftoh", None)
+            ftoh_high = data.get("ftoh_high", None)
+            htof = data.get("htof", None)
         dc = data.get("dc", None)
         h_range = data.get("h_range", (math.inf, -math.inf))
         f_range = data.get("f_range", (math.inf, -math.inf))
@@ -2885,31 +4700,50 @@ class ProbeEddyFrequencyMap:
         if dc != drive_current:
             raise configerror(f"ProbeEddyFrequencyMap: drive current mismatch: loaded {dc} != requested {drive_current}")
 
+        self.model = model
         self._ftoh = ftoh
         self._ftoh_high = ftoh_high
         self._htof = htof
-        self.height_range = h_range
-        self.freq_range = f_range
+        self.height_range = tuple(float(v) for v in h_range)
+        self.freq_range = tuple(float(v) for v in f_range)
         self.drive_current = drive_current
+        self._build_lookup_tables()
 
         self._eddy._log_info(f"Loaded calibration for drive current {drive_current}")
         return True
 
+    def _calibration_str(self) -> str:
+        fields = [
+            f"v{self.calibration_version}",
+            f"model:{self.model}",
+            f"dc:{self.drive_current}",
+            f"h:{self._pack_floats(self.height_range)}",
+            f"f:{self._pack_floats(self.freq_range)}",
+        ]
+        if self.model == "pchip":
+            # the inverse is implied by the curve
+            fields.append(f"curve:{self._pack_floats(np.concatenate([self._ftoh.xs, self._ftoh.ys, self._ftoh.ds]))}")
+        else:
+            fields.append(f"ftoh:{self._pack_poly(self._ftoh)}")
+            if self._ftoh_high is not None:
+                fields.append(f"ftoh_high:{self._pack_poly(self._ftoh_high)}")
+            fields.append(f"htof:{self._pack_poly(self._htof)}")
+        lut = self._ftoh_lut
+        if lut is not None and len(lut.values) <= self._eddy.params.calibration_lut_save_points:
+            lut_vals = [self._sensor.freqval_conversion_value(), lut.x0, lut.step, lut.max_error]
+            fields.append(f"ftoh_lut:{self._pack_floats(np.concatenate([lut_vals, lut.values]))}")
+        return " ".join(fields)
+
     def save_calibration(self):
-        if self._ftoh is None or self._htof is None:
+        if self._unparsed is not None:
+            # never decoded, so it's exactly what was loaded
+            calibstr = self._unparsed[0]
+        elif self._ftoh is None or self._htof is None:
             return
+        else:
+            calibstr = self._calibration_str()
 
         configfile = self._eddy._printer.lookup_object("configfile")
-        data = {
-            "v": self.calibration_version,
-            "ftoh": self._ftoh,
-            "ftoh_high": self._ftoh_high,
-            "htof": self._htof,
-            "h_range": self.height_range,
-            "f_range": self.freq_range,
-            "dc": self.drive_current,
-        }
-        calibstr = base64.b64encode(pickle.dumps(data)).decode()
         configfile.set(self._eddy._full_name, f"calibration_{self.drive_current}", calibstr)
 
     def calibrate_from_values(
@@ -2987,29 +4821,21 @@ class ProbeEddyFrequencyMap:
                     f"Drive current {drive_current} warning: frequency spread is {extremely}low ({freq_spread:.2f}%, {min_freq:.1f}-{max_freq:.1f}), which will greatly impact accuracy. Your sensor may be too high."
                 )
 
-        low_samples = heights <= ProbeEddyFrequencyMap.low_z_threshold
-        high_samples = heights >= ProbeEddyFrequencyMap.low_z_threshold - 0.5
-
-        ftoh_low_fn = npp.Polynomial.fit(1.0 / freqs[low_samples], heights[low_samples], deg=9)
-        htof_low_fn = npp.Polynomial.fit(heights[low_samples], 1.0 / freqs[low_samples], deg=9)
-
-        if np.count_nonzero(high_samples) > 50:
-            ftoh_high_fn = npp.Polynomial.fit(1.0 / freqs[high_samples], heights[high_samples], deg=9)
-        else:
+        model = self._eddy.params.calibration_model
+        fit: ProbeEddyCalibrationFit = self._eddy._executor.call(fit_calibration, (model, freqs, heights))
+        if fit.error is not None:
+            if report_errors:
+                self._eddy._log_error(f"Drive current {drive_current}: Calibration failed: {fit.error}")
+            return None, None
+        ftoh_low_fn = fit.ftoh
+        htof_low_fn = fit.htof
+        ftoh_high_fn = fit.ftoh_high
+        rmse_fth = fit.rmse_fth
+        rmse_htf = fit.rmse_htf
+        if model == "pchip":
+            self._eddy._log_debug(f"pchip calibration: {len(ftoh_low_fn.xs)} knots")
+        elif ftoh_high_fn is None:
             self._eddy._log_debug(f"not computing ftoh_high, not enough high samples")
-            ftoh_high_fn = None
-
-        # Calculate rms, only for the low values (where error is most relevant)
-        rmse_fth = np_rmse(
-            ftoh_low_fn,
-            1.0 / freqs[low_samples],
-            heights[low_samples],
-        )
-        rmse_htf = np_rmse(
-            htof_low_fn,
-            heights[low_samples],
-            1.0 / freqs[low_samples],
-        )
 
         if report_errors:
             if rmse_fth > 0.050:
@@ -3019,12 +4845,14 @@ class ProbeEddyFrequencyMap:
                 if not self._eddy.params.allow_unsafe:
                     return None, None
 
+        self.model = model
         self._ftoh = ftoh_low_fn
         self._htof = htof_low_fn
         self._ftoh_high = ftoh_high_fn
         self.drive_current = drive_current
         self.height_range = [min_height, max_height]
         self.freq_range = [min_freq, max_freq]
+        self._build_lookup_tables()
 
         self._eddy._log_msg(
             f"Drive current {drive_current}: valid height: {min_height:.3f} to {max_height:.3f}, "
@@ -3032,144 +4860,214 @@ class ProbeEddyFrequencyMap:
             f"Fit {rmse_fth:.4f} ({rmse_htf:.2f})"
         )
 
-        if write_debug_files:
-            self._write_calibration_plot(
-                times,
-                freqs,
-                heights,
-                rmse_fth,
-                rmse_htf,
-                vels=vels,
+        if write_debug_files and have_plotly():
+            self._eddy._executor.submit(
+                write_plot,
+                (
+                    "write_calibration_plot",
+                    "/tmp/eddy-calibration.html",
+                    drive_current,
+                    times,
+                    freqs,
+                    heights,
+                    ftoh_low_fn,
+                    htof_low_fn,
+                    ftoh_high_fn,
+                    rmse_fth,
+                    rmse_htf,
+                    ProbeEddyFrequencyMap.low_z_threshold,
+                    vels,
+                ),
+                on_done=self._eddy._log_info,
+                on_error=lambda e: self._eddy._log_error(f"Failed to write calibration plot: {e}"),
+                key="/tmp/eddy-calibration.html",
             )
 
         return rmse_fth, rmse_htf
 
-    def _write_calibration_plot(
-        self,
-        times,
-        freqs,
-        heights,
-        rmse_fth,
-        rmse_htf,
-        vels=None,
-    ):
-        if not plotly:
-            return
-
-        if self._ftoh is None or self._htof is None:
-            logging.warning(f"write_calibration_plot: null calibration?")
-            return
-
-        import plotly.graph_objects as go
-
-        low_samples = heights <= ProbeEddyFrequencyMap.low_z_threshold
-        high_samples = heights >= ProbeEddyFrequencyMap.low_z_threshold - 0.5
-
-        f_to_z_low_err = heights[low_samples] - self._ftoh(1.0 / freqs[low_samples])
-
-        if self._ftoh_high is not None:
-            f_to_z_high_err = heights[high_samples] - self._ftoh_high(1.0 / freqs[high_samples])
-        else:
-            f_to_z_high_err = None
-
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=times, y=heights, mode="lines", name="Z"))
+    # Evaluate the frequency-to-height fit on an array of 1/freq values. The low
+    # and high polynomials are each evaluated once on their masked part of the
+    # array. Where their fit ranges overlap (heights just around low_z_threshold)
+    # the two are linearly blended, so there is no step at the seam.
+    def _invfreqs_to_heights(self, invfreqs: np.ndarray) -> np.ndarray:
+        if self._ftoh_high is None:
+            return np_fit_eval(self._ftoh, invfreqs)
+
+        # the low fit covers small 1/freq (low heights), the high fit large 1/freq
+        seam_lo = self._ftoh_high.domain[0]
+        seam_hi = self._ftoh.domain[1]
+        if seam_lo >= seam_hi:
+            seam_lo = seam_hi
+
+        heights = np.zeros(len(invfreqs))
+        low_vals = invfreqs <= seam_hi
+        high_vals = invfreqs > seam_lo
+        heights[low_vals] = np_poly_eval(self._ftoh, invfreqs[low_vals])
+
+        high_heights = np_poly_eval(self._ftoh_high, invfreqs[high_vals])
+        if seam_hi > seam_lo:
+            # in the overlap heights[] already holds the low fit
+            w = np.clip((invfreqs[high_vals] - seam_lo) / (seam_hi - seam_lo), 0.0, 1.0)
+            high_heights = w * high_heights + (1.0 - w) * heights[high_vals]
+        heights[high_vals] = high_heights
+        return heights
 
-        fig.add_trace(
-            go.Scatter(
-                x=times[low_samples],
-                y=self._ftoh(1.0 / freqs[low_samples]),
-                mode="lines",
-                name=f"Z {rmse_fth:.4f}",
-            )
+    # ftoh_lut can be given to use a saved table instead of building one
+    def _build_lookup_tables(self, ftoh_lut: Optional[ProbeEddyLookupTable] = None):
+        conv = self._sensor.freqval_conversion_value()
+        fmin, fmax = self.freq_range
+        hmin, hmax = self.height_range
+
+        self._ftoh_lut = ftoh_lut or ProbeEddyLookupTable.build(
+            lambda fv: self._invfreqs_to_heights(1.0 / (fv * conv)),
+            # one freqval of margin on either side so that the end points are
+            # not lost to rounding
+            math.floor(fmin / conv) - 1,
+            math.ceil(fmax / conv) + 1,
+            self.lut_height_max_error,
         )
-
-        if self._ftoh_high is not None:
-            fig.add_trace(
-                go.Scatter(
-                    x=times[high_samples],
-                    y=self._ftoh_high(1.0 / freqs[high_samples]),
-                    mode="lines",
-                    name=f"Z (high)",
-                )
-            )
-
-        fig.add_trace(go.Scatter(x=times, y=freqs, mode="lines", name="F", yaxis="y2"))
-
-        fig.add_trace(
-            go.Scatter(
-                x=times[low_samples],
-                y=1.0 / self._htof(heights[low_samples]),
-                mode="lines",
-                name=f"F ({rmse_htf:.2f})",
-                yaxis="y2",
-            )
+        # only tabulate the heights the htof fit was made over (for poly, the
+        # low heights); anything else falls back to the fit itself.
+        # half a freqval is below what the sensor can resolve
+        self._htof_lut = ProbeEddyLookupTable.build(
+            lambda h: 1.0 / np_fit_eval(self._htof, h),
+            max(hmin, self._htof.domain[0]),
+            min(hmax, self._htof.domain[1]),
+            conv * 0.5,
         )
-
-        fig.add_trace(
-            go.Scatter(
-                x=times[low_samples],
-                y=f_to_z_low_err,
-                mode="lines",
-                name="Err",
-                yaxis="y3",
-            )
+        self._eddy._log_debug(
+            f"dc {self.drive_current} lookup tables: ftoh {len(self._ftoh_lut.values)} points, "
+            f"max error {self._ftoh_lut.max_error:.6f} mm; "
+            f"htof {len(self._htof_lut.values)} points, max error {self._htof_lut.max_error:.4f} Hz"
         )
-        if f_to_z_high_err is not None:
-            fig.add_trace(
-                go.Scatter(
-                    x=times[high_samples],
-                    y=f_to_z_high_err,
-                    mode="lines",
-                    name="Err (high)",
-                    yaxis="y3",
-                )
-            )
-
-        if vels is not None:
-            fig.add_trace(go.Scatter(x=times, y=vels, mode="lines", name="V", yaxis="y4"))
 
-        fig.update_layout(
-            hovermode="x unified",
-            title=f"Calibration for drive current {self.drive_current}",
-            yaxis2=dict(title="Freq", overlaying="y", tickformat="d", side="right"),
-            yaxis3=dict(overlaying="y", side="right", position=0.1),
-            yaxis4=dict(overlaying="y", side="right", position=0.2),
-        )
-        fig.write_html("/tmp/eddy-calibration.html")
+    def freqvals_to_heights_np(self, freqvals: np.ndarray) -> np.ndarray:
+        self.ensure_parsed()
+        if self._ftoh is None:
+            raise self._eddy._printer.command_error("Calling freqvals_to_heights on uncalibrated map")
+        if self._ftoh_lut is None:
+            conv = self._sensor.freqval_conversion_value()
+            return self._invfreqs_to_heights(1.0 / (np.asarray(freqvals, dtype=np.float64) * conv))
+
+        heights, in_range = self._ftoh_lut.lookup(freqvals)
+        if not in_range.all():
+            # outside of the calibrated range, extrapolate with the fit
+            conv = self._sensor.freqval_conversion_value()
+            out_of_range = ~in_range
+            heights[out_of_range] = self._invfreqs_to_heights(1.0 / (np.asarray(freqvals, dtype=np.float64)[out_of_range] * conv))
+        return heights
 
     def freq_to_height(self, freq: float) -> float:
+        self.ensure_parsed()
         if self._ftoh is None:
             raise self._eddy._printer.command_error("Calling freq_to_height on uncalibrated map")
-        invfreq = 1.0 / freq
-        if self._ftoh_high is not None and invfreq < self._ftoh.domain[0]:
-            return float(self._ftoh_high(invfreq))
-        return float(self._ftoh(invfreq))
+        conv = self._sensor.freqval_conversion_value()
+        return float(self.freqvals_to_heights_np(np.array([freq / conv]))[0])
 
-    def freqs_to_heights_np(self, freqs: np.array) -> np.array:
+    def freqs_to_heights_np(self, freqs: np.ndarray) -> np.ndarray:
+        self.ensure_parsed()
         if self._ftoh is None:
             raise self._eddy._printer.command_error("Calling freqs_to_heights on uncalibrated map")
-        invfreqs = 1.0 / freqs
-        if self._ftoh_high is not None:
-            heights = np.zeros(len(invfreqs))
-            low_freq_vals = invfreqs > self._ftoh.domain[1]
-            heights[low_freq_vals] = np.vectorize(self._ftoh_high, otypes=[float])(invfreqs[low_freq_vals])
-            heights[~low_freq_vals] = np.vectorize(self._ftoh, otypes=[float])(invfreqs[~low_freq_vals])
-        else:
-            heights = self._ftoh(invfreqs)
-        return heights
+        if self._ftoh_lut is not None:
+            conv = self._sensor.freqval_conversion_value()
+            return self.freqvals_to_heights_np(np.asarray(freqs, dtype=np.float64) * (1.0 / conv))
+        return self._invfreqs_to_heights(1.0 / np.asarray(freqs, dtype=np.float64))
+
+    # Time the frequency to height conversion paths on `count` frequencies
+    # spread over the calibrated range. Returns (name, seconds per 10k samples).
+    def benchmark_conversions(self, count: int = 10000, repeat: int = 5) -> List[Tuple[str, float]]:
+        self.ensure_parsed()
+        fmin, fmax = self.freq_range
+        freqs = np.linspace(fmin, fmax, count)
+        per_10k = 10000.0 / count
+
+        def best_of(fn):
+            best = math.inf
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t0)
+            return best * per_10k
+
+        # the previous implementation, one Python-level polynomial call per sample
+        def per_sample():
+            invfreqs = 1.0 / freqs
+            ftoh_high = self._ftoh_high or self._ftoh
+            high_vals = invfreqs > self._ftoh.domain[1]
+            np.vectorize(ftoh_high, otypes=[float])(invfreqs[high_vals])
+            np.vectorize(self._ftoh, otypes=[float])(invfreqs[~high_vals])
+
+        conv = self._sensor.freqval_conversion_value()
+        freqvals = np.round(freqs / conv).astype(np.uint32)
+
+        results = []
+        results.append(("per-sample np.vectorize", best_of(per_sample)))
+        results.append(("batched polynomial", best_of(lambda: self._invfreqs_to_heights(1.0 / freqs))))
+        results.append(("lookup table (raw freqvals)", best_of(lambda: self.freqvals_to_heights_np(freqvals))))
+        return results
 
     def height_to_freq(self, height: float) -> float:
+        self.ensure_parsed()
         if self._htof is None:
             raise self._eddy._printer.command_error("Calling height_to_freq on uncalibrated map")
+        if self._htof_lut is not None:
+            freqs, in_range = self._htof_lut.lookup(np.array([height]))
+            if in_range[0]:
+                return float(freqs[0])
         return 1.0 / float(self._htof(height))
 
     def calibrated(self) -> bool:
-        return self._ftoh is not None and self._htof is not None
+        return self._unparsed is not None or (self._ftoh is not None and self._htof is not None)
+
+
+# The fits for a calibration, see fit_calibration
+@dataclass
+class ProbeEddyCalibrationFit:
+    ftoh: Any = None
+    htof: Any = None
+    ftoh_high: Any = None
+    rmse_fth: float = math.inf
+    rmse_htf: float = math.inf
+    error: Optional[str] = None
+
+
+# Fit the calibration model to the samples: freq to height and height to freq
+# for the low heights (all heights for pchip), and freq to height for the high
+# heights. The RMS errors are only for the low heights, where error is most
+# relevant. This runs in a worker process.
+def fit_calibration(model: str, freqs: np.ndarray, heights: np.ndarray) -> ProbeEddyCalibrationFit:
+    low_samples = heights <= ProbeEddyFrequencyMap.low_z_threshold
+    high_samples = heights >= ProbeEddyFrequencyMap.low_z_threshold - 0.5
+
+    fit = ProbeEddyCalibrationFit()
+    if model == "pchip":
+        # one monotone curve over the whole range, and its exact inverse
+        try:
+            curve = ProbeEddyMonotoneCurve.fit(1.0 / freqs, heights)
+        except ValueError as e:
+            fit.error = str(e)
+            return fit
+        fit.ftoh = curve
+        fit.htof = curve.inverse()
+    else:
+        import numpy.polynomial as npp
+
+        fit.ftoh = npp.Polynomial.fit(1.0 / freqs[low_samples], heights[low_samples], deg=9)
+        fit.htof = npp.Polynomial.fit(heights[low_samples], 1.0 / freqs[low_samples], deg=9)
+        if np.count_nonzero(high_samples) > 50:
+            fit.ftoh_high = npp.Polynomial.fit(1.0 / freqs[high_samples], heights[high_samples], deg=9)
+
+    fit.rmse_fth = np_rmse(fit.ftoh, 1.0 / freqs[low_samples], heights[low_samples])
+    fit.rmse_htf = np_rmse(fit.htof, heights[low_samples], 1.0 / freqs[low_samples])
+    return fit
 
 
 @final
 class BedMeshScanHelper:
+    # In dense mode, samples further than this (in mm) from a row's Y are
+    # ignored (they're from the moves between rows)
+    DENSE_ROW_TOLERANCE = 0.5
+
     def __init__(self, eddy, config):
         self._eddy = eddy
         self._printer = eddy._printer
@@ -3187,6 +5085,8 @@ class BedMeshScanHelper:
 
         self._mesh_points, self._mesh_path = self._generate_path()
 
+        # where scan() writes the probed points; None to not write them
+        self.mesh_csv_path = "/tmp/mesh.csv"
 
     def _generate_path(self):
         x_vals = np.linspace(self._x_min, self._x_max, self._x_points)
@@ -3247,24 +5147,83 @@ class BedMeshScanHelper:
                 ki += 1
             matrix.append(row)
 
+        self._build_mesh(matrix, self._x_points)
+
+    # heights is a (y_points, x_count) grid, ordered min_y..max_y, min_x..max_x
+    def _set_dense_bed_mesh(self, heights: np.ndarray):
+        matrix = (self._scan_z - heights).tolist()
+        # the grid is already dense in X, so don't interpolate further along it
+        self._build_mesh(matrix, heights.shape[1], {"mesh_x_pps": 0})
+
+    def _build_mesh(self, matrix, x_count: int, extra_params: Optional[Dict[str, Any]] = None):
         params = self._bed_mesh.bmc.mesh_config.copy()
         params.update({
             "min_x": self._x_min,
             "max_x": self._x_max,
             "min_y": self._y_min,
             "max_y": self._y_max,
-            "x_count": self._x_points,
+            "x_count": x_count,
             "y_count": self._y_points,
         })
-        mesh = bed_mesh.ZMesh(params, None)
+        if extra_params:
+            params.update(extra_params)
+        # interpolating a large mesh takes a while, so it's built in a worker
         try:
-            mesh.build_mesh(matrix)
+            mesh = self._eddy._executor.call(build_bed_mesh, (params, matrix))
         except bed_mesh.BedMeshError as e:
             raise self._printer.command_error(str(e))
         self._bed_mesh.set_mesh(mesh)
         self._eddy._log_msg("Mesh scan complete")
 
-    def scan(self):
+    # Bin every sample taken along the scan path onto a grid with density times
+    # as many columns as probe_count, using the median of each cell. Rows stay at
+    # the probe_count rows, since that's where the path goes. Returns the
+    # (y_points, x_count) grid of heights and the per-cell sample counts.
+    def _dense_heights(self, sampler: ProbeEddySampler, path_times: List[float], density: int) -> Tuple[np.ndarray, np.ndarray]:
+        x_count = (self._x_points - 1) * density + 1
+        y_count = self._y_points
+        dx = (self._x_max - self._x_min) / (x_count - 1)
+        dy = (self._y_max - self._y_min) / (y_count - 1)
+
+        times = sampler.times
+        heights = sampler.heights
+        keep = (times >= path_times[0] - dx / self._speed) & (times <= path_times[-1] + dx / self._speed)
+        times = times[keep]
+        heights = heights[keep] + self._eddy._tap_offset
+
+        # sensor position for every sample
+        positions, _ = self._eddy._get_trapq_positions(times)
+        xs = positions[:, 0] + self._x_offset
+        ys = positions[:, 1] + self._y_offset
+
+        with np.errstate(invalid="ignore"):
+            col = np.rint((xs - self._x_min) / dx)
+            row = np.rint((ys - self._y_min) / dy)
+            valid = (col >= 0) & (col < x_count) & (row >= 0) & (row < y_count)
+            valid &= np.abs(ys - (self._y_min + row * dy)) <= self.DENSE_ROW_TOLERANCE
+
+        cells = (row[valid] * x_count + col[valid]).astype(np.intp)
+        order = np.argsort(cells, kind="stable")
+        ncells = x_count * y_count
+        stats = np_interval_stats(cells[order].astype(np.float64), heights[valid][order], np.arange(ncells), np.arange(ncells) + 1)
+        grid = stats.median.reshape(y_count, x_count)
+        counts = stats.count.reshape(y_count, x_count)
+
+        # fill in any cells that didn't get samples from their row neighbours
+        cols = np.arange(x_count)
+        for r in range(y_count):
+            have = counts[r] > 0
+            if not np.any(have):
+                raise self._printer.command_error(f"Dense mesh: no samples for row {r} (y={self._y_min + r * dy:.1f})")
+            if not np.all(have):
+                grid[r, ~have] = np.interp(cols[~have], cols[have], grid[r, have])
+
+        self._eddy._log_info(
+            f"Dense mesh: {len(cells)} samples in {x_count}x{y_count} cells, {counts.min()}-{counts.max()} samples per cell, {np.count_nonzero(counts == 0)} empty"
+        )
+        return grid, counts
+
+    def scan(self, density: int = 1):
         th = self._eddy._toolhead
 
         # move to the start point
@@ -3283,28 +5242,186 @@ class BedMeshScanHelper:
             sampler.wait_for_sample_at_time(path_times[-1] + sample_time*2.)
             sampler.finish()
 
+            if density > 1:
+                grid, counts = self._dense_heights(sampler, path_times, density)
+                if self.mesh_csv_path is not None:
+                    with open(self.mesh_csv_path, "w") as mfile:
+                        mfile.write("x,y,z,count\n")
+                        xs = np.linspace(self._x_min, self._x_max, grid.shape[1])
+                        ys = np.linspace(self._y_min, self._y_max, grid.shape[0])
+                        for r in range(grid.shape[0]):
+                            for c in range(grid.shape[1]):
+                                mfile.write(f"{xs[c]},{ys[r]},{grid[r, c]},{counts[r, c]}\n")
+                self._set_dense_bed_mesh(grid)
+                return
+
             heights = sampler.find_heights_at_times([(t - sample_time/2., t + sample_time/2.) for t in path_times])
             # Note plus tap_offset here, vs -tap_offset when probing. These are actual
             # heights, the other is "offset from real"
             heights = [h + self._eddy._tap_offset for h in heights]
 
-            with open("/tmp/mesh.csv", "w") as mfile:
-                mfile.write("time,x,y,z\n")
-                for i in range(len(self._mesh_points)):
-                    t = path_times[i]
-                    x = self._mesh_points[i][0]
-                    y = self._mesh_points[i][1]
-                    z = heights[i]
-                    mfile.write(f"{t},{x},{y},{z}\n")
+            if self.mesh_csv_path is not None:
+                with open(self.mesh_csv_path, "w") as mfile:
+                    mfile.write("time,x,y,z\n")
+                    for i in range(len(self._mesh_points)):
+                        t = path_times[i]
+                        x = self._mesh_points[i][0]
+                        y = self._mesh_points[i][1]
+                        z = heights[i]
+                        mfile.write(f"{t},{x},{y},{z}\n")
 
             self._set_bed_mesh(heights)
 
 
+# A bed_mesh ZMesh built (interpolated) from matrix, for BedMeshScanHelper. This
+# runs in a worker process.
+def build_bed_mesh(params: Dict[str, Any], matrix: List[List[float]]):
+    mesh = bed_mesh.ZMesh(params, None)
+    mesh.build_mesh(matrix)
+    return mesh
+
+
+# A Butterworth bandpass filter as second order sections of [b0, b1, b2, a0,
+# a1, a2]; the same filter, with the same sections in the same order, as
+# scipy.signal.butter(order, [lowcut, highcut], btype="bandpass", fs=fs,
+# output="sos"). The analog prototype's poles are moved to the (prewarped)
+# band, mapped to z with the bilinear transform, and paired with their nearest
+# zeros starting from the poles closest to the unit circle, which end up in
+# the last sections. Only a handful of distinct filters are ever used, so the
+# results are cached.
+@lru_cache(maxsize=256)
+def np_butter_bandpass_sos(order: int, lowcut: float, highcut: float, fs: float) -> Tuple[Tuple[float, ...], ...]:
+    if order < 1 or not (0.0 < lowcut < highcut < fs / 2.0):
+        raise ValueError(f"Invalid bandpass filter: order {order}, {lowcut}-{highcut}Hz at {fs}Hz")
+
+    # analog lowpass prototype, moved to the band
+    p = -np.exp(1j * np.pi * np.arange(-order + 1, order, 2) / (2 * order))
+    warped = 2.0 * fs * np.tan(np.pi * np.array([lowcut, highcut]) / fs)
+    bw = warped[1] - warped[0]
+    wo = np.sqrt(warped[0] * warped[1])
+    p_lp = p * bw / 2.0
+    p_bp = np.concatenate([p_lp + np.sqrt(p_lp**2 - wo**2), p_lp - np.sqrt(p_lp**2 - wo**2)])
+
+    # bilinear transform: the order zeros at 0 go to 1, the ones at infinity to -1
+    fs2 = 2.0 * fs
+    p_z = (fs2 + p_bp) / (fs2 - p_bp)
+    k = bw**order * np.real(fs2**order / np.prod(fs2 - p_bp))
+    zeros = [-1.0] * order + [1.0] * order
+
+    # one of each conjugate pair, and the real poles
+    is_real = np.abs(p_z.imag) <= 100.0 * np.finfo(np.float64).eps * np.abs(p_z)
+    poles = [complex(v.real, 0.0) if r else complex(v) for v, r in zip(p_z, is_real) if r or v.imag > 0]
+
+    def take_nearest_zero(p1: complex) -> float:
+        return zeros.pop(int(np.argmin([abs(z - p1) for z in zeros])))
+
+    sections = []
+    while poles:
+        p1 = poles.pop(int(np.argmin([abs(1.0 - abs(v)) for v in poles])))
+        if p1.imag != 0.0:
+            p2 = p1.conjugate()
+        else:
+            real_idx = [i for i, v in enumerate(poles) if v.imag == 0.0]
+            if real_idx:
+                p2 = poles.pop(min(real_idx, key=lambda i: abs(abs(poles[i]) - 1.0)))
+            else:
+                # a single real pole gets a first order section
+                p2 = 0.0
+        z1 = take_nearest_zero(p1)
+        z2 = take_nearest_zero(p1) if p2 != 0.0 else 0.0
+        sections.append([1.0, -(z1 + z2), z1 * z2, 1.0, -(p1 + p2).real, (p1 * p2).real])
+
+    sections.reverse()
+    sections[0][:3] = [k * v for v in sections[0][:3]]
+    return tuple(tuple(float(v) for v in sect) for sect in sections)
+
+
 def np_rmse(p, x, y):
     y_hat = p(x)
     return np.sqrt(np.mean((y - y_hat) ** 2))
 
 
+# Evaluate a numpy Polynomial with Horner's scheme on the mapped domain. This
+# is the same math as Polynomial.__call__, but works in place on one output
+# array instead of allocating a temporary per coefficient.
+def np_poly_eval(p: npp.Polynomial, x: np.ndarray) -> np.ndarray:
+    off, scl = p.mapparms()
+    xm = np.asarray(x, dtype=np.float64) * scl
+    xm += off
+    coef = p.coef
+    y = np.full(xm.shape, coef[-1])
+    for c in coef[-2::-1]:
+        y *= xm
+        y += c
+    return y
+
+
+# count/median/mean/min/max of values over the samples with times in each
+# [starts[i], ends[i]) interval, for many intervals in one pass. times must be
+# sorted. Intervals may overlap; the samples of every interval are gathered
+# and sorted together (by interval, then value) so the medians, minimums and
+# maximums are just indexed out. Non-finite values only affect the stats of
+# the intervals that contain them.
+def np_interval_stats(times: np.ndarray, values: np.ndarray, starts, ends) -> ProbeEddyIntervalStats:
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    lo = np.searchsorted(times, starts, side="left")
+    hi = np.maximum(lo, np.searchsorted(times, ends, side="left"))
+    counts = hi - lo
+
+    n = len(starts)
+    median = np.full(n, np.nan)
+    mean = np.full(n, np.nan)
+    vmin = np.full(n, np.nan)
+    vmax = np.full(n, np.nan)
+
+    total = int(counts.sum())
+    if total > 0:
+        # indices of every sample of every interval, concatenated
+        seg_starts = np.cumsum(counts) - counts
+        seg = np.repeat(np.arange(n), counts)
+        idx = np.arange(total) - seg_starts[seg] + lo[seg]
+        vals = values[idx]
+        # sort by (interval, value). NaNs sort to the end of their interval, and
+        # don't disturb the ordering of any other interval.
+        vals = vals[np.lexsort((vals, seg))]
+
+        nonempty = counts > 0
+        first = seg_starts[nonempty]
+        cnt = counts[nonempty]
+        mid = first + cnt // 2
+        even = (cnt % 2) == 0
+        median[nonempty] = np.where(even, (vals[mid - even] + vals[mid]) * 0.5, vals[mid])
+        mean[nonempty] = np.bincount(seg, weights=vals, minlength=n)[nonempty] / cnt
+        vmin[nonempty] = vals[first]
+        vmax[nonempty] = vals[first + cnt - 1]
+        # like np.median/np.min/np.max, an interval with a NaN has NaN stats
+        has_nan = np.bincount(seg, weights=np.isnan(vals), minlength=n) > 0
+        median[has_nan] = np.nan
+        vmin[has_nan] = np.nan
+        vmax[has_nan] = np.nan
+
+    return ProbeEddyIntervalStats(count=counts, median=median, mean=mean, min=vmin, max=vmax)
+
+
+# Evaluate a calibration fit (a Polynomial, or anything else callable on arrays)
+def np_fit_eval(fit, x: np.ndarray) -> np.ndarray:
+    # (checked without numpy.polynomial, which is imported lazily)
+    if hasattr(fit, "mapparms"):
+        return np_poly_eval(fit, x)
+    return fit(x)
+
+
+# This process's resident set size in MB, or None where /proc isn't available
+def process_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+
+
 def bed_mesh_ProbeManager_start_probe_override(self, gcmd):
     method = gcmd.get("METHOD", "automatic").lower()
     can_scan = False
@@ -3320,3 +5437,6 @@ def bed_mesh_ProbeManager_start_probe_override(self, gcmd):
 
 def load_config_prefix(config: ConfigWrapper):
     return ProbeEddy(config)
+
+
+_module_load_time = time.perf_counter() - _module_load_start
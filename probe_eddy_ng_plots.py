@@ -0,0 +1,205 @@
+# EDDY-ng plots
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# The debug plots written by probe_eddy_ng. These are run in its worker
+# processes, so this module (and plotly, which is only imported here) is
+# only loaded when a plot is actually written.
+from __future__ import annotations
+
+import time
+import numpy as np
+import plotly.graph_objects as go
+
+from typing import Optional
+
+
+# Write a tap plot. This also has logic to compute the averages and the
+# filter mostly-exactly how it's done on the probe MCU itself (vs using numpy
+# or similar) to make these graphs more reprensetative. plot is a
+# probe_eddy_ng.ProbeEddyTapPlot. Returns a message to log.
+def write_tap_plot(plot) -> str:
+    s_t = plot.times - plot.time_start
+    s_f = plot.freqs
+    s_z = plot.heights
+    s_kinz = plot.kin_z
+
+    # Any values below 0.0 are suspect because they were not calibrated,
+    # and so are just extrapolated from the fit. Show them differently.
+    s_lowz = np.ma.masked_where(s_z >= 0, s_z)
+    s_z = np.ma.masked_where(s_z < 0, s_z)
+
+    time_len = s_t.max()
+
+    # the signal the firmware looked at, and the value it compared against the threshold
+    tap_s_t = tap_s_v = tap_accum = None
+    if plot.tap_model is not None:
+        if plot.tap_sos is not None:
+            tap_s_t, tap_s_v, tap_accum = plot.tap_model.sos_trace(plot.tap_sos)
+        else:
+            tap_s_t, tap_s_v, tap_accum = plot.tap_model.wma_trace()
+        tap_s_t = tap_s_t - plot.time_start
+
+    (c_red, c_lt_red) = ('#9e4058', '#C2697F')
+    (c_orange, c_lt_orange) = ('#d0641e', '#E68E54')
+    (c_yellow, c_lt_yellow) = ('#f9ab0e', '"#FBC559')
+    (c_green, c_lt_green) = ('#589e40', '#7FC269')
+    (c_blue, c_lt_blue) = ('#2c3778', '#4151B0')
+    (c_purple, c_lt_purple) = ('#513965', '#785596')
+
+    fig = go.Figure()
+
+    # fmt: off
+    if plot.tap_start_time > 0:
+        fig.add_shape(type="line", x0=plot.tap_start_time, x1=plot.tap_start_time, y0=0, y1=1,
+                      xref="x", yref="paper", line=dict(color=c_purple, width=2),)
+    if plot.trigger_time > 0:
+        fig.add_shape(type="line", x0=plot.trigger_time, x1=plot.trigger_time, y0=0, y1=1,
+                      xref="x", yref="paper", line=dict(color=c_lt_orange, width=2),)
+    if plot.tap_end_time > 0:
+        fig.add_shape(type="line", x0=plot.tap_end_time, x1=plot.tap_end_time, y0=0, y1=1,
+                      xref="x", yref="paper", line=dict(color=c_purple, width=2),)
+    if plot.tap_threshold > 0:
+        fig.add_shape(type="line", x0=0, x1=1, y0=plot.tap_threshold, y1=plot.tap_threshold,
+                      xref="paper", yref="y3", line=dict(color="gray", width=1, dash="dash"),)
+
+    fig.add_shape(type="line", x0=0, x1=1, y0=plot.probe_z, y1=plot.probe_z,
+                  xref="paper", yref="y", line=dict(color=c_lt_orange, width=1),)
+
+    # Computed Z, Toolhead Z, Sensor F
+    fig.add_trace(go.Scatter(x=s_t, y=s_z, mode="lines", name="Z", line=dict(color=c_blue)))
+    fig.add_trace(go.Scatter(x=s_t, y=s_lowz, mode="lines", name="Z (low)", line=dict(color=c_lt_blue, dash="dash")))
+    fig.add_trace(go.Scatter(x=s_t, y=s_kinz, mode="lines", name="KinZ", line=dict(color=c_lt_red)))
+    fig.add_trace(go.Scatter(x=s_t, y=s_f, mode="lines", name="Freq", yaxis="y2", line=dict(color=c_orange)))
+
+    # the tap detection signal if we have the data
+    if tap_s_t is not None:
+        fig.add_trace(go.Scatter(x=tap_s_t, y=tap_s_v, mode="lines", name="signal", yaxis="y4", line=dict(color=c_green)))
+        fig.add_trace(go.Scatter(x=tap_s_t, y=tap_accum, mode="lines", name="threshold", yaxis="y3", line=dict(color="#626b73")))
+
+    fig.update_xaxes(range=[max(0.0, time_len - 0.60), time_len], autorange=False)
+
+    fig.update_layout(
+        hovermode="x unified",
+        title=dict(text=plot.title),
+        yaxis=dict(title="Z", side="right"),  # Z axis
+        yaxis2=dict(overlaying="y", title="Freq", tickformat="d", side="left"),  # Freq + WMA
+        yaxis3=dict(overlaying="y", side="left", tickformat="d", position=0.2),  # derivatives, tap accum
+        yaxis4=dict(overlaying="y", side="right", showticklabels=False),  # filter
+        height=800,
+    )
+    # fmt: on
+
+    tapplot_path_png = plot.path_png
+    tapplot_path_html = plot.path_html
+    timg = 0.0
+    thtml = 0.0
+    if tapplot_path_png:
+        t0 = time.time()
+        try:
+            fig.write_image(tapplot_path_png)
+        except:
+            tapplot_path_png = None
+        timg = time.time() - t0
+    if tapplot_path_html:
+        t0 = time.time()
+        fig.write_html(tapplot_path_html, include_plotlyjs="cdn")
+        thtml = time.time() - t0
+    return f"Wrote tap plot to {tapplot_path_png or ''} {tapplot_path_html or ''}  [took {timg:.1f}, {thtml:.1f}]"
+
+
+# Plot a calibration's samples, its fits and their errors to path. The fits
+# (and their errors) are shown separately below and above low_z_threshold.
+# Returns a message to log.
+def write_calibration_plot(
+    path: str,
+    drive_current: int,
+    times: np.ndarray,
+    freqs: np.ndarray,
+    heights: np.ndarray,
+    ftoh,
+    htof,
+    ftoh_high,
+    rmse_fth: float,
+    rmse_htf: float,
+    low_z_threshold: float,
+    vels: Optional[np.ndarray] = None,
+) -> str:
+    low_samples = heights <= low_z_threshold
+    high_samples = heights >= low_z_threshold - 0.5
+
+    f_to_z_low_err = heights[low_samples] - ftoh(1.0 / freqs[low_samples])
+
+    if ftoh_high is not None:
+        f_to_z_high_err = heights[high_samples] - ftoh_high(1.0 / freqs[high_samples])
+    else:
+        f_to_z_high_err = None
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=times, y=heights, mode="lines", name="Z"))
+
+    fig.add_trace(
+        go.Scatter(
+            x=times[low_samples],
+            y=ftoh(1.0 / freqs[low_samples]),
+            mode="lines",
+            name=f"Z {rmse_fth:.4f}",
+        )
+    )
+
+    if ftoh_high is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=times[high_samples],
+                y=ftoh_high(1.0 / freqs[high_samples]),
+                mode="lines",
+                name=f"Z (high)",
+            )
+        )
+
+    fig.add_trace(go.Scatter(x=times, y=freqs, mode="lines", name="F", yaxis="y2"))
+
+    fig.add_trace(
+        go.Scatter(
+            x=times[low_samples],
+            y=1.0 / htof(heights[low_samples]),
+            mode="lines",
+            name=f"F ({rmse_htf:.2f})",
+            yaxis="y2",
+        )
+    )
+
+    fig.add_trace(
+        go.Scatter(
+            x=times[low_samples],
+            y=f_to_z_low_err,
+            mode="lines",
+            name="Err",
+            yaxis="y3",
+        )
+    )
+    if f_to_z_high_err is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=times[high_samples],
+                y=f_to_z_high_err,
+                mode="lines",
+                name="Err (high)",
+                yaxis="y3",
+            )
+        )
+
+    if vels is not None:
+        fig.add_trace(go.Scatter(x=times, y=vels, mode="lines", name="V", yaxis="y4"))
+
+    fig.update_layout(
+        hovermode="x unified",
+        title=f"Calibration for drive current {drive_current}",
+        yaxis2=dict(title="Freq", overlaying="y", tickformat="d", side="right"),
+        yaxis3=dict(overlaying="y", side="right", position=0.1),
+        yaxis4=dict(overlaying="y", side="right", position=0.2),
+    )
+    fig.write_html(path)
+    return f"Wrote calibration plot to {path}"
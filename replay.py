@@ -0,0 +1,1637 @@
+#!/usr/bin/env python3
+# Offline replay of recorded EDDY-ng captures
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# probe_eddy_ng writes its captures to /tmp: calibration samples
+# (/tmp/eddy-calibration.csv), tap samples (/tmp/tap-samples-N.csv, with
+# debug enabled), static probe samples (PROBE_STATIC SAVE=1,
+# /tmp/eddy-probe-static.csv) and bed mesh results (/tmp/mesh.csv).
+#
+# This runs those captures back through the real LDC1612_ng batch
+# processing, ProbeEddySampler, ProbeEddyFrequencyMap, tap analysis and
+# BedMeshScanHelper code, with stand-ins for the MCU, the bulk sensor
+# reader, the reactor, the toolhead and the trapq. Time is virtual, so
+# results are deterministic and a replay runs as fast as the host code
+# allows. For each replay the results are printed along with throughput
+# and latency numbers for the sample pipeline; --json writes them out and
+# --expect compares the results against an earlier --json file.
+#
+#   python3 replay.py --config ~/printer_data/config/printer.cfg
+#
+# replays every capture found in /tmp, using the probe_eddy_ng section and
+# saved calibration from printer.cfg. Homing moves and the firmware tap
+# detection are not simulated: tap replays use the trigger times recorded
+# in the capture.
+#
+# The tests (python3 -m pytest tests) replay the synthetic captures in
+# tests/captures and check the results against the expected*.json there.
+
+import argparse
+import configparser
+import glob
+import importlib.util
+import json
+import logging
+import math
+import os
+import pickle
+import re
+import struct
+import sys
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+AUTOSAVE_HEADER = "#*# <---------------------- SAVE_CONFIG ---------------------->"
+
+DEFAULT_CALIBRATION_PATH = "/tmp/eddy-calibration.csv"
+DEFAULT_TAP_PATHS = "/tmp/tap-samples-*.csv"
+DEFAULT_STATIC_PATH = "/tmp/eddy-probe-static.csv"
+DEFAULT_MESH_PATH = "/tmp/mesh.csv"
+
+# klipper's bulk message payload limit; this gives 12 samples per block
+MAX_BULK_MSG_SIZE = 51
+
+# What the sensor sends for the samples missing from a capture (captures
+# only contain the good samples): an amplitude error
+ERROR_FREQVAL = 0x8 << 28
+
+_SENTINEL = object()
+
+
+#
+# Virtual time
+#
+
+
+class ReplayTimer:
+    def __init__(self, callback, waketime):
+        self.callback = callback
+        self.waketime = waketime
+
+
+# Single threaded reactor on a virtual clock. There are no greenlets: waiting
+# on a completion (or pausing) runs the due timers inline, advancing the clock
+# to each timer's waketime, until the wait is satisfied.
+class ReplayReactor:
+    NEVER = 9999999999999999.0
+    NOW = 0.0
+
+    def __init__(self, start_time: float = 1.0):
+        self._now = start_time
+        self._timers: List[ReplayTimer] = []
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def register_timer(self, callback, waketime=NEVER):
+        timer = ReplayTimer(callback, waketime)
+        self._timers.append(timer)
+        return timer
+
+    def update_timer(self, timer, waketime):
+        timer.waketime = waketime
+
+    def unregister_timer(self, timer):
+        if timer in self._timers:
+            self._timers.remove(timer)
+
+    def completion(self):
+        return ReplayCompletion(self)
+
+    def pause(self, waketime):
+        self.run_until(waketime, lambda: False)
+        return self._now
+
+    def run_until(self, waketime: float, done: Callable[[], bool]):
+        while not done():
+            timer = min(self._timers, key=lambda t: t.waketime, default=None)
+            if timer is None or timer.waketime > waketime:
+                if waketime >= self.NEVER:
+                    raise RuntimeError("replay: waiting forever with no timers pending")
+                self._now = max(self._now, waketime)
+                return
+            self._now = max(self._now, timer.waketime)
+            timer.waketime = timer.callback(self._now)
+
+
+class ReplayCompletion:
+    def __init__(self, reactor: ReplayReactor):
+        self._reactor = reactor
+        self._done = False
+        self._result = None
+
+    def test(self):
+        return self._done
+
+    def complete(self, result):
+        self._done = True
+        self._result = result
+
+    def wait(self, waketime=ReplayReactor.NEVER, waketime_result=None):
+        self._reactor.run_until(waketime, self.test)
+        return self._result if self._done else waketime_result
+
+
+#
+# Errors and config
+#
+
+
+class CommandError(Exception):
+    pass
+
+
+class ConfigError(Exception):
+    pass
+
+
+class PinsError(Exception):
+    pass
+
+
+# Same lookup semantics as klipper's ConfigWrapper: defaults are returned
+# as given, without being checked or converted
+class ReplayConfig:
+    error = ConfigError
+
+    def __init__(self, printer, fileconfig: configparser.RawConfigParser, section: str):
+        self.printer = printer
+        self.fileconfig = fileconfig
+        self.section = section
+
+    def get_printer(self):
+        return self.printer
+
+    def get_name(self):
+        return self.section
+
+    def has_section(self, section):
+        return self.fileconfig.has_section(section)
+
+    def getsection(self, section):
+        return ReplayConfig(self.printer, self.fileconfig, section)
+
+    def _get_wrapper(self, parser, option, default, minval=None, maxval=None, above=None, below=None):
+        if not self.fileconfig.has_option(self.section, option):
+            if default is not _SENTINEL:
+                return default
+            raise ConfigError(f"Option '{option}' in section '{self.section}' must be specified")
+        try:
+            v = parser(self.fileconfig.get(self.section, option))
+        except ValueError:
+            raise ConfigError(f"Unable to parse option '{option}' in section '{self.section}'")
+        if minval is not None and v < minval:
+            raise ConfigError(f"Option '{option}' in section '{self.section}' must have minimum of {minval}")
+        if maxval is not None and v > maxval:
+            raise ConfigError(f"Option '{option}' in section '{self.section}' must have maximum of {maxval}")
+        if above is not None and v <= above:
+            raise ConfigError(f"Option '{option}' in section '{self.section}' must be above {above}")
+        if below is not None and v >= below:
+            raise ConfigError(f"Option '{option}' in section '{self.section}' must be below {below}")
+        return v
+
+    def get(self, option, default=_SENTINEL, note_valid=True):
+        return self._get_wrapper(str, option, default)
+
+    def getint(self, option, default=_SENTINEL, minval=None, maxval=None, note_valid=True):
+        return self._get_wrapper(int, option, default, minval, maxval)
+
+    def getfloat(self, option, default=_SENTINEL, minval=None, maxval=None, above=None, below=None, note_valid=True):
+        return self._get_wrapper(float, option, default, minval, maxval, above, below)
+
+    def getboolean(self, option, default=_SENTINEL, note_valid=True):
+        def parse_bool(v):
+            v = v.strip().lower()
+            if v not in configparser.RawConfigParser.BOOLEAN_STATES:
+                raise ValueError(v)
+            return configparser.RawConfigParser.BOOLEAN_STATES[v]
+
+        return self._get_wrapper(parse_bool, option, default)
+
+    def getchoice(self, option, choices, default=_SENTINEL, note_valid=True):
+        if isinstance(choices, list):
+            choices = {c: c for c in choices}
+        if choices and isinstance(list(choices.keys())[0], int):
+            c = self.getint(option, default)
+        else:
+            c = self.get(option, default)
+        if c not in choices:
+            raise ConfigError(f"Choice '{c}' for option '{option}' in section '{self.section}' is not a valid choice")
+        return choices[c]
+
+    def getlist(self, option, default=_SENTINEL, sep=",", count=None, parser=str, note_valid=True):
+        def parse_list(value):
+            res = tuple(parser(p.strip()) for p in value.split(sep) if p.strip())
+            if count is not None and len(res) != count:
+                raise ConfigError(f"Option '{option}' in section '{self.section}' must have {count} elements")
+            return res
+
+        return self._get_wrapper(parse_list, option, default)
+
+    def getintlist(self, option, default=_SENTINEL, sep=",", count=None, note_valid=True):
+        return self.getlist(option, default, sep=sep, count=count, parser=int)
+
+    def getfloatlist(self, option, default=_SENTINEL, sep=",", count=None, note_valid=True):
+        return self.getlist(option, default, sep=sep, count=count, parser=float)
+
+
+def new_fileconfig() -> configparser.RawConfigParser:
+    return configparser.RawConfigParser(strict=False, inline_comment_prefixes=(";", "#"))
+
+
+# Read a klipper config file, returning (merged config, autosave config). The
+# SAVE_CONFIG block at the end overrides the regular sections, like it does
+# in klipper. [include] sections are not followed.
+def read_config_file(path: str) -> Tuple[configparser.RawConfigParser, configparser.RawConfigParser]:
+    with open(path) as f:
+        data = f.read()
+    regular, _, saved = data.partition(AUTOSAVE_HEADER)
+    saved_lines = []
+    for line in saved.split("\n"):
+        if line.startswith("#*#"):
+            saved_lines.append(line[4:] if line.startswith("#*# ") else line[3:])
+    saved = "\n".join(saved_lines)
+
+    fileconfig = new_fileconfig()
+    fileconfig.read_string(regular)
+    fileconfig.read_string(saved)
+    autosave = new_fileconfig()
+    autosave.read_string(saved)
+    return fileconfig, autosave
+
+
+#
+# Printer objects
+#
+
+
+class ReplayPrinter:
+    command_error = CommandError
+    config_error = ConfigError
+
+    def __init__(self):
+        self._reactor = ReplayReactor()
+        self._objects: Dict[str, Any] = {}
+        self._handlers: Dict[str, List[Callable]] = {}
+
+    def get_reactor(self):
+        return self._reactor
+
+    def add_object(self, name, obj):
+        self._objects[name] = obj
+
+    def lookup_object(self, name, default=_SENTINEL):
+        if name in self._objects:
+            return self._objects[name]
+        if default is _SENTINEL:
+            raise ConfigError(f"Unknown config object '{name}'")
+        return default
+
+    def load_object(self, config, section, default=_SENTINEL):
+        if section not in self._objects and section == "bed_mesh":
+            self._objects[section] = ReplayBedMesh()
+        return self.lookup_object(section, default)
+
+    def register_event_handler(self, event, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def send_event(self, event, *params):
+        return [cb(*params) for cb in self._handlers.get(event, [])]
+
+    def is_shutdown(self):
+        return False
+
+
+class ReplayGCodeCommand:
+    def __init__(self, gcode, params):
+        self._gcode = gcode
+        self._params = params
+
+    def get(self, name, default=_SENTINEL, parser=str, minval=None, maxval=None, above=None, below=None):
+        value = self._params.get(name)
+        if value is None:
+            if default is _SENTINEL:
+                raise CommandError(f"Error on '{name}': missing")
+            return default
+        return parser(value)
+
+    def get_int(self, name, default=_SENTINEL, minval=None, maxval=None):
+        return self.get(name, default, parser=int)
+
+    def get_float(self, name, default=_SENTINEL, minval=None, maxval=None, above=None, below=None):
+        return self.get(name, default, parser=float)
+
+    def respond_info(self, msg, log=True):
+        self._gcode.respond_info(msg, log)
+
+    def respond_raw(self, msg):
+        self._gcode.respond_raw(msg)
+
+
+class ReplayGCode:
+    def __init__(self, echo: bool = False):
+        self.echo = echo
+        self.messages: List[str] = []
+
+    def register_command(self, cmd, func, desc=None):
+        pass
+
+    def register_mux_command(self, cmd, key, value, func, desc=None):
+        pass
+
+    def create_gcode_command(self, command, commandline, params):
+        return ReplayGCodeCommand(self, params)
+
+    def respond_info(self, msg, log=True):
+        self.respond_raw(msg)
+
+    def respond_raw(self, msg):
+        self.messages.append(msg)
+        if self.echo:
+            print(f"  // {msg.rstrip()}")
+
+
+class ReplayWebhooks:
+    def register_endpoint(self, path, callback):
+        pass
+
+    def register_mux_endpoint(self, path, key, value, callback):
+        pass
+
+
+class ReplayPins:
+    def register_chip(self, chip_name, chip):
+        pass
+
+    def lookup_pin(self, pin_desc, can_invert=False, can_pullup=False, share_type=None):
+        raise PinsError(f"replay: pin '{pin_desc}' can't be looked up")
+
+
+class ReplayConfigFile:
+    def __init__(self, autosave: configparser.RawConfigParser):
+        self.autosave = types.SimpleNamespace(fileconfig=autosave)
+        self.saved: Dict[str, Dict[str, str]] = {}
+
+    def set(self, section, option, value):
+        self.saved.setdefault(section, {})[option] = value
+
+    def remove_section(self, section):
+        self.saved.pop(section, None)
+
+
+class ReplayZMesh:
+    def __init__(self, params, name):
+        self.mesh_params = params
+        self.name = name
+        self.probed_matrix = None
+
+    def build_mesh(self, z_matrix):
+        self.probed_matrix = [list(row) for row in z_matrix]
+
+
+class BedMeshError(Exception):
+    pass
+
+
+class ReplayBedMesh:
+    def __init__(self):
+        self.bmc = types.SimpleNamespace(mesh_config={"algo": "lagrange", "tension": 0.2, "mesh_x_pps": 2, "mesh_y_pps": 2})
+        self.z_mesh: Optional[ReplayZMesh] = None
+
+    def set_mesh(self, mesh):
+        self.z_mesh = mesh
+
+
+#
+# MCU and sensor bus
+#
+
+
+class ReplayCommand:
+    def __init__(self, mcu, msgformat):
+        self._mcu = mcu
+        self.name = msgformat.split()[0]
+
+    def send(self, data=(), minclock=0, reqclock=0):
+        self._mcu.sent.append((self.name, list(data), minclock))
+
+    def send_wait_ack(self, data=(), minclock=0, reqclock=0):
+        self.send(data, minclock, reqclock)
+
+
+# Queries answer with every response field set to 0
+class ReplayQueryCommand(ReplayCommand):
+    def __init__(self, mcu, msgformat, respformat):
+        super().__init__(mcu, msgformat)
+        self._fields = [p.split("=")[0] for p in respformat.split()[1:]]
+
+    def send(self, data=(), minclock=0, reqclock=0):
+        super().send(data, minclock, reqclock)
+        return {name: 0 for name in self._fields}
+
+
+# The MCU clock runs in lockstep with the reactor: print time == reactor time
+class ReplayMCU:
+    CLOCK_FREQ = 64_000_000
+
+    def __init__(self, printer: ReplayPrinter):
+        self._printer = printer
+        self._reactor = printer.get_reactor()
+        self._oid_count = 0
+        self._config_callbacks: List[Callable] = []
+        self.sent: List[Tuple[str, list, int]] = []
+
+    def get_printer(self):
+        return self._printer
+
+    def get_name(self):
+        return "mcu"
+
+    def create_oid(self):
+        self._oid_count += 1
+        return self._oid_count - 1
+
+    def add_config_cmd(self, cmd, is_init=False, on_restart=False):
+        pass
+
+    def register_config_callback(self, cb):
+        self._config_callbacks.append(cb)
+
+    def run_config_callbacks(self):
+        for cb in self._config_callbacks:
+            cb()
+
+    def register_response(self, cb, msg, oid=None):
+        pass
+
+    def alloc_command_queue(self):
+        return None
+
+    def lookup_command(self, msgformat, cq=None):
+        return ReplayCommand(self, msgformat)
+
+    def try_lookup_command(self, msgformat):
+        return ReplayCommand(self, msgformat)
+
+    def lookup_query_command(self, msgformat, respformat, oid=None, cq=None, is_async=False):
+        return ReplayQueryCommand(self, msgformat, respformat)
+
+    def seconds_to_clock(self, t):
+        return int(t * self.CLOCK_FREQ)
+
+    def print_time_to_clock(self, print_time):
+        return int(print_time * self.CLOCK_FREQ)
+
+    def clock_to_print_time(self, clock):
+        return clock / self.CLOCK_FREQ
+
+    def clock32_to_clock64(self, clock32):
+        last_clock = self.print_time_to_clock(self._reactor.monotonic())
+        clock_diff = (clock32 - last_clock) & 0xFFFFFFFF
+        clock_diff -= (clock_diff & 0x80000000) << 1
+        return last_clock + clock_diff
+
+    def estimated_print_time(self, eventtime):
+        return eventtime
+
+    def is_fileoutput(self):
+        return False
+
+
+class MCU_trsync:
+    REASON_ENDSTOP_HIT = 1
+    REASON_COMMS_TIMEOUT = 2
+    REASON_HOST_REQUEST = 3
+    REASON_PAST_END_TIME = 4
+
+
+class TriggerDispatch:
+    def __init__(self, mcu):
+        self._mcu = mcu
+
+    def get_oid(self):
+        return 0
+
+
+class HomingMove:
+    def __init__(self, printer, endstops, toolhead=None):
+        raise CommandError("replay: homing moves can't be replayed")
+
+
+# An LDC1612 on the other end of the i2c bus: answers the id registers
+# (matching ldc1612_ng) and remembers what was written
+class ReplayI2C:
+    def __init__(self, mcu: ReplayMCU, addr):
+        self._mcu = mcu
+        self._oid = mcu.create_oid()
+        self._addr = addr
+        self.regs = {0x7E: 0x5449, 0x7F: 0x3055}
+
+    def get_oid(self):
+        return self._oid
+
+    def get_mcu(self):
+        return self._mcu
+
+    def get_i2c_address(self):
+        return self._addr
+
+    def get_command_queue(self):
+        return None
+
+    def i2c_write(self, data, minclock=0, reqclock=0):
+        if len(data) == 3:
+            self.regs[data[0]] = (data[1] << 8) | data[2]
+
+    def i2c_read(self, write, read_len, retry=True):
+        val = self.regs.get(write[0], 0)
+        return {"response": bytes([(val >> 8) & 0xFF, val & 0xFF])}
+
+
+def MCU_I2C_from_config(config, default_addr=None, default_speed=100000, cmd_queue=None):
+    return ReplayI2C(config.get_printer().lookup_object("mcu"), default_addr)
+
+
+#
+# Bulk sensor data
+#
+
+
+# Timing for one replay: how long the host took per batch, and how long
+# samples sat between being taken and being handed to the batch clients
+# (in virtual time, so deterministic)
+class ReplayStats:
+    def __init__(self):
+        self.batches = 0
+        self.samples = 0
+        self.errors = 0
+        self.process_times: List[float] = []
+        self.client_times: List[float] = []
+        self.delivered = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.analysis_time = 0.0
+        # time spent producing synthetic samples, which isn't the host's
+        self.feed_time = 0.0
+
+    def note_delivery(self, now: float, sample_times: np.ndarray):
+        if len(sample_times) == 0:
+            return
+        latency = now - sample_times
+        self.delivered += len(sample_times)
+        self.latency_sum += float(latency.sum())
+        self.latency_max = max(self.latency_max, float(latency.max()))
+
+    def note_batch(self, process_time: float, client_time: float, msg):
+        self.batches += 1
+        self.process_times.append(process_time)
+        self.client_times.append(client_time)
+        if msg:
+            self.samples += len(msg["times"])
+            self.errors += msg["errors"]
+
+    def summary(self) -> Dict[str, float]:
+        process = np.array(self.process_times) if self.process_times else np.zeros(1)
+        clients = np.array(self.client_times) if self.client_times else np.zeros(1)
+        total = self.samples + self.errors
+        return {
+            "samples": self.samples,
+            "errors": self.errors,
+            "batches": self.batches,
+            "process_ms_avg": float(process.mean()) * 1000.0,
+            "process_ms_max": float(process.max()) * 1000.0,
+            "clients_ms_avg": float(clients.mean()) * 1000.0,
+            "samples_per_s": total / float(process.sum()) if process.sum() > 0 else 0.0,
+            "latency_ms_avg": self.latency_sum / self.delivered * 1000.0 if self.delivered else 0.0,
+            "latency_ms_max": self.latency_max * 1000.0,
+            "analysis_ms": self.analysis_time * 1000.0,
+        }
+
+
+# The samples of a capture file, sent at the capture's own sample rate. The
+# sample times are fitted to a fixed rate (like the clock sync would) and
+# samples missing from the capture are sent as errors.
+class CaptureFeed:
+    def __init__(self, times: np.ndarray, freqvals: np.ndarray):
+        times = np.asarray(times, dtype=np.float64)
+        interval = float(np.median(np.diff(times))) if len(times) > 1 else 0.004
+        idx = np.rint((times - times[0]) / interval).astype(np.intp)
+        if len(times) > 1:
+            interval, self._t0 = np.polyfit(idx, times, 1)
+        else:
+            self._t0 = float(times[0])
+        self.interval = float(interval)
+        self.count = int(idx[-1]) + 1
+        self.time_base = 0.0
+        self.indices = idx
+        self._freqvals = np.full(self.count, ERROR_FREQVAL, dtype=np.uint32)
+        self._freqvals[idx] = freqvals
+
+    def start(self, print_time: float):
+        self.time_base = print_time + self.interval
+
+    # capture times to replay times
+    def shift(self, capture_times):
+        return np.asarray(capture_times, dtype=np.float64) - self._t0 + self.time_base
+
+    @property
+    def end_time(self) -> float:
+        return self.time_base + (self.count - 1) * self.interval
+
+    def freqvals(self, start: int, end: int) -> np.ndarray:
+        return self._freqvals[start:end]
+
+
+# Endless samples computed from the toolhead position at each sample time
+class SyntheticFeed:
+    def __init__(self, interval: float, freqvals_fn: Callable[[np.ndarray], np.ndarray]):
+        self.interval = interval
+        self.count = None
+        self.time_base = 0.0
+        self._fn = freqvals_fn
+
+    def start(self, print_time: float):
+        self.time_base = print_time + self.interval
+
+    def freqvals(self, start: int, end: int) -> np.ndarray:
+        return self._fn(self.time_base + np.arange(start, end) * self.interval)
+
+
+# FixedFreqReader that gets its samples from a feed: every complete block
+# of samples (and, at the end of a capture, the last partial one) that was
+# taken by the time of a pull is sent as a bulk message. The reader is its
+# own bulk queue and clock sync.
+class ReplayFixedFreqReader:
+    def __init__(self, mcu: ReplayMCU, chip_clock_smooth, unpack_fmt):
+        self._mcu = mcu
+        self._reactor = mcu.get_printer().get_reactor()
+        self.bytes_per_sample = struct.calcsize(unpack_fmt)
+        self.samples_per_block = MAX_BULK_MSG_SIZE // self.bytes_per_sample
+        self.last_sequence = 0
+        self.bulk_queue = self
+        self.clock_sync = self
+        self.feed = None
+        self.stats = ReplayStats()
+        self._running = False
+        self._sent = 0
+        self.last_chip_clock = -1
+
+    def setup_query_command(self, msgformat, oid, cq):
+        pass
+
+    def note_start(self):
+        self.last_sequence = 0
+        self._sent = 0
+        self.last_chip_clock = -1
+        self._running = True
+        if self.feed is not None:
+            self.feed.start(self._mcu.estimated_print_time(self._reactor.monotonic()))
+
+    def note_end(self):
+        self._running = False
+
+    # Like the mcu's answer to the clock query: the sequence of the next block it
+    # will send. Decoding samples must leave this alone, and must report the chip
+    # clock of the last sample it decoded, as klipper's pull_samples() does.
+    def _update_clock(self):
+        if self.last_chip_clock != self._sent - 1:
+            raise AssertionError(f"replay: last chip clock {self.last_chip_clock} isn't the last sample pulled ({self._sent - 1})")
+        seq_diff = ((self._sent // self.samples_per_block) - self.last_sequence) & 0xFFFF
+        self.last_sequence += seq_diff
+
+    def set_last_chip_clock(self, chip_clock):
+        self.last_chip_clock = chip_clock
+
+    def get_time_translation(self):
+        if self.feed is None:
+            return 0.0, 0, 0.0
+        return self.feed.time_base, 0, self.feed.interval
+
+    def get_last_overflows(self):
+        return 0
+
+    def pull_queue(self):
+        feed = self.feed
+        if feed is None or not self._running:
+            return []
+        now = self._mcu.estimated_print_time(self._reactor.monotonic())
+        spb = self.samples_per_block
+        taken = int(math.floor((now - feed.time_base) / feed.interval)) + 1
+        if feed.count is not None and taken >= feed.count:
+            end = feed.count
+        else:
+            end = taken - taken % spb
+        if end <= self._sent:
+            return []
+
+        t0 = time.perf_counter()
+        freqvals = feed.freqvals(self._sent, end).astype(">u4")
+        self.stats.feed_time += time.perf_counter() - t0
+        msgs = []
+        for start in range(self._sent, end, spb):
+            data = freqvals[start - self._sent : min(start + spb, end) - self._sent].tobytes()
+            msgs.append({"sequence": (start // spb) & 0xFFFF, "data": data})
+        self.stats.note_delivery(now, feed.time_base + np.arange(self._sent, end) * feed.interval)
+        self._sent = end
+        return msgs
+
+    def pull_samples(self):
+        self._update_clock()
+        raw_samples = self.pull_queue()
+        time_base, chip_base, inv_freq = self.get_time_translation()
+        samples = []
+        seq = i = 0
+        for params in raw_samples:
+            seq_diff = (params["sequence"] - self.last_sequence) & 0xFFFF
+            seq_diff -= (seq_diff & 0x8000) << 1
+            seq = self.last_sequence + seq_diff
+            first = seq * self.samples_per_block - chip_base
+            for i, (val,) in enumerate(struct.iter_unpack(">I", params["data"])):
+                samples.append((time_base + (first + i) * inv_freq, val))
+        if raw_samples:
+            self.set_last_chip_clock(seq * self.samples_per_block + i)
+        return samples
+
+
+# Same as klipper's BatchBulkHelper, timing the batch callback and clients
+class ReplayBatchBulkHelper:
+    def __init__(self, printer, batch_cb, start_cb=None, stop_cb=None, batch_interval=0.500):
+        self.printer = printer
+        self.batch_cb = batch_cb
+        self.start_cb = start_cb or (lambda: None)
+        self.stop_cb = stop_cb or (lambda: None)
+        self.batch_interval = batch_interval
+        self.is_started = False
+        self.batch_timer = None
+        self.client_cbs = []
+        self.stats = ReplayStats()
+
+    def _start(self):
+        if self.is_started:
+            return
+        self.is_started = True
+        try:
+            self.start_cb()
+        except CommandError:
+            self.is_started = False
+            del self.client_cbs[:]
+            raise
+        reactor = self.printer.get_reactor()
+        self.batch_timer = reactor.register_timer(self._proc_batch, reactor.monotonic() + self.batch_interval)
+
+    def _stop(self):
+        del self.client_cbs[:]
+        self.printer.get_reactor().unregister_timer(self.batch_timer)
+        self.batch_timer = None
+        if not self.is_started:
+            return
+        self.stop_cb()
+        self.is_started = False
+        if self.client_cbs:
+            self._start()
+
+    def _proc_batch(self, eventtime):
+        feed_time = self.stats.feed_time
+        t0 = time.perf_counter()
+        msg = self.batch_cb(eventtime)
+        t1 = time.perf_counter()
+        t0 += self.stats.feed_time - feed_time
+        if not msg:
+            self.stats.note_batch(t1 - t0, 0.0, msg)
+            return eventtime + self.batch_interval
+        for client_cb in list(self.client_cbs):
+            res = client_cb(msg)
+            if not res:
+                self.client_cbs.remove(client_cb)
+                if not self.client_cbs:
+                    self.stats.note_batch(t1 - t0, time.perf_counter() - t1, msg)
+                    self._stop()
+                    return self.printer.get_reactor().NEVER
+        self.stats.note_batch(t1 - t0, time.perf_counter() - t1, msg)
+        return eventtime + self.batch_interval
+
+    def add_client(self, client_cb):
+        self.client_cbs.append(client_cb)
+        self._start()
+
+
+class BatchWebhooksClient:
+    def __init__(self, web_request):
+        self.web_request = web_request
+
+    def handle_batch(self, msg):
+        return False
+
+
+#
+# Motion
+#
+
+
+# One constant-acceleration trapq segment; also what trapq_extract_old fills in
+class ReplayMove:
+    __slots__ = ("print_time", "move_t", "start_v", "accel", "start_x", "start_y", "start_z", "x_r", "y_r", "z_r")
+
+    def __init__(self, print_time=0.0, move_t=0.0, start_v=0.0, accel=0.0, start_pos=(0.0, 0.0, 0.0), axes_r=(0.0, 0.0, 0.0)):
+        self.print_time = print_time
+        self.move_t = move_t
+        self.start_v = start_v
+        self.accel = accel
+        self.start_x, self.start_y, self.start_z = (float(v) for v in start_pos)
+        self.x_r, self.y_r, self.z_r = (float(v) for v in axes_r)
+
+    def end_position(self) -> Tuple[float, float, float]:
+        dist = (self.start_v + 0.5 * self.accel * self.move_t) * self.move_t
+        return (self.start_x + self.x_r * dist, self.start_y + self.y_r * dist, self.start_z + self.z_r * dist)
+
+
+# Move history with klipper's trapq semantics: set_position leaves a
+# zero-length marker, and gaps between moves are filled with null moves at
+# the next move's start position
+class ReplayTrapQ:
+    def __init__(self):
+        self.moves: List[ReplayMove] = []
+
+    def set_position(self, print_time: float, pos):
+        while self.moves and self.moves[-1].print_time >= print_time:
+            self.moves.pop()
+        if self.moves:
+            last = self.moves[-1]
+            last.move_t = min(last.move_t, print_time - last.print_time)
+        self.moves.append(ReplayMove(print_time, 0.0, 0.0, 0.0, pos[:3]))
+
+    def append(self, print_time, move_t, start_v, accel, start_pos, axes_r):
+        if self.moves:
+            last = self.moves[-1]
+            last_end = last.print_time + last.move_t
+            if last_end < print_time:
+                self.moves.append(ReplayMove(last_end, print_time - last_end, 0.0, 0.0, start_pos))
+        self.moves.append(ReplayMove(print_time, move_t, start_v, accel, start_pos, axes_r))
+
+    # Positions at sorted times; before the first move, the first move's start
+    def positions(self, times: np.ndarray) -> np.ndarray:
+        m_print_time = np.array([m.print_time for m in self.moves])
+        m_move_t = np.array([m.move_t for m in self.moves])
+        m_start_v = np.array([m.start_v for m in self.moves])
+        m_accel = np.array([m.accel for m in self.moves])
+        m_start = np.array([(m.start_x, m.start_y, m.start_z) for m in self.moves])
+        m_axes_r = np.array([(m.x_r, m.y_r, m.z_r) for m in self.moves])
+
+        idx = np.maximum(np.searchsorted(m_print_time, times, side="left") - 1, 0)
+        move_time = np.clip(times - m_print_time[idx], 0.0, m_move_t[idx])
+        dist = (m_start_v[idx] + 0.5 * m_accel[idx] * move_time) * move_time
+        return m_start[idx] + m_axes_r[idx] * dist[:, np.newaxis]
+
+
+class ReplayFFI:
+    def new(self, ctype):
+        m = re.fullmatch(r"struct pull_move\[(\d+)\]", ctype)
+        if m is None:
+            raise ValueError(f"replay: unsupported ffi type {ctype}")
+        return [ReplayMove() for _ in range(int(m.group(1)))]
+
+
+class ReplayFFILib:
+    # history is walked newest first, as in trapq.c
+    def trapq_extract_old(self, tq: ReplayTrapQ, data, max_count, start_time, end_time):
+        res = 0
+        for m in reversed(tq.moves):
+            if start_time >= m.print_time + m.move_t or res >= max_count:
+                break
+            if end_time <= m.print_time:
+                continue
+            data[res] = m
+            res += 1
+        return res
+
+
+_ffi = (ReplayFFI(), ReplayFFILib())
+
+
+def get_ffi():
+    return _ffi
+
+
+class ReplayKinematics:
+    def get_status(self, eventtime):
+        return {"homed_axes": "xyz"}
+
+    def get_steppers(self):
+        return []
+
+    def clear_homing_state(self, axes):
+        pass
+
+
+# Toolhead that plans moves as trapezoids straight into the trapq. Moves are
+# queued back to back; an idle toolhead starts moving BUFFER_TIME_START after
+# the current time, like klipper's.
+class ReplayToolhead:
+    BUFFER_TIME_START = 0.250
+
+    def __init__(self, printer: ReplayPrinter, max_accel: float = 3000.0):
+        self._reactor = printer.get_reactor()
+        self.max_accel = max_accel
+        self.trapq = ReplayTrapQ()
+        self.kin = ReplayKinematics()
+        self._pos = [0.0, 0.0, 10.0, 0.0]
+        self._last_move_time = 0.0
+        self.trapq.set_position(0.0, self._pos)
+
+    def get_trapq(self):
+        return self.trapq
+
+    def get_kinematics(self):
+        return self.kin
+
+    def get_position(self):
+        return list(self._pos)
+
+    def set_position(self, newpos, homing_axes=""):
+        self._pos = list(newpos)
+        self.trapq.set_position(self.get_last_move_time(), self._pos)
+
+    def get_last_move_time(self):
+        now = self._reactor.monotonic()
+        if self._last_move_time < now:
+            self._last_move_time = now + self.BUFFER_TIME_START
+        return self._last_move_time
+
+    def manual_move(self, coord, speed):
+        newpos = list(self._pos)
+        for i, c in enumerate(coord):
+            if c is not None:
+                newpos[i] = c
+        self.move(newpos, speed)
+
+    def move(self, newpos, speed):
+        start = np.array(self._pos[:3], dtype=np.float64)
+        axes_d = np.array(newpos[:3], dtype=np.float64) - start
+        dist = float(np.linalg.norm(axes_d))
+        self._pos = list(newpos)
+        if dist < 1e-9:
+            return
+        axes_r = axes_d / dist
+
+        accel = self.max_accel
+        cruise_v = speed
+        accel_t = cruise_v / accel
+        accel_d = 0.5 * accel * accel_t * accel_t
+        if 2.0 * accel_d > dist:
+            cruise_v = math.sqrt(dist * accel)
+            accel_t = cruise_v / accel
+            accel_d = 0.5 * dist
+        cruise_t = (dist - 2.0 * accel_d) / cruise_v
+
+        print_time = self.get_last_move_time()
+        pos = start
+        for move_t, start_v, a in ((accel_t, 0.0, accel), (cruise_t, cruise_v, 0.0), (accel_t, cruise_v, -accel)):
+            if move_t <= 0.0:
+                continue
+            self.trapq.append(print_time, move_t, start_v, a, pos, axes_r)
+            pos = pos + axes_r * ((start_v + 0.5 * a * move_t) * move_t)
+            print_time += move_t
+        self._last_move_time = print_time
+
+    # Follow a recorded path: straight segments between the (N, 3) positions,
+    # each at its own constant velocity
+    def replay_path(self, times: np.ndarray, positions: np.ndarray):
+        for i in range(len(times) - 1):
+            move_t = times[i + 1] - times[i]
+            if move_t <= 0.0:
+                continue
+            axes_d = positions[i + 1] - positions[i]
+            dist = float(np.linalg.norm(axes_d))
+            axes_r = axes_d / dist if dist > 0.0 else np.zeros(3)
+            self.trapq.append(float(times[i]), float(move_t), dist / move_t, 0.0, positions[i], axes_r)
+        self._pos[:3] = [float(v) for v in positions[-1]]
+        self._last_move_time = max(self._last_move_time, float(times[-1]))
+
+    def dwell(self, delay):
+        self._last_move_time = self.get_last_move_time() + max(0.0, delay)
+
+    def wait_moves(self):
+        if self._last_move_time > self._reactor.monotonic():
+            self._reactor.pause(self._last_move_time)
+
+    def flush_step_generation(self):
+        pass
+
+    def register_lookahead_callback(self, callback):
+        callback(self.get_last_move_time())
+
+
+#
+# Loading the module under test
+#
+
+
+# Install the stand-ins as the klippy modules that probe_eddy_ng and
+# ldc1612_ng import
+def install_klippy_standins():
+    def module(name, **attrs):
+        m = types.ModuleType(name)
+        m.__dict__.update(attrs)
+        sys.modules[name] = m
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, m)
+        return m
+
+    module("klippy", __path__=[])
+    module("klippy.extras", __path__=[])
+    module("klippy.mcu", MCU_trsync=MCU_trsync, TriggerDispatch=TriggerDispatch)
+    module("klippy.pins", error=PinsError)
+    module("klippy.chelper", get_ffi=get_ffi)
+    module("klippy.printer", Printer=ReplayPrinter)
+    module("klippy.configfile", ConfigWrapper=ReplayConfig, error=ConfigError)
+    module("klippy.gcode", GCodeCommand=ReplayGCodeCommand, CommandError=CommandError)
+    module("klippy.toolhead", ToolHead=ReplayToolhead)
+    module("klippy.extras.probe")
+    module("klippy.extras.manual_probe")
+    module("klippy.extras.bed_mesh", ZMesh=ReplayZMesh, BedMeshError=BedMeshError)
+    module("klippy.extras.homing", HomingMove=HomingMove)
+    module("klippy.extras.bus", MCU_I2C_from_config=MCU_I2C_from_config)
+    module(
+        "klippy.extras.bulk_sensor",
+        FixedFreqReader=ReplayFixedFreqReader,
+        BatchBulkHelper=ReplayBatchBulkHelper,
+        BatchWebhooksClient=BatchWebhooksClient,
+    )
+
+
+# Load this directory as a package, the way Kalico loads it as a plugin
+def load_probe_eddy_ng():
+    install_klippy_standins()
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location("eddy_ng", os.path.join(here, "__init__.py"), submodule_search_locations=[here])
+    pkg = importlib.util.module_from_spec(spec)
+    sys.modules["eddy_ng"] = pkg
+    spec.loader.exec_module(pkg)
+    return sys.modules["eddy_ng.probe_eddy_ng"]
+
+
+#
+# Captures
+#
+
+
+def _read_csv(path: str) -> Tuple[List[str], List[List[str]]]:
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return lines[0].split(","), [line.split(",") for line in lines[1:]]
+
+
+def _column(rows: List[List[str]], idx: int) -> np.ndarray:
+    return np.array([float(r[idx]) if idx < len(r) and r[idx] != "" else np.nan for r in rows])
+
+
+# time, freq, z and v of every calibration sample. The rows are written as
+# time,frequency,z,,v even though the header has more columns.
+def load_calibration_capture(path: str) -> Dict[str, np.ndarray]:
+    _, rows = _read_csv(path)
+    return {"time": _column(rows, 0), "frequency": _column(rows, 1), "z": _column(rows, 2), "v": _column(rows, 4)}
+
+
+# A sampler capture (tap or static probe), by column name
+def load_samples_capture(path: str) -> Dict[str, np.ndarray]:
+    header, rows = _read_csv(path)
+    return {name: _column(rows, i) for i, name in enumerate(header)}
+
+
+# A mesh capture as a grid: (xs, ys, heights[y, x])
+def load_mesh_capture(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    header, rows = _read_csv(path)
+    cols = {name: _column(rows, i) for i, name in enumerate(header)}
+    xs = np.unique(np.round(cols["x"], 6))
+    ys = np.unique(np.round(cols["y"], 6))
+    grid = np.full((len(ys), len(xs)), np.nan)
+    grid[np.searchsorted(ys, np.round(cols["y"], 6)), np.searchsorted(xs, np.round(cols["x"], 6))] = cols["z"]
+    if np.isnan(grid).any():
+        raise ValueError(f"{path}: mesh points don't form a grid")
+    return xs, ys, grid
+
+
+# Bilinear interpolation on a grid, clamped to its edges
+def grid_interp(xs: np.ndarray, ys: np.ndarray, grid: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    def axis(vals, v):
+        if len(vals) == 1:
+            return np.zeros(len(v), dtype=np.intp), np.zeros(len(v))
+        v = np.clip(v, vals[0], vals[-1])
+        i = np.clip(np.searchsorted(vals, v, side="right") - 1, 0, len(vals) - 2)
+        return i, (v - vals[i]) / (vals[i + 1] - vals[i])
+
+    xi, xf = axis(xs, x)
+    yi, yf = axis(ys, y)
+    xi1 = np.minimum(xi + 1, len(xs) - 1)
+    yi1 = np.minimum(yi + 1, len(ys) - 1)
+    top = grid[yi, xi] * (1.0 - xf) + grid[yi, xi1] * xf
+    bottom = grid[yi1, xi] * (1.0 - xf) + grid[yi1, xi1] * xf
+    return top * (1.0 - yf) + bottom * yf
+
+
+def capture_sample_rate(times: np.ndarray) -> int:
+    return int(round(1.0 / float(np.median(np.diff(times)))))
+
+
+#
+# Replays
+#
+
+
+def _round(v, digits=6):
+    if isinstance(v, dict):
+        return {k: _round(x, digits) for k, x in v.items()}
+    if isinstance(v, (list, tuple, np.ndarray)):
+        return [_round(x, digits) for x in v]
+    if isinstance(v, (float, np.floating)):
+        return None if math.isnan(v) else round(float(v), digits)
+    if isinstance(v, np.integer):
+        return int(v)
+    return v
+
+
+# Stands in for ProbeEddyExecutor's worker pool: jobs run inline when they're
+# started, so their results don't depend on how long a worker takes in real
+# time (which the virtual clock skips through while waiting). The job and its
+# result still go through pickle, like they would to and from a worker.
+class ReplayPool:
+    def apply_async(self, fn, args):
+        fn, args = pickle.loads(pickle.dumps((fn, args)))
+        try:
+            result = ReplayAsyncResult(pickle.loads(pickle.dumps(fn(*args))), None)
+        except Exception as e:
+            result = ReplayAsyncResult(None, e)
+        return result
+
+    def terminate(self):
+        pass
+
+
+class ReplayAsyncResult:
+    def __init__(self, value, error: Optional[Exception]):
+        self._value = value
+        self._error = error
+
+    def ready(self) -> bool:
+        return True
+
+    def get(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class ReplayHarness:
+    def __init__(self, peng, fileconfig, autosave, section: str, echo: bool = False):
+        self.peng = peng
+        self.printer = printer = ReplayPrinter()
+        self.reactor = printer.get_reactor()
+        self.gcode = ReplayGCode(echo)
+        self.mcu = ReplayMCU(printer)
+        self.toolhead = ReplayToolhead(printer, fileconfig.getfloat("printer", "max_accel", fallback=3000.0))
+        printer.add_object("gcode", self.gcode)
+        printer.add_object("webhooks", ReplayWebhooks())
+        printer.add_object("pins", ReplayPins())
+        printer.add_object("configfile", ReplayConfigFile(autosave))
+        printer.add_object("mcu", self.mcu)
+        printer.add_object("toolhead", self.toolhead)
+
+        self.eddy = peng.ProbeEddy(ReplayConfig(printer, fileconfig, section))
+        self.eddy._executor._new_pool = ReplayPool
+        self.sensor = self.eddy._sensor
+        self.mcu.run_config_callbacks()
+        printer.send_event("klippy:mcu_identify")
+        printer.send_event("klippy:connect")
+
+    # Let the batch timer run until every sampler has been dropped
+    def settle(self):
+        self.reactor.pause(self.reactor.monotonic() + 3.0 * self.sensor._batch_bulk.batch_interval)
+        self.sensor._ffreader.feed = None
+
+    def run(self, kind: str, path: str, dc: int, fn) -> Dict[str, Any]:
+        stats = ReplayStats()
+        self.sensor._ffreader.stats = stats
+        self.sensor._batch_bulk.stats = stats
+        self.sensor.set_drive_current(dc)
+        try:
+            results = fn(path, dc, stats)
+        except CommandError as e:
+            results = {"error": str(e)}
+            if self.eddy._sampler is not None:
+                self.eddy._sampler.finish()
+        self.settle()
+        return {"name": f"{kind}:{os.path.basename(path)}", "path": path, "drive_current": dc, "results": _round(results), "bench": stats.summary()}
+
+    def _stream(self, feed, calculate_heights: bool, path_times=None, path_positions=None):
+        self.sensor._ffreader.feed = feed
+        with self.eddy.start_sampler(calculate_heights=calculate_heights) as sampler:
+            if path_times is not None and len(path_times) > 1:
+                self.toolhead.replay_path(feed.shift(path_times), path_positions)
+            self.reactor.pause(feed.end_time)
+            sampler.wait_for_sample_at_time(feed.end_time)
+            sampler.finish()
+        return sampler
+
+    def _path_positions(self, zs: np.ndarray) -> np.ndarray:
+        pos = np.empty((len(zs), 3))
+        pos[:, 0] = self.toolhead._pos[0]
+        pos[:, 1] = self.toolhead._pos[1]
+        pos[:, 2] = zs
+        return pos
+
+    def replay_calibration(self, path: str, dc: int, stats: ReplayStats):
+        cap = load_calibration_capture(path)
+        conv = self.sensor.freqval_conversion_value()
+        feed = CaptureFeed(cap["time"], np.rint(cap["frequency"] / conv).astype(np.uint32))
+        sampler = self._stream(feed, False, cap["time"], self._path_positions(cap["z"]))
+
+        t0 = time.perf_counter()
+        times = sampler.times
+        positions, vels = self.eddy._get_trapq_positions(times)
+        keep = (times >= feed.shift(cap["time"][0])) & (times <= feed.shift(cap["time"][-1])) & ~np.isnan(vels)
+        fmap = self.peng.ProbeEddyFrequencyMap(self.eddy)
+        rmse_fth, rmse_htf = fmap.calibrate_from_values(
+            dc, times[keep].tolist(), sampler.freqs[keep].tolist(), positions[keep, 2].tolist(), vels[keep].tolist(), True, False
+        )
+        stats.analysis_time += time.perf_counter() - t0
+
+        if rmse_fth is None:
+            return {"samples": int(np.count_nonzero(keep)), "calibrated": False}
+
+        # the saved calibration is what the other captures were taken with, so
+        # only fall back to this one
+        used = dc not in self.eddy._dc_to_fmap
+        if used:
+            self.eddy._dc_to_fmap[dc] = fmap
+        return {
+            "samples": int(np.count_nonzero(keep)),
+            "calibrated": True,
+            "used": used,
+            "rmse_fth": rmse_fth,
+            "rmse_htf": rmse_htf,
+            "height_range": list(fmap.height_range),
+            "freq_range": list(fmap.freq_range),
+        }
+
+    def _sample_freqvals(self, cap: Dict[str, np.ndarray]) -> np.ndarray:
+        freqvals = np.rint(cap["frequency"] / self.sensor.freqval_conversion_value())
+        if "raw_f" in cap:
+            have_raw = ~np.isnan(cap["raw_f"])
+            freqvals[have_raw] = cap["raw_f"][have_raw]
+        return freqvals.astype(np.uint32)
+
+    def _height_diff(self, sampler, cap) -> Optional[float]:
+        n = min(len(sampler.heights), len(cap["z"]))
+        if n == 0 or np.isnan(cap["z"][:n]).all():
+            return None
+        return float(np.nanmax(np.abs(sampler.heights[:n] - cap["z"][:n])))
+
+    def replay_tap(self, path: str, dc: int, stats: ReplayStats):
+        cap = load_samples_capture(path)
+        feed = CaptureFeed(cap["time"], self._sample_freqvals(cap))
+        have_kin = ~np.isnan(cap["kin_z"])
+        sampler = self._stream(feed, True, cap["time"][have_kin], self._path_positions(cap["kin_z"][have_kin]))
+
+        result: Dict[str, Any] = {"samples": sampler.height_count, "max_height_diff": self._height_diff(sampler, cap)}
+        trigger_time = cap["trigger_time"][0]
+        tap_start_time = cap["tap_start_time"][0]
+        if np.isnan(trigger_time) or np.isnan(tap_start_time) or not have_kin.any():
+            # older captures don't have the trigger times
+            return result
+
+        t0 = time.perf_counter()
+        tap_end = float(feed.shift(trigger_time))
+        tap_start = float(feed.shift(tap_start_time))
+        tap_time = tap_start + (tap_end - tap_start) * self.eddy.params.tap_time_position
+        probe_z = self.eddy._get_trapq_height(tap_time)
+        after = have_kin & (cap["time"] >= trigger_time)
+        finish_z = float(np.min(cap["kin_z"][after])) if after.any() else probe_z
+        stats.analysis_time += time.perf_counter() - t0
+
+        result["tap"] = self.peng.ProbeEddy.TapResult(
+            error=None,
+            probe_z=probe_z,
+            toolhead_z=finish_z,
+            overshoot=probe_z - finish_z,
+            tap_time=tap_time,
+            tap_start_time=tap_start,
+            tap_end_time=tap_end,
+        )
+        return result
+
+    def replay_static(self, path: str, dc: int, stats: ReplayStats):
+        cap = load_samples_capture(path)
+        feed = CaptureFeed(cap["time"], self._sample_freqvals(cap))
+        if "kin_z" in cap and not np.isnan(cap["kin_z"]).all():
+            self.toolhead.set_position([self.toolhead._pos[0], self.toolhead._pos[1], float(np.nanmedian(cap["kin_z"])), 0.0])
+
+        # probe over as much of the capture as PROBE_STATIC's default duration allows
+        duration = min(0.100, (feed.count - 1) * feed.interval - self.sensor._ldc_settle_time)
+        self.sensor._ffreader.feed = feed
+        t0 = time.perf_counter()
+        r = self.eddy.probe_static_height(duration)
+        stats.analysis_time += time.perf_counter() - t0
+        if not r.valid:
+            return {"samples": 0}
+        return {
+            "samples": len(r.samples),
+            "value": r.value,
+            "mean": r.mean,
+            "stddev": r.stddev,
+            "min": r.min_value,
+            "max": r.max_value,
+            "max_height_diff": self._height_diff(self.eddy._last_sampler, cap),
+        }
+
+    def replay_mesh(self, path: str, dc: int, density: int, stats: ReplayStats):
+        xs, ys, captured = load_mesh_capture(path)
+        helper = self.eddy._bed_mesh_helper
+        helper.mesh_csv_path = None
+        scan_z = helper._scan_z
+        x_offset, y_offset = self.eddy.params.x_offset, self.eddy.params.y_offset
+
+        # the sensor reads the captured bed heights, offset by how far the
+        # toolhead is from the scan height
+        fmap = self.eddy.map_for_drive_current(dc)
+        fmap.ensure_parsed()
+        conv = self.sensor.freqval_conversion_value()
+        hmin, hmax = fmap.height_range
+
+        def freqvals_at(times):
+            pos = self.toolhead.trapq.positions(times)
+            heights = pos[:, 2] - scan_z + grid_interp(xs, ys, captured, pos[:, 0] + x_offset, pos[:, 1] + y_offset)
+            heights = np.clip(heights, hmin, hmax)
+            freqs, in_range = fmap._htof_lut.lookup(heights)
+            if not in_range.all():
+                freqs[~in_range] = 1.0 / self.peng.np_fit_eval(fmap._htof, heights[~in_range])
+            return np.rint(freqs / conv).astype(np.uint32)
+
+        self.sensor._ffreader.feed = SyntheticFeed(1.0 / self.sensor._data_rate, freqvals_at)
+        t0 = time.perf_counter()
+        helper.scan(density)
+        wall = time.perf_counter() - t0
+
+        matrix = np.array(self.printer.lookup_object("bed_mesh").z_mesh.probed_matrix)
+        mx = np.linspace(helper._x_min, helper._x_max, matrix.shape[1])
+        my = np.linspace(helper._y_min, helper._y_max, matrix.shape[0])
+        gx, gy = np.meshgrid(mx, my)
+        expected = scan_z - grid_interp(xs, ys, captured, gx.ravel(), gy.ravel()).reshape(matrix.shape)
+        stats.analysis_time += wall
+        return {
+            "shape": list(matrix.shape),
+            "min": float(matrix.min()),
+            "max": float(matrix.max()),
+            "mean": float(matrix.mean()),
+            "max_diff": float(np.max(np.abs(matrix - expected))),
+        }
+
+    # The tap results together, through the same cluster selection as TAP
+    def tap_summary(self, replays: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        taps = []
+        for r in replays:
+            tap = r["results"].pop("tap", None)
+            if tap is not None:
+                r["results"].update(_round({"probe_z": tap.probe_z, "overshoot": tap.overshoot}))
+                taps.append(tap)
+        params = self.eddy.params
+        if len(taps) < params.tap_samples:
+            return None
+        t0 = time.perf_counter()
+        tap_z, stddev, overshoot = self.eddy._compute_tap_z(taps, params.tap_samples, params.tap_samples_stddev, params.tap_use_median)
+        wall = time.perf_counter() - t0
+        return {
+            "name": "tap-summary",
+            "path": "",
+            "results": _round({"taps": len(taps), "tap_z": tap_z, "stddev": stddev, "overshoot": overshoot}),
+            "bench": {"analysis_ms": wall * 1000.0},
+        }
+
+
+#
+# Command line
+#
+
+
+def find_section(fileconfig, section: Optional[str]) -> str:
+    if section is not None:
+        return section
+    for s in fileconfig.sections():
+        if s.split()[0] == "probe_eddy_ng":
+            return s
+    return "probe_eddy_ng replay"
+
+
+def set_default(fileconfig, section: str, option: str, value: str):
+    if not fileconfig.has_section(section):
+        fileconfig.add_section(section)
+    if not fileconfig.has_option(section, option):
+        fileconfig.set(section, option, value)
+
+
+def build_config(args, captures) -> Tuple[configparser.RawConfigParser, configparser.RawConfigParser, str]:
+    if args.config:
+        fileconfig, autosave = read_config_file(args.config)
+    else:
+        fileconfig, autosave = new_fileconfig(), new_fileconfig()
+    section = find_section(fileconfig, args.section)
+
+    for setting in args.set:
+        key, _, value = setting.partition("=")
+        sect, _, option = key.rpartition(":")
+        sect = sect or section
+        if not fileconfig.has_section(sect):
+            fileconfig.add_section(sect)
+        fileconfig.set(sect, option.strip(), value.strip())
+
+    set_default(fileconfig, section, "sensor_type", "btt_eddy")
+    if not fileconfig.has_option(section, "x_offset") and not fileconfig.has_option(section, "y_offset"):
+        set_default(fileconfig, section, "y_offset", "20.0")
+
+    # the captures know what rate they were taken at
+    for kind, path in captures:
+        if kind in ("calibration", "tap", "static"):
+            times = _column(_read_csv(path)[1], 0)
+            if len(times) > 1:
+                set_default(fileconfig, section, "samples_per_second", str(capture_sample_rate(times)))
+                break
+
+    # the mesh capture gives the mesh bounds, unless configured
+    mesh_paths = [path for kind, path in captures if kind == "mesh"]
+    if mesh_paths:
+        xs, ys, _ = load_mesh_capture(mesh_paths[0])
+        x_count = (len(xs) - 1) // args.density + 1
+        set_default(fileconfig, "bed_mesh", "mesh_min", f"{xs[0]},{ys[0]}")
+        set_default(fileconfig, "bed_mesh", "mesh_max", f"{xs[-1]},{ys[-1]}")
+        set_default(fileconfig, "bed_mesh", "probe_count", f"{x_count},{len(ys)}")
+    set_default(fileconfig, "bed_mesh", "mesh_min", "10,10")
+    set_default(fileconfig, "bed_mesh", "mesh_max", "100,100")
+    set_default(fileconfig, "bed_mesh", "probe_count", "3,3")
+
+    return fileconfig, autosave, section
+
+
+def find_captures(args) -> List[Tuple[str, str]]:
+    explicit = args.calibration or args.tap or args.static or args.mesh
+    captures = []
+
+    def tap_number(path):
+        m = re.search(r"(\d+)\.csv$", path)
+        return int(m.group(1)) if m else 0
+
+    if args.calibration:
+        captures.append(("calibration", args.calibration))
+    elif not explicit and os.path.exists(DEFAULT_CALIBRATION_PATH):
+        captures.append(("calibration", DEFAULT_CALIBRATION_PATH))
+    taps = args.tap if args.tap else ([] if explicit else sorted(glob.glob(DEFAULT_TAP_PATHS), key=tap_number))
+    captures.extend(("tap", p) for p in taps)
+    if args.static:
+        captures.append(("static", args.static))
+    elif not explicit and os.path.exists(DEFAULT_STATIC_PATH):
+        captures.append(("static", DEFAULT_STATIC_PATH))
+    if args.mesh:
+        captures.append(("mesh", args.mesh))
+    elif not explicit and os.path.exists(DEFAULT_MESH_PATH):
+        captures.append(("mesh", DEFAULT_MESH_PATH))
+    return captures
+
+
+def run_replays(peng, args, captures, fileconfig, autosave, section) -> List[Dict[str, Any]]:
+    harness = ReplayHarness(peng, fileconfig, autosave, section, echo=args.verbose)
+    eddy = harness.eddy
+    reg_dc = args.drive_current or eddy._reg_drive_current
+    tap_dc = args.drive_current or eddy._tap_drive_current
+
+    replays = []
+    for kind, path in captures:
+        if kind == "calibration":
+            replays.append(harness.run(kind, path, reg_dc, harness.replay_calibration))
+            continue
+        dc = tap_dc if kind == "tap" else reg_dc
+        if not eddy.calibrated(dc):
+            replays.append({"name": f"{kind}:{os.path.basename(path)}", "path": path, "drive_current": dc,
+                            "results": {"skipped": f"drive current {dc} not calibrated"}, "bench": {}})
+        elif kind == "tap":
+            replays.append(harness.run(kind, path, dc, harness.replay_tap))
+        elif kind == "static":
+            replays.append(harness.run(kind, path, dc, harness.replay_static))
+        elif kind == "mesh":
+            replays.append(harness.run(kind, path, dc, lambda p, d, s: harness.replay_mesh(p, d, args.density, s)))
+
+    summary = harness.tap_summary([r for r in replays if r["name"].startswith("tap:")])
+    if summary is not None:
+        replays.append(summary)
+    return replays
+
+
+def format_replay(r: Dict[str, Any]) -> str:
+    lines = [f"{r['name']} ({r['path']})" if r["path"] else r["name"]]
+    results = ", ".join(f"{k}={v}" for k, v in r["results"].items())
+    lines.append(f"  results: {results}")
+    b = r["bench"]
+    if "batches" in b:
+        lines.append(
+            f"  bench: {b['samples']} samples ({b['errors']} errors) in {b['batches']} batches; "
+            f"_process_batch {b['process_ms_avg']:.3f} ms avg, {b['process_ms_max']:.3f} ms max "
+            f"({b['samples_per_s'] / 1e6:.2f}M samples/s); clients {b['clients_ms_avg']:.3f} ms avg; "
+            f"delivery latency {b['latency_ms_avg']:.1f} ms avg, {b['latency_ms_max']:.1f} ms max; "
+            f"analysis {b['analysis_ms']:.1f} ms"
+        )
+    elif "analysis_ms" in b:
+        lines.append(f"  bench: analysis {b['analysis_ms']:.3f} ms")
+    return "\n".join(lines)
+
+
+def compare_results(expected, actual, tolerance: float, where: str = "") -> List[str]:
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        diffs = []
+        for k in sorted(set(expected) | set(actual)):
+            if k not in actual or k not in expected:
+                diffs.append(f"{where}{k}: expected {expected.get(k)!r}, got {actual.get(k)!r}")
+            else:
+                diffs.extend(compare_results(expected[k], actual[k], tolerance, f"{where}{k}."))
+        return diffs
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        diffs = []
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            diffs.extend(compare_results(e, a, tolerance, f"{where}{i}."))
+        return diffs
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) and not isinstance(expected, bool):
+        if abs(expected - actual) <= tolerance:
+            return []
+    elif expected == actual:
+        return []
+    return [f"{where.rstrip('.')}: expected {expected!r}, got {actual!r}"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded EDDY-ng captures offline")
+    parser.add_argument("--config", help="printer.cfg to take the probe_eddy_ng section and saved calibration from")
+    parser.add_argument("--section", help="config section of the probe (default: the first probe_eddy_ng section)")
+    parser.add_argument("--set", action="append", default=[], metavar="[SECTION:]KEY=VALUE", help="override a config option")
+    parser.add_argument("--calibration", help=f"calibration capture (default {DEFAULT_CALIBRATION_PATH})")
+    parser.add_argument("--tap", action="append", help=f"tap capture, may be repeated (default {DEFAULT_TAP_PATHS})")
+    parser.add_argument("--static", help=f"static probe capture (default {DEFAULT_STATIC_PATH})")
+    parser.add_argument("--mesh", help=f"bed mesh capture (default {DEFAULT_MESH_PATH})")
+    parser.add_argument("--drive-current", type=int, help="drive current to replay with (default: from the config)")
+    parser.add_argument("--density", type=int, default=1, help="bed mesh scan density")
+    parser.add_argument("--repeat", type=int, default=1, help="run everything this many times, reporting the fastest run")
+    parser.add_argument("--json", help="write the results and timings here")
+    parser.add_argument("--expect", help="compare the results against this --json output")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="allowed difference for --expect")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show log and probe messages")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+
+    captures = find_captures(args)
+    if not captures:
+        parser.error("no captures given, and none found in /tmp")
+
+    peng = load_probe_eddy_ng()
+    fileconfig, autosave, section = build_config(args, captures)
+
+    runs = [run_replays(peng, args, captures, fileconfig, autosave, section) for _ in range(max(1, args.repeat))]
+    replays = runs[0]
+
+    failed = False
+    # every run has to produce the same results
+    for run in runs[1:]:
+        for first, again in zip(replays, run):
+            diffs = compare_results(first["results"], again["results"], 0.0, f"{first['name']}: ")
+            if diffs:
+                failed = True
+                print("nondeterministic replay: " + "; ".join(diffs))
+    for i, r in enumerate(replays):
+        fastest = min((run[i] for run in runs), key=lambda x: x["bench"].get("process_ms_avg", 0.0) + x["bench"].get("analysis_ms", 0.0))
+        r["bench"] = fastest["bench"]
+        print(format_replay(r))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"section": section, "replays": replays}, f, indent=2)
+
+    if args.expect:
+        with open(args.expect) as f:
+            expected = {r["name"]: r["results"] for r in json.load(f)["replays"]}
+        for r in replays:
+            if r["name"] not in expected:
+                continue
+            diffs = compare_results(expected[r["name"]], r["results"], args.tolerance, f"{r['name']}: ")
+            for d in diffs:
+                print(f"MISMATCH {d}")
+            failed = failed or bool(diffs)
+        if not failed:
+            print(f"results match {args.expect}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
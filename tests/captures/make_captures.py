@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Writes the synthetic captures that the replay tests run
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# The sensor is modelled as f(z) = 3MHz + 2MHz / (z + 1.5) with a little
+# gaussian noise, sampled at 250 sps. The captures are in the formats that
+# probe_eddy_ng writes (see replay.py). Running this again rewrites them
+# exactly. If they (or the results) change on purpose, rerun the replays in
+# test_replay.py with --json and copy each replay's name and results into
+# expected.json and expected-dense.json.
+
+import os
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RATE = 250.0
+NOISE_HZ = 30.0
+
+
+def f_of_z(z):
+    return 3.0e6 + 2.0e6 / (np.asarray(z) + 1.5)
+
+
+def write_csv(name, header, rows):
+    with open(os.path.join(HERE, name), "w") as f:
+        f.write(header + "\n")
+        for row in rows:
+            f.write(",".join(row) + "\n")
+
+
+def fmt(v, digits):
+    return "" if v is None or np.isnan(v) else f"{v:.{digits}f}"
+
+
+def main():
+    rng = np.random.default_rng(1612)
+
+    # calibration: a 4s descent from 5.1mm to 0.05mm. The rows are
+    # time,frequency,z,,v like probe_eddy_ng writes them.
+    t = 100.0 + np.arange(0.0, 4.0, 1.0 / RATE)
+    z = np.interp(t - 100.0, [0.0, 4.0], [5.1, 0.05])
+    v = -5.05 / 4.0
+    freq = f_of_z(z) + rng.normal(0.0, NOISE_HZ, len(t))
+    write_csv(
+        "calibration.csv",
+        "time,frequency,avg_freq,z,avg_z,v",
+        ([fmt(a, 4), fmt(b, 2), fmt(c, 5), "", fmt(v, 5)] for a, b, c in zip(t, freq, z)),
+    )
+
+    # taps: descend from 1mm at 1mm/s into a bed at bed_z, 0.1mm past it. The
+    # firmware saw the tap start as the nozzle reached the bed and triggered
+    # 0.1s later.
+    for i, bed_z in enumerate([0.0, 0.002, -0.001]):
+        t0 = 300.0 + 10.0 * i
+        t = t0 + np.arange(0.0, 1.5, 1.0 / RATE)
+        kin_z = np.maximum(1.0 - (t - t0), bed_z - 0.1)
+        z = np.maximum(kin_z - bed_z, 0.0)
+        freq = f_of_z(z) + rng.normal(0.0, NOISE_HZ, len(t))
+        tap_start = t0 + (1.0 - bed_z)
+        trigger = tap_start + 0.1
+        write_csv(
+            f"tap-samples-{i}.csv",
+            "time,frequency,z,kin_z,kin_v,raw_f,trigger_time,tap_start_time",
+            ([fmt(a, 4), fmt(b, 2), fmt(c, 5), fmt(d, 5), "0", "", fmt(trigger, 4), fmt(tap_start, 4)] for a, b, c, d in zip(t, freq, z, kin_z)),
+        )
+
+    # static: 0.5s at 2mm
+    t = 200.0 + np.arange(0.0, 0.5, 1.0 / RATE)
+    freq = f_of_z(np.full(len(t), 2.0)) + rng.normal(0.0, NOISE_HZ, len(t))
+    write_csv(
+        "static.csv",
+        "time,frequency,z,kin_z,kin_v,raw_f,trigger_time,tap_start_time",
+        ([fmt(a, 4), fmt(b, 2), "2.00000", "2.00000", "0", "", "", ""] for a, b in zip(t, freq)),
+    )
+
+    # mesh: the sensor heights over a tilted, slightly bowed 5x4 bed, scanned
+    # at 2mm
+    rows = []
+    for y in np.linspace(10.0, 100.0, 4):
+        for x in np.linspace(10.0, 120.0, 5):
+            h = 2.0 + 0.001 * x - 0.0005 * y + 0.02 * np.sin(x / 40.0) * np.cos(y / 50.0)
+            rows.append(["0", fmt(x, 3), fmt(y, 3), fmt(h, 6)])
+    write_csv("mesh.csv", "time,x,y,z", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Shared fixtures for the probe_eddy_ng tests
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+import os
+import sys
+import types
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import replay  # noqa: E402
+
+
+# probe_eddy_ng, loaded with replay's klippy stand-ins
+@pytest.fixture(scope="session")
+def peng():
+    return replay.load_probe_eddy_ng()
+
+CAPTURES = os.path.join(HERE, "captures")
+
+
+def capture_path(name: str) -> str:
+    return os.path.join(CAPTURES, name)
+
+
+# A replay harness for the synthetic captures, calibrated from the
+# calibration capture. settings are [SECTION:]KEY=VALUE overrides, like
+# replay.py's --set.
+@pytest.fixture
+def make_harness(peng):
+    def make(settings=(), mesh: bool = False, density: int = 1):
+        captures = [("calibration", capture_path("calibration.csv"))]
+        if mesh:
+            captures.append(("mesh", capture_path("mesh.csv")))
+        args = types.SimpleNamespace(config=capture_path("printer.cfg"), section=None, set=list(settings), density=density)
+        fileconfig, autosave, section = replay.build_config(args, captures)
+        harness = replay.ReplayHarness(peng, fileconfig, autosave, section)
+        dc = harness.eddy._reg_drive_current
+        result = harness.run("calibration", captures[0][1], dc, harness.replay_calibration)
+        assert result["results"]["calibrated"], result
+        return harness, dc
+
+    return make
@@ -0,0 +1,90 @@
+# np_interval_stats against per-interval numpy reductions
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+import warnings
+
+import numpy as np
+import pytest
+
+
+def reference_stats(times, values, starts, ends):
+    count, median, mean, vmin, vmax = [], [], [], [], []
+    for start, end in zip(starts, ends):
+        v = values[(times >= start) & (times < end)]
+        count.append(len(v))
+        if len(v) == 0:
+            median.append(np.nan)
+            mean.append(np.nan)
+            vmin.append(np.nan)
+            vmax.append(np.nan)
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median.append(np.median(v))
+            mean.append(np.mean(v))
+            vmin.append(np.min(v))
+            vmax.append(np.max(v))
+    return [np.array(a, dtype=np.float64) for a in (count, median, mean, vmin, vmax)]
+
+
+def check_against_reference(peng, times, values, starts, ends):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        stats = peng.np_interval_stats(times, values, starts, ends)
+    count, median, mean, vmin, vmax = reference_stats(times, values, starts, ends)
+    np.testing.assert_array_equal(stats.count, count)
+    for name, got, want in (("median", stats.median, median), ("mean", stats.mean, mean), ("min", stats.min, vmin), ("max", stats.max, vmax)):
+        np.testing.assert_allclose(got, want, rtol=1e-12, atol=0.0, equal_nan=True, err_msg=name)
+
+
+def random_intervals(rng, times, n):
+    starts = rng.uniform(times[0] - 0.05, times[-1], n)
+    ends = starts + rng.uniform(0.0, 0.2, n)
+    return starts, ends
+
+
+def test_matches_reference(peng):
+    rng = np.random.default_rng(7)
+    times = np.sort(rng.uniform(0.0, 2.0, 500))
+    values = rng.normal(2.0, 0.5, len(times))
+    starts, ends = random_intervals(rng, times, 200)
+    check_against_reference(peng, times, values, starts, ends)
+
+
+def test_ties_and_empty_intervals(peng):
+    times = np.arange(20) * 0.01
+    values = np.repeat([1.0, 2.0, 2.0, 3.0], 5)
+    starts = np.array([0.0, 0.045, 0.5, 0.1, 0.0])
+    ends = np.array([0.2, 0.155, 0.6, 0.1, 0.0])
+    check_against_reference(peng, times, values, starts, ends)
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, -np.inf])
+def test_non_finite_values(peng, bad):
+    rng = np.random.default_rng(11)
+    times = np.sort(rng.uniform(0.0, 2.0, 400))
+    values = rng.normal(2.0, 0.5, len(times))
+    values[[17, 200, 201]] = bad
+    starts, ends = random_intervals(rng, times, 150)
+    check_against_reference(peng, times, values, starts, ends)
+
+    # a single bad sample only touches the intervals that hold it
+    values = rng.normal(2.0, 0.5, len(times))
+    values[100] = bad
+    starts = times[::10]
+    ends = starts + 0.04
+    check_against_reference(peng, times, values, starts, ends)
+    stats = peng.np_interval_stats(times, values, starts, ends)
+    holds_bad = (starts <= times[100]) & (times[100] < ends)
+    assert np.all(np.isfinite(stats.median[~holds_bad]))
+
+
+def test_mixed_nan_and_inf(peng):
+    times = np.arange(12) * 0.1
+    values = np.array([1.0, np.inf, 2.0, -np.inf, 5.0, np.nan, 3.0, 4.0, np.inf, np.inf, -1.0, 0.0])
+    starts = np.array([0.0, 0.0, 0.25, 0.55, 0.75, 0.0])
+    ends = np.array([0.25, 0.45, 0.55, 0.85, 1.2, 1.2])
+    check_against_reference(peng, times, values, starts, ends)
@@ -0,0 +1,55 @@
+# The frequency to height lookup tables against evaluating the fits directly
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+import numpy as np
+import pytest
+
+
+# The fit, one sample at a time, the way freq_to_height used to work
+def scalar_heights(fmap, freqs):
+    return np.array([float(fmap._invfreqs_to_heights(np.array([1.0 / f]))[0]) for f in freqs])
+
+
+@pytest.mark.parametrize("model", ["poly", "pchip"])
+def test_lookup_table_matches_fit(make_harness, model):
+    harness, dc = make_harness([f"calibration_model={model}"])
+    fmap = harness.eddy.map_for_drive_current(dc)
+    fmap.ensure_parsed()
+    lut = fmap._ftoh_lut
+    assert lut is not None
+    assert lut.max_error <= fmap.lut_height_max_error
+
+    # over the calibrated range and a bit past either end, where the fit is
+    # used as is
+    fmin, fmax = fmap.freq_range
+    freqs = np.linspace(fmin - 0.02 * (fmax - fmin), fmax + 0.02 * (fmax - fmin), 2001)
+    expected = scalar_heights(fmap, freqs)
+    heights = fmap.freqs_to_heights_np(freqs)
+    inside = (freqs >= fmin) & (freqs <= fmax)
+    np.testing.assert_allclose(heights[inside], expected[inside], rtol=0.0, atol=lut.max_error * 1.01 + 1e-9)
+    np.testing.assert_allclose(heights[~inside], expected[~inside], rtol=1e-12, atol=1e-12)
+
+    # the raw freqvals path the sampler uses
+    conv = harness.sensor.freqval_conversion_value()
+    freqvals = np.rint(freqs / conv).astype(np.uint32)
+    expected = scalar_heights(fmap, freqvals * conv)
+    np.testing.assert_allclose(fmap.freqvals_to_heights_np(freqvals), expected, rtol=0.0, atol=lut.max_error * 1.01 + 1e-9)
+
+    assert fmap.freq_to_height(float(freqs[1000])) == pytest.approx(expected[1000], abs=lut.max_error * 1.01 + 1e-9)
+
+
+def test_lookup_table_range(peng):
+    lut = peng.ProbeEddyLookupTable.build(lambda x: x * x, 1.0, 3.0, 1e-3)
+    nsegs = len(lut.slopes)
+    # (exactly at the end, rounding may go either way; out of range only means
+    # the caller evaluates the function itself)
+    xs = np.array([1.0 - 1e-9, 1.0, 2.0, 3.0 - 1e-9, 3.0 + 0.5 * lut.step, 3.0 + 2.0 * lut.step])
+    values, in_range = lut.lookup(xs)
+    np.testing.assert_array_equal(in_range, [False, True, True, True, False, False])
+    np.testing.assert_allclose(values[1:4], xs[1:4] ** 2, atol=lut.max_error * 1.01)
+    # past the end, the last segment is extended
+    assert values[5] == pytest.approx(lut.values[-1] + 2.0 * lut.slopes[-1])
+    assert nsegs == len(lut.values) - 1
@@ -0,0 +1,109 @@
+# Bed mesh scans of the synthetic mesh capture against per-point and
+# per-sample baselines
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from conftest import capture_path
+
+
+def run_mesh(harness, dc, density):
+    result = harness.run("mesh", capture_path("mesh.csv"), dc, lambda p, d, s: harness.replay_mesh(p, d, density, s))
+    assert "error" not in result["results"], result
+    return result["results"]
+
+
+# find_heights_at_times as it was: a walk over the samples, one interval at a time
+def scalar_heights_at_times(times, heights, intervals):
+    out = []
+    i = 0
+    for iv_start, iv_end in intervals:
+        while i < len(times) and times[i] < iv_start:
+            i += 1
+        istart = i
+        while i < len(times) and times[i] < iv_end:
+            i += 1
+        out.append(float(np.median(heights[istart:i])))
+    return out
+
+
+def test_mesh_points_match_scalar_baseline(peng, make_harness, monkeypatch):
+    harness, dc = make_harness(mesh=True)
+    calls = []
+    find_heights_at_times = peng.ProbeEddySampler.find_heights_at_times
+
+    def record(sampler, intervals):
+        result = find_heights_at_times(sampler, intervals)
+        calls.append((sampler.times.copy(), sampler.heights.copy(), list(intervals), result))
+        return result
+
+    monkeypatch.setattr(peng.ProbeEddySampler, "find_heights_at_times", record)
+    results = run_mesh(harness, dc, 1)
+    assert results["max_diff"] < 0.005
+
+    assert len(calls) == 1
+    times, heights, intervals, result = calls[0]
+    assert len(intervals) == 20
+    np.testing.assert_allclose(result, scalar_heights_at_times(times, heights, intervals), rtol=0.0, atol=1e-12)
+
+
+# _dense_heights one sample at a time, with the scalar trapq lookup
+def scalar_dense_heights(helper, sampler, path_times, density):
+    eddy = helper._eddy
+    x_count = (helper._x_points - 1) * density + 1
+    y_count = helper._y_points
+    dx = (helper._x_max - helper._x_min) / (x_count - 1)
+    dy = (helper._y_max - helper._y_min) / (y_count - 1)
+    lo = path_times[0] - dx / helper._speed
+    hi = path_times[-1] + dx / helper._speed
+
+    cells = defaultdict(list)
+    for t, h in zip(sampler.times, sampler.heights):
+        if not lo <= t <= hi:
+            continue
+        pos, _ = eddy._get_trapq_position(float(t))
+        if pos is None:
+            continue
+        x = pos[0] + helper._x_offset
+        y = pos[1] + helper._y_offset
+        col = round((x - helper._x_min) / dx)
+        row = round((y - helper._y_min) / dy)
+        if 0 <= col < x_count and 0 <= row < y_count and abs(y - (helper._y_min + row * dy)) <= helper.DENSE_ROW_TOLERANCE:
+            cells[(row, col)].append(h + eddy._tap_offset)
+
+    grid = np.full((y_count, x_count), np.nan)
+    counts = np.zeros((y_count, x_count), dtype=np.intp)
+    for (row, col), hs in cells.items():
+        grid[row, col] = np.median(hs)
+        counts[row, col] = len(hs)
+    return grid, counts
+
+
+@pytest.mark.parametrize("density", [2, 3])
+def test_dense_mesh_matches_scalar_baseline(make_harness, monkeypatch, density):
+    harness, dc = make_harness(mesh=True, density=density)
+    helper = harness.eddy._bed_mesh_helper
+    calls = []
+    dense_heights = helper._dense_heights
+
+    def record(sampler, path_times, density):
+        grid, counts = dense_heights(sampler, path_times, density)
+        calls.append((scalar_dense_heights(helper, sampler, path_times, density), grid, counts))
+        return grid, counts
+
+    monkeypatch.setattr(helper, "_dense_heights", record)
+    results = run_mesh(harness, dc, density)
+    assert results["max_diff"] < 0.02
+
+    assert len(calls) == 1
+    (expected_grid, expected_counts), grid, counts = calls[0]
+    np.testing.assert_array_equal(counts, expected_counts)
+    have = expected_counts > 0
+    assert have.any()
+    np.testing.assert_allclose(grid[have], expected_grid[have], rtol=0.0, atol=1e-12)
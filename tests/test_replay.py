@@ -0,0 +1,37 @@
+# Replays of the synthetic captures in captures/ against their expected results
+#
+# Copyright (C) 2025  Vladimir Vukicevic <vladimir@pobox.com>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+import replay
+
+from conftest import capture_path
+
+
+def replay_args(*args):
+    return ["--config", capture_path("printer.cfg"), "--calibration", capture_path("calibration.csv"), *args]
+
+
+def test_replay_matches_expected(capsys):
+    taps = [arg for i in range(3) for arg in ("--tap", capture_path(f"tap-samples-{i}.csv"))]
+    args = replay_args(*taps, "--static", capture_path("static.csv"), "--mesh", capture_path("mesh.csv"))
+    rc = replay.main(args + ["--expect", capture_path("expected.json")])
+    out = capsys.readouterr().out
+    assert rc == 0, out
+    assert "results match" in out
+
+
+def test_dense_mesh_replay_matches_expected(capsys):
+    args = replay_args("--mesh", capture_path("mesh.csv"), "--density", "2")
+    rc = replay.main(args + ["--expect", capture_path("expected-dense.json")])
+    out = capsys.readouterr().out
+    assert rc == 0, out
+    assert "results match" in out
+
+
+def test_replay_is_deterministic(capsys):
+    rc = replay.main(replay_args("--static", capture_path("static.csv"), "--repeat", "2"))
+    out = capsys.readouterr().out
+    assert rc == 0, out
+    assert "nondeterministic" not in out